@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Reports the annotation parse time of every file in the golden corpus
+(or of the given files), and compares it to parsing every annotation
+with a separate call to `parse_code`, as `HorusTransformer` used to do.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from starkware.cairo.lang.compiler.ast.module import CairoFile
+
+from horus.compiler import profiling
+from horus.compiler.code_elements import CodeElementAnnotation
+from horus.compiler.parser import parse_code
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "../../tests/golden")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(GOLDEN_DIR, "*.cairo")))
+    total_batched = 0.0
+    total_nested = 0.0
+    for path in files:
+        with open(path) as f:
+            code = f.read()
+
+        profiler = profiling.Profiler()
+        # Recorded as nested in a stage, so the memory isn't traced.
+        profiler.depth = 1
+        profiling.active_profiler = profiler
+        start = time.perf_counter()
+        parse_code(path, code, "cairo_file", CairoFile)
+        file_time = time.perf_counter() - start
+        profiling.active_profiler = None
+
+        if not profiler.events:
+            continue
+        [event] = profiler.events
+        n_annotations = profiler.counters["parsed annotations"]
+
+        annotations = [
+            line.strip()[2:].strip()
+            for line in code.splitlines()
+            if line.strip().startswith("//") and line.strip()[2:].strip()[:1] == "@"
+        ]
+        start = time.perf_counter()
+        for annotation in annotations:
+            parse_code(path, annotation, "annotation", CodeElementAnnotation)
+        nested_time = time.perf_counter() - start
+
+        total_batched += event.duration
+        total_nested += nested_time
+        print(
+            f"{os.path.basename(path)}: {n_annotations} annotations, "
+            f"{event.duration * 1000:.1f}ms of {file_time * 1000:.1f}ms "
+            f"(one parse per annotation: {nested_time * 1000:.1f}ms)"
+        )
+
+    print(
+        f"total: {total_batched * 1000:.1f}ms "
+        f"(one parse per annotation: {total_nested * 1000:.1f}ms)"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compares loading the specifications of an annotation-heavy contract with
+`decode_horus_definition`, which parses every expression with a call to
+z3's parser, and with `load_horus_definition`, which parses all of them
+in a single script, eagerly and lazily (accessing a single function).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from json_output import compile_contract
+from term_backend import generate_arithmetic_contract
+
+from horus.compiler.contract_definition import (
+    decode_horus_definition,
+    encode_horus_definition,
+    load_horus_definition,
+)
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--functions", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "contract.cairo")
+        with open(path, "w") as f:
+            f.write(generate_arithmetic_contract(args.functions, 10))
+        _, specs = compile_contract(path)
+
+    for sexpr_format in ["pretty", "compact"]:
+        data = encode_horus_definition(specs, sexpr_format)
+        name = next(iter(specs.specifications))
+
+        def load_lazily():
+            load_horus_definition(data, lazy=True).specifications[name]
+
+        decode_time = measure(lambda: decode_horus_definition(data), args.repeat)
+        load_time = measure(lambda: load_horus_definition(data), args.repeat)
+        lazy_time = measure(load_lazily, args.repeat)
+        print(
+            f"{sexpr_format}: decode {decode_time:.3f}s, "
+            f"bulk load {load_time:.3f}s ({decode_time / load_time:.2f}x), "
+            f"lazy load of one function {lazy_time:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Compiles a contract whose postconditions reference the members of nested
+return values and the implicit arguments many times, with the names
+lowered to the memory cells of the frame layout of each function (see
+`horus.compiler.frame_layout`) and, as the compiler used to, to member
+accesses of the cast return tuple rebuilt for every occurrence. Checks
+that the specifications are identical and reports the compilation times.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from starkware.cairo.lang.compiler.ast.expr import ExprDot, ExprIdentifier
+
+from horus.compiler.frame_layout import FrameLayout, lower_member
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+
+
+def generate_contract(n_functions: int, n_annotations: int) -> str:
+    lines = [
+        "struct Uint256 {",
+        "    low: felt,",
+        "    high: felt,",
+        "}",
+        "",
+        "struct Pair {",
+        "    a: Uint256,",
+        "    b: Uint256,",
+        "}",
+        "",
+    ]
+    for i in range(n_functions):
+        for j in range(n_annotations):
+            lines.append(
+                f"// @post $Return.pair.a.low + $Return.pair.b.high == x + {j} "
+                f"and $Return.count == range_check_ptr - {j}"
+            )
+            lines.append(f"// @post $Return.pair.a == $Return.pair.b or x == {j}")
+        lines += [
+            f"func f{i}{{range_check_ptr}}(x: felt) -> (pair: Pair, count: felt) {{",
+            "    let value = Uint256(low=x, high=0);",
+            "    return (pair=Pair(a=value, b=value), count=range_check_ptr);",
+            "}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def compile_specs(path: str) -> str:
+    args = get_arg_parser().parse_args([path, "--output", os.devnull])
+    args.build_cache = False
+    args.spec_output = io.StringIO()
+    horus_compile(args)
+    return args.spec_output.getvalue()
+
+
+def measure(path: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compile_specs(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def get_cell_without_layout(self, key, name, offset, cairo_type, preprocessor):
+    # The cast return tuple (or implicit arguments) and a member access for
+    # every component of the name.
+    result = lower_member([], offset, cairo_type, preprocessor)
+    for member_name in name.split("."):
+        result = ExprDot(result, ExprIdentifier(member_name))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--functions", type=int, default=50)
+    parser.add_argument("--annotations", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "contract.cairo")
+        with open(path, "w") as f:
+            f.write(generate_contract(args.functions, args.annotations))
+
+        with_layout = measure(path, args.repeat)
+        specs = compile_specs(path)
+
+        with mock.patch.object(FrameLayout, "get_cell", get_cell_without_layout):
+            without_layout = measure(path, args.repeat)
+            assert compile_specs(path) == specs
+
+    print(
+        f"{args.functions} functions x {2 * args.annotations} postconditions: "
+        f"member accesses {without_layout:.2f}s, "
+        f"frame layout {with_layout:.2f}s "
+        f"({without_layout / with_layout:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark of declaration collection on large conjunctive specifications
+whose clauses share subterms (as memory(fp - k) and storage variable
+terms do in practice), compared to the previous recursive traversal,
+which visits a shared subterm once per path leading to it.
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+import z3
+
+from horus.utils import DeclCollector
+
+
+def get_decls_recursive(
+    f: z3.ExprRef, rs: Optional[Dict[str, int]] = None
+) -> Dict[str, int]:
+    """The previous implementation of `horus.utils.get_decls`."""
+    if rs is None:
+        rs = {}
+    if z3.is_const(f):
+        if not z3.z3util.is_expr_val(f):
+            rs.setdefault(str(f), 0)
+        return rs
+    if f.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+        rs.setdefault(str(f.decl()), f.decl().arity())
+    for f_ in f.children():
+        get_decls_recursive(f_, rs)
+    return rs
+
+
+def make_specification(n_clauses: int) -> z3.BoolRef:
+    """
+    Returns a conjunction of `n_clauses` clauses over a running sum of
+    memory cells, so that the i-th clause contains the (shared) sum of
+    the first i cells.
+    """
+    fp = z3.Int("fp")
+    memory = z3.Function("memory", z3.IntSort(), z3.IntSort())
+    balance = z3.Function("balance", z3.IntSort(), z3.IntSort())
+    clauses: List[z3.BoolRef] = []
+    total = z3.IntVal(0)
+    for i in range(n_clauses):
+        total = total + memory(fp - i)
+        clauses.append(balance(memory(fp - i)) <= total)
+    return z3.And(clauses)
+
+
+def count_dag_nodes(f: z3.ExprRef) -> int:
+    visited = set()
+    stack = [f]
+    while stack:
+        g = stack.pop()
+        if g.get_id() not in visited:
+            visited.add(g.get_id())
+            stack.extend(g.children())
+    return len(visited)
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[50, 100, 200, 400, 1600]
+    )
+    parser.add_argument(
+        "--max_recursive_size",
+        type=int,
+        default=200,
+        help="Do not run the recursive traversal on larger specifications.",
+    )
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        specification = make_specification(size)
+        n_nodes = count_dag_nodes(specification)
+        collector_time = measure(
+            lambda: DeclCollector().get_decls(specification), args.repeat
+        )
+        line = (
+            f"{size} clauses, {n_nodes} DAG nodes: "
+            f"{collector_time * 1000:.1f}ms "
+            f"({collector_time / n_nodes * 1e6:.2f}us per node)"
+        )
+        if size <= args.max_recursive_size:
+            assert get_decls_recursive(specification) == DeclCollector().get_decls(
+                specification
+            )
+            recursive_time = measure(
+                lambda: get_decls_recursive(specification), args.repeat
+            )
+            line += f", recursive {recursive_time * 1000:.1f}ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
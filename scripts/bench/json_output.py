@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Compares compiling a large contract (with debug information) through the
+command line entry point (`horus.compiler.horus_compile.main`), writing
+the program and the specifications by dumping them with their schemas and
+`json.dump(..., indent=4, sort_keys=True)`, as the compiler used to, with
+the streaming writer of `horus.compiler.json_output`, in both layouts.
+
+Every writer is measured with --no_build_cache, with a build cache that
+misses (the outputs are recorded while they are written) and with one
+that hits (the outputs are copied from the cache). Reports the wall time
+of the compilation, the peak of the memory allocated by it (traced in a
+separate run) and the increase of the peak RSS, which stays at 0 when the
+compilation fits in memory freed by the previous runs.
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, List, Optional, Tuple
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from term_backend import generate_arithmetic_contract
+
+from horus.compiler.horus_compile import get_arg_parser, horus_compile_common
+from horus.compiler.horus_compile import main as horus_compile_main
+from horus.compiler.horus_compile import pass_manager_factory
+
+
+def compile_contract(path: str) -> Tuple[Any, Any]:
+    """
+    Returns the assembled program and the specifications of the contract
+    at `path`, for the benchmarks of their serialization.
+    """
+    from horus.compiler.compile import assemble_horus_contract
+
+    assembled = []
+
+    def assemble_func(*args, **kwargs):
+        result = assemble_horus_contract(
+            *args, **kwargs, filter_identifiers=False, is_account_contract=False
+        )
+        assembled.append(result)
+        return result
+
+    args = get_arg_parser().parse_args([path, "--debug_info_with_source"])
+    args.output = io.StringIO()
+    args.spec_output = io.StringIO()
+    horus_compile_common(args, pass_manager_factory, assemble_func)
+    return assembled[0]
+
+
+def read_peak_rss() -> Optional[int]:
+    """Returns the peak RSS of the process in kB (Linux only)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(
+    compile_contract: Callable[[], None], prepare: Callable[[], None]
+) -> Tuple[float, str]:
+    """
+    Measures `compile_contract`, after calling `prepare` before each run.
+    """
+    prepare()
+    tracemalloc.start()
+    compile_contract()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    prepare()
+    can_reset = reset_peak_rss()
+    before = read_peak_rss()
+    start = time.perf_counter()
+    compile_contract()
+    elapsed = time.perf_counter() - start
+    after = read_peak_rss()
+    if can_reset and before is not None and after is not None:
+        rss = f"peak RSS +{max(after - before, 0) / 1024:.1f}MB"
+    else:
+        rss = "peak RSS not available"
+    return elapsed, f"peak allocated {peak / 2**20:.1f}MB, {rss}"
+
+
+def write_with_schemas(value, out, compact: bool = False):
+    json.dump(value, out, indent=4, sort_keys=True)
+
+
+def with_schemas(compile_contract: Callable[[], None]) -> Callable[[], None]:
+    """
+    Makes `compile_contract` write the outputs as the compiler used to.
+    """
+
+    def compile_with_schemas():
+        with mock.patch(
+            "horus.compiler.json_output.program_output_json",
+            lambda program: program.Schema().dump(program),
+        ), mock.patch(
+            "horus.compiler.json_output.horus_definition_json",
+            lambda specs, sexpr_format="pretty": specs.Schema().dump(specs),
+        ), mock.patch(
+            "horus.compiler.json_output.write_json", write_with_schemas
+        ):
+            compile_contract()
+
+    return compile_with_schemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--functions", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "contract.cairo")
+        with open(path, "w") as f:
+            f.write(generate_arithmetic_contract(args.functions, 10))
+        output_path = os.path.join(tmp_dir, "output.json")
+        spec_output_path = os.path.join(tmp_dir, "spec_output.json")
+        cache_dir = os.path.join(tmp_dir, "cache")
+
+        def compiler(*flags: str) -> Callable[[], None]:
+            argv: List[str] = [path, "--debug_info_with_source"]
+            argv += ["--output", output_path, "--spec_output", spec_output_path]
+            argv += ["--cache_dir", cache_dir, *flags]
+
+            def run_main():
+                horus_compile_main(argv)
+
+            return run_main
+
+        def clear_build_cache():
+            shutil.rmtree(os.path.join(cache_dir, "build"), ignore_errors=True)
+
+        def read_outputs() -> str:
+            with open(output_path) as f, open(spec_output_path) as specs_f:
+                return f.read() + specs_f.read()
+
+        writers = {
+            "schemas + json.dump": lambda *flags: with_schemas(compiler(*flags)),
+            "streaming": compiler,
+            "streaming, --compact_json": lambda *flags: compiler(
+                "--compact_json", *flags
+            ),
+        }
+        # Load the compiler and fill the parser caches before measuring.
+        compiler("--no_build_cache")()
+        expected = None
+        for name, make_compiler in writers.items():
+            no_build_cache = make_compiler("--no_build_cache")
+            build_cache = make_compiler()
+            modes = {
+                "--no_build_cache": (no_build_cache, lambda: None),
+                "build cache miss": (build_cache, clear_build_cache),
+                "build cache hit": (build_cache, build_cache),
+            }
+            for mode, (compile_contract, prepare) in modes.items():
+                elapsed, memory = measure(compile_contract, prepare)
+                outputs = read_outputs()
+                if name != "streaming, --compact_json":
+                    if expected is None:
+                        expected = outputs
+                    assert outputs == expected
+                print(
+                    f"{name}, {mode}: {elapsed:.2f}s, {memory}, "
+                    f"{len(outputs)} bytes"
+                )
+            clear_build_cache()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Parser microbenchmark: tokens per second of the Horus grammar parser over
+the golden corpus (and a generated file with deep parser stacks), with and
+without copying the parser state stacks before every token, as
+`horus.compiler.parser.parse` used to do.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from starkware.cairo.lang.compiler.error_handling import InputFile
+
+from horus.compiler.parser import get_gram_parser, parse_tree
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "../../tests/golden")
+
+
+def parse_tree_with_snapshots(code: str, code_type: str):
+    """
+    The previous implementation: the state stacks are copied before every
+    token so they can be restored on error.
+    """
+    parser = get_gram_parser().parse_interactive(code, start=code_type)
+    parser_state = parser.parser_state
+    old_state_stack = list(parser_state.state_stack)
+    old_value_stack = list(parser_state.value_stack)
+    token = None
+    for token in parser.lexer_state.lex(parser_state):
+        old_state_stack = list(parser_state.state_stack)
+        old_value_stack = list(parser_state.value_stack)
+        parser.feed_token(token)
+    old_state_stack = list(parser_state.state_stack)
+    old_value_stack = list(parser_state.value_stack)
+    return parser.feed_eof(last_token=token)
+
+
+def generate_deep_file(depth: int) -> str:
+    expr = " + ".join(f"(x * {i}" for i in range(depth)) + ")" * depth
+    return f"func f(x) -> (res: felt) {{\n    return (res={expr});\n}}\n"
+
+
+def count_tokens(code: str) -> int:
+    return sum(1 for _ in get_gram_parser().lex(code))
+
+
+def measure(parse: Callable[[str], object], codes: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for code in codes:
+            parse(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=300)
+    args = parser.parse_args()
+
+    golden = []
+    for path in sorted(glob.glob(os.path.join(GOLDEN_DIR, "*.cairo"))):
+        with open(path) as f:
+            golden.append(f.read())
+
+    corpora: List[Tuple[str, List[str]]] = [
+        ("golden corpus", golden),
+        (f"generated, depth {args.depth}", [generate_deep_file(args.depth)]),
+    ]
+    for name, codes in corpora:
+        tokens = sum(count_tokens(code) for code in codes)
+        before = measure(
+            lambda code: parse_tree_with_snapshots(code, "cairo_file"),
+            codes,
+            args.repeat,
+        )
+        after = measure(
+            lambda code: parse_tree(code, "cairo_file", InputFile(None, code), False),
+            codes,
+            args.repeat,
+        )
+        print(
+            f"{name}: {tokens} tokens, "
+            f"before {tokens / before:,.0f} tokens/s, "
+            f"after {tokens / after:,.0f} tokens/s "
+            f"({before / after:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
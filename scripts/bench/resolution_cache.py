@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Compiles contracts whose annotations reference the same arguments and
+constants many times, with and without the cache of the resolution of
+identifiers (see `horus.compiler.type_checker.ResolutionCache`), checks
+that the specifications are identical and reports the compilation times.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from storage_vars import generate_contract as generate_storage_var_contract
+
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+from horus.compiler.type_checker import ResolutionCache, resolve_identifier
+
+
+def generate_contract(n_functions: int, n_annotations: int) -> str:
+    """
+    Returns a contract of `n_functions` functions, each of them with
+    `n_annotations` preconditions and postconditions over its arguments
+    and module constants.
+    """
+    lines = ["const LIMIT = 1000;", "const STEP = 7;", ""]
+    for i in range(n_functions):
+        for j in range(n_annotations):
+            lines.append(f"// @pre x * STEP + y <= LIMIT + {j} or x - y == z")
+            lines.append(f"// @post $Return.res * STEP >= x + y + z - LIMIT - {j}")
+        lines += [
+            f"func f{i}(x: felt, y: felt, z: felt) -> (res: felt) {{",
+            "    return (res=x + y + z);",
+            "}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def compile_specs(path: str) -> str:
+    args = get_arg_parser().parse_args([path, "--output", os.devnull])
+    args.build_cache = False
+    args.spec_output = io.StringIO()
+    horus_compile(args)
+    return args.spec_output.getvalue()
+
+
+def measure(path: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compile_specs(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def resolve_without_cache(self, identifiers, accessible_scopes, name):
+    return resolve_identifier(identifiers, accessible_scopes, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    contracts = {
+        "arguments and constants (50 functions x 20 annotations)": generate_contract(
+            50, 20
+        ),
+        "storage variables (20 functions x 20 variables)": (
+            generate_storage_var_contract(20, 20)
+        ),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, code in contracts.items():
+            path = os.path.join(tmp_dir, "contract.cairo")
+            with open(path, "w") as f:
+                f.write(code)
+
+            with_cache = measure(path, args.repeat)
+            specs = compile_specs(path)
+
+            with mock.patch.object(ResolutionCache, "resolve", resolve_without_cache):
+                without_cache = measure(path, args.repeat)
+                assert compile_specs(path) == specs, name
+
+            print(
+                f"{name}: without cache {without_cache:.2f}s, "
+                f"with cache {with_cache:.2f}s "
+                f"({without_cache / with_cache:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
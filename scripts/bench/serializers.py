@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Compares dumping and loading the specifications of an annotation-heavy
+contract with the marshmallow schema of HorusDefinition and with the
+dedicated encoder and decoder of `horus.compiler.contract_definition`,
+and the same without the cost of printing and parsing the formulas
+(which both share), replaced by lookups.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Tuple
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+import z3
+from json_output import compile_contract
+from term_backend import generate_arithmetic_contract
+
+import horus.compiler.contract_definition
+from horus.compiler.contract_definition import (
+    decode_horus_definition,
+    encode_horus_definition,
+    format_sexpr,
+)
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--functions", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "contract.cairo")
+        with open(path, "w") as f:
+            f.write(generate_arithmetic_contract(args.functions, 10))
+        _, specs = compile_contract(path)
+
+    formatted: Dict[Tuple[int, str], list] = {}
+
+    def format_sexpr_once(value, sexpr_format: str = "pretty") -> list:
+        key = (id(value), sexpr_format)
+        if key not in formatted:
+            formatted[key] = format_sexpr(value, sexpr_format)
+        return formatted[key]
+
+    def parse_sexpr_stub(lines) -> z3.ExprRef:
+        return z3.BoolVal(True)
+
+    def measure_all(sexpr_format: str, name: str):
+        schema = specs.Schema(context=dict(sexpr_format=sexpr_format))
+        data = encode_horus_definition(specs, sexpr_format)
+        dump_time = measure(lambda: schema.dump(specs), args.repeat)
+        encode_time = measure(
+            lambda: encode_horus_definition(specs, sexpr_format), args.repeat
+        )
+        load_time = measure(lambda: schema.load(data), args.repeat)
+        decode_time = measure(lambda: decode_horus_definition(data), args.repeat)
+        print(
+            f"{sexpr_format}, {name}: "
+            f"schema dump {dump_time:.3f}s, encode {encode_time:.3f}s "
+            f"({dump_time / encode_time:.2f}x); schema load {load_time:.3f}s, "
+            f"decode {decode_time:.3f}s ({load_time / decode_time:.2f}x)"
+        )
+
+    for sexpr_format in ["pretty", "compact"]:
+        schema = specs.Schema(context=dict(sexpr_format=sexpr_format))
+        assert encode_horus_definition(specs, sexpr_format) == schema.dump(specs)
+        measure_all(sexpr_format, "with formulas")
+        with mock.patch.multiple(
+            horus.compiler.contract_definition,
+            format_sexpr=format_sexpr_once,
+            parse_sexpr=parse_sexpr_stub,
+        ):
+            measure_all(sexpr_format, "without formulas")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
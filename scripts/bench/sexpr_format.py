@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Compares the size of the specification output of the golden corpus (or of
+the given files), and the time z3 takes to parse its formulas, between the
+"pretty" and the "compact" formats of --sexpr_format.
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+import z3
+
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+from horus.compiler.var_names import HORUS_DECLS
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "../../tests/golden")
+
+
+def compile_specs(path: str, sexpr_format: str) -> str:
+    args = get_arg_parser().parse_args(
+        [path, "--cairo_path", GOLDEN_DIR, "--output", os.devnull]
+        + ["--sexpr_format", sexpr_format]
+    )
+    args.spec_output = io.StringIO()
+    horus_compile(args)
+    return args.spec_output.getvalue()
+
+
+def get_formulas(specs: Dict[str, Any]) -> Iterator[List[str]]:
+    for specification in specs["specifications"].values():
+        yield specification["pre"]["sexpr"]
+        yield specification["post"]["sexpr"]
+        for updates in specification["storage_update"].values():
+            for update in updates:
+                yield from update["arguments"]
+                yield update["value"]
+    for invariant in specs["invariants"].values():
+        yield invariant["sexpr"]
+
+
+def get_decls(specs: Dict[str, Any]) -> Dict[str, Any]:
+    decls = dict(HORUS_DECLS)
+    arities = dict(specs["storage_vars"])
+    for specification in specs["specifications"].values():
+        arities.update(specification["decls"])
+    for name, arity in arities.items():
+        if arity == 0:
+            decls[name] = z3.Int(name)
+        else:
+            decls[name] = z3.Function(name, *[z3.IntSort()] * (arity + 1))
+    return decls
+
+
+def parse_formulas(specs: Dict[str, Any]) -> float:
+    decls = get_decls(specs)
+    start = time.perf_counter()
+    for lines in get_formulas(specs):
+        # Storage updates are terms rather than formulas, so they are
+        # wrapped in an equality to be asserted.
+        term = "\n".join(lines)
+        z3.parse_smt2_string(f"(assert (= {term} {term}))", decls=decls)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(GOLDEN_DIR, "*.cairo")))
+    totals: Dict[str, Tuple[int, float]] = {}
+    for sexpr_format in ["pretty", "compact"]:
+        total_size = 0
+        total_parse_time = 0.0
+        for path in files:
+            try:
+                output = compile_specs(path, sexpr_format)
+            except Exception:
+                # Some of the golden files are expected to fail.
+                continue
+            specs = json.loads(output)
+            total_size += len(output)
+            total_parse_time += min(parse_formulas(specs) for _ in range(args.repeat))
+        totals[sexpr_format] = (total_size, total_parse_time)
+        print(
+            f"{sexpr_format}: {total_size} bytes, "
+            f"z3 parses the formulas in {total_parse_time * 1000:.1f}ms"
+        )
+
+    pretty_size, pretty_time = totals["pretty"]
+    compact_size, compact_time = totals["compact"]
+    print(
+        f"compact/pretty: {compact_size / pretty_size:.2f} of the size, "
+        f"{compact_time / pretty_time:.2f} of the parse time"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
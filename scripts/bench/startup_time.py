@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Measures the startup cost of horus-compile.
+
+Reports the wall time of `horus-compile --version` and of importing the
+compiler, and lists the modules with the highest cumulative import time
+(as reported by `python -X importtime`).
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "../../src")
+
+VERSION_SNIPPET = """
+from horus.compiler.horus_compile import main
+try:
+    main(["--version"])
+except SystemExit:
+    pass
+"""
+
+COMPILER_SNIPPET = "import horus.compiler.compile"
+
+
+def run_python(code: str, importtime: bool = False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    start = time.perf_counter()
+    result = subprocess.run(
+        cmd + ["-c", code],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return time.perf_counter() - start, result.stderr
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Returns a list of (module, self_us, cumulative_us).
+    """
+    result: List[Tuple[str, int, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        result.append((module.strip(), int(self_us), int(cumulative_us)))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    for name, snippet in [
+        ("horus-compile --version", VERSION_SNIPPET),
+        ("import horus.compiler.compile", COMPILER_SNIPPET),
+    ]:
+        times = [run_python(snippet)[0] for _ in range(args.repeat)]
+        print(f"{name}: best {min(times) * 1000:.1f} ms of {args.repeat}")
+
+    for name, snippet in [
+        ("horus-compile --version", VERSION_SNIPPET),
+        ("import horus.compiler.compile", COMPILER_SNIPPET),
+    ]:
+        _, stderr = run_python(snippet, importtime=True)
+        modules = parse_importtime(stderr)
+        print(f"\nSlowest imports for {name} ({len(modules)} modules):")
+        print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+        for module, self_us, cumulative_us in sorted(
+            modules, key=lambda module: module[2], reverse=True
+        )[: args.top]:
+            print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {module}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
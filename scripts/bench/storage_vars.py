@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Compares looking up the signatures of the storage variables referenced by
+annotations by resolving their `read` and `write` functions and their
+`Args` and `Return` structs at every reference, as the type checker and
+the Z3 transformer used to, with the index built once per compilation
+(see `horus.compiler.storage_vars`). Also reports the compilation time of
+a contract whose annotations reference many storage variables.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable, List, Tuple
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from starkware.cairo.lang.compiler.identifier_definition import (
+    StructDefinition,
+    TypeDefinition,
+)
+from starkware.cairo.lang.compiler.identifier_utils import (
+    get_struct_definition,
+    get_type_definition,
+)
+
+import horus.compiler.compile
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+from horus.compiler.storage_vars import build_storage_var_index
+
+
+def generate_contract(n_vars: int, n_functions: int) -> str:
+    """
+    Returns a contract of `n_vars` storage maps of two arguments and
+    `n_functions` functions, each of them with a postcondition and a
+    storage update referencing every map.
+    """
+    lines = [
+        "%lang starknet",
+        "",
+        "from starkware.cairo.common.cairo_builtins import HashBuiltin",
+        "",
+    ]
+    for i in range(n_vars):
+        lines += [
+            "@storage_var",
+            f"func balance{i}(account: felt, token: felt) -> (res: felt) {{",
+            "}",
+            "",
+        ]
+    for i in range(n_functions):
+        for j in range(n_vars):
+            lines.append(
+                f"// @post $Return.res == balance{j}(x, token=y) + balance{j}(y, x)"
+            )
+            lines.append(
+                f"// @storage_update balance{j}(account=x, token=y) := "
+                f"balance{j}(x, y) + {i}"
+            )
+        lines += [
+            f"func f{i}{{syscall_ptr: felt*, pedersen_ptr: HashBuiltin*, "
+            f"range_check_ptr}}(x: felt, y: felt) -> (res: felt) {{",
+            "    return (res=x + y);",
+            "}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def compile_specs(path: str) -> str:
+    args = get_arg_parser().parse_args([path, "--output", os.devnull])
+    args.build_cache = False
+    args.spec_output = io.StringIO()
+    horus_compile(args)
+    return args.spec_output.getvalue()
+
+
+def lookup_each_time(storage_vars, identifiers, name) -> Tuple[int, int]:
+    identifiers.get_by_full_name(name + "read")
+    identifiers.get_by_full_name(name + "write")
+    return_type_def = get_type_definition(name + "read" + "Return", identifiers)
+    assert isinstance(return_type_def, TypeDefinition)
+    args_struct_def = get_struct_definition(name + "read" + "Args", identifiers)
+    assert isinstance(args_struct_def, StructDefinition)
+    return len(storage_vars[name].identifiers), len(args_struct_def.members)
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--vars", type=int, default=20)
+    parser.add_argument("--functions", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+
+    lookup_times: List[Tuple[int, int, float, float]] = []
+
+    def compare_lookups(storage_vars, identifiers):
+        # The identifiers are filtered once the contract is assembled, so the
+        # lookups are measured while the preprocessor stage runs.
+        index = build_storage_var_index(storage_vars, identifiers)
+        for name in storage_vars:
+            info = index[name]
+            assert lookup_each_time(storage_vars, identifiers, name) == (
+                len(info.arguments),
+                info.arity,
+            )
+
+        names = list(storage_vars) * (args.lookups // len(storage_vars))
+
+        def with_lookups():
+            for name in names:
+                lookup_each_time(storage_vars, identifiers, name)
+
+        def with_index():
+            index = build_storage_var_index(storage_vars, identifiers)
+            for name in names:
+                info = index[name]
+                len(info.arguments), info.arity
+
+        lookup_times.append(
+            (
+                len(names),
+                len(storage_vars),
+                measure(with_lookups, args.repeat),
+                measure(with_index, args.repeat),
+            )
+        )
+        return index
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "storage_vars.cairo")
+        with open(path, "w") as f:
+            f.write(generate_contract(args.vars, args.functions))
+
+        with mock.patch.object(
+            horus.compiler.compile, "build_storage_var_index", compare_lookups
+        ):
+            compile_specs(path)
+        compile_time = measure(lambda: compile_specs(path), args.repeat)
+
+    n_references, n_vars, each_time, indexed = lookup_times[0]
+    print(
+        f"{n_references} references to {n_vars} storage variables: "
+        f"resolved each time {each_time:.3f}s, "
+        f"indexed {indexed:.3f}s ({each_time / indexed:.1f}x)"
+    )
+    print(
+        f"compilation of {args.functions} functions x {args.vars} storage "
+        f"variables: {compile_time:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
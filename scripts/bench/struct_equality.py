@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the specifications of deeply nested struct equalities
+(pairs of Uint256 inside structs), compiled with and without the
+per-annotation cache of `simplify_and_get_type`.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+from horus.compiler.z3_transformer import Z3Transformer
+
+
+def generate_contract(depth: int) -> str:
+    lines = ["struct Uint256 {", "    low: felt,", "    high: felt,", "}", ""]
+    member_type = "Uint256"
+    for i in range(depth):
+        lines += [f"struct S{i} {{", f"    a: {member_type},", f"    b: {member_type},"]
+        lines += ["}", ""]
+        member_type = f"S{i}"
+    lines += [
+        f"// @declare $v : {member_type}",
+        f"// @pre x == $v",
+        f"// @post $Return.res == x",
+        f"// @post $Return.res == $v",
+        f"func f(x: {member_type}) -> (res: {member_type}) {{",
+        "    return (res=x);",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def compile_specs(path: str) -> str:
+    args = get_arg_parser().parse_args([path, "--output", os.devnull])
+    args.spec_output = io.StringIO()
+    horus_compile(args)
+    return args.spec_output.getvalue()
+
+
+def measure(path: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compile_specs(path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--depths", type=int, nargs="+", default=[2, 4, 6])
+    args = parser.parse_args()
+
+    transformer_init = Z3Transformer.__init__
+
+    def init_without_cache(self, *args, **kwargs):
+        transformer_init(self, *args, **kwargs)
+        self.simplify_cache = None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for depth in args.depths:
+            path = os.path.join(tmp_dir, f"nested_{depth}.cairo")
+            with open(path, "w") as f:
+                f.write(generate_contract(depth))
+
+            with_cache = measure(path, args.repeat)
+            specs = compile_specs(path)
+
+            with mock.patch.object(Z3Transformer, "__init__", init_without_cache):
+                without_cache = measure(path, args.repeat)
+                assert compile_specs(path) == specs
+
+            print(
+                f"depth {depth} ({2 ** (depth + 1)} felts per side): "
+                f"without cache {without_cache:.2f}s, "
+                f"with cache {with_cache:.2f}s "
+                f"({without_cache / with_cache:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Compiles annotation-heavy contracts with the z3 and the python term
+backends (--term_backend), in both formats of --sexpr_format, checks
+that the specifications are identical and reports the compilation times.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from struct_equality import generate_contract as generate_struct_contract
+
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+
+
+def generate_arithmetic_contract(n_functions: int, n_annotations: int) -> str:
+    """
+    Returns a contract of `n_functions` functions, each of them with
+    `n_annotations` preconditions and postconditions over its arguments.
+    """
+    lines = []
+    for i in range(n_functions):
+        for j in range(n_annotations):
+            lines.append(f"// @pre x * {j + 2} + y <= {1000 + j} or x - y == {j}")
+            lines.append(f"// @post $Return.res * {j + 1} >= x + y - {j}")
+        lines += [
+            f"func f{i}(x: felt, y: felt) -> (res: felt) {{",
+            "    return (res=x + y);",
+            "}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def compile_specs(path: str, flags: List[str]) -> str:
+    args = get_arg_parser().parse_args([path, "--output", os.devnull, *flags])
+    args.spec_output = io.StringIO()
+    horus_compile(args)
+    return args.spec_output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    contracts = {
+        "arithmetic (50 functions x 10 annotations)": generate_arithmetic_contract(
+            50, 10
+        ),
+        "nested struct equalities (depth 5)": generate_struct_contract(5),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, code in contracts.items():
+            path = os.path.join(tmp_dir, "contract.cairo")
+            with open(path, "w") as f:
+                f.write(code)
+
+            for sexpr_format in ["pretty", "compact"]:
+                times: Dict[str, float] = {}
+                outputs: Dict[str, str] = {}
+                for backend in ["z3", "python"]:
+                    flags = ["--term_backend", backend, "--sexpr_format", sexpr_format]
+                    outputs[backend] = compile_specs(path, flags)
+                    best = float("inf")
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        compile_specs(path, flags)
+                        best = min(best, time.perf_counter() - start)
+                    times[backend] = best
+                assert outputs["z3"] == outputs["python"], name
+
+                print(
+                    f"{name}, {sexpr_format}: z3 {times['z3']:.2f}s, "
+                    f"python {times['python']:.2f}s "
+                    f"({times['z3'] / times['python']:.2f}x)"
+                )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
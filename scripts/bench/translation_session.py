@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Compares translating the checks of a contract with a Z3 transformer (and
+its type checker and simplifier) made for every check, as the preprocessor
+used to, with the transformers of a function reused by all of its checks
+(see `horus.compiler.z3_transformer.TranslationSession`), on a contract
+with thousands of `@assert` annotations.
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "../../src"))
+
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+from horus.compiler.z3_transformer import TranslationSession, Z3Transformer
+
+
+def generate_contract(n_functions: int, n_asserts: int) -> str:
+    """
+    Returns a contract of `n_functions` functions, each of them with
+    `n_asserts` assertions in its body, half of them on structs.
+    """
+    lines = [
+        "struct Point {",
+        "    x: felt,",
+        "    y: felt,",
+        "}",
+        "",
+    ]
+    for i in range(n_functions):
+        lines += [
+            "// @pre a.x != 0",
+            "// @post $Return.res.x == a.x + b.x",
+            f"func f{i}(a: Point, b: Point) -> (res: Point) {{",
+            "    alloc_locals;",
+            "    local c: Point = Point(x=a.x + b.x, y=a.y + b.y);",
+            "    local d0: Point = c;",
+            "    local d1: Point = c;",
+            "    local d2: Point = c;",
+        ]
+        for j in range(n_asserts):
+            if j % 2 == 0:
+                lines.append(f"    // @assert c.x == a.x + b.x + {j} - {j}")
+            else:
+                lines.append(f"    // @assert c == d{j % 3}")
+        lines += [
+            "    return (res=c);",
+            "}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def compile_specs(path: str) -> str:
+    args = get_arg_parser().parse_args([path, "--output", os.devnull])
+    args.build_cache = False
+    args.spec_output = io.StringIO()
+    horus_compile(args)
+    return args.spec_output.getvalue()
+
+
+def get_transformer_each_time(
+    self: TranslationSession, is_post: bool, logical_identifiers
+) -> Z3Transformer:
+    return Z3Transformer(
+        self.preprocessor.identifiers,
+        self.preprocessor,
+        logical_identifiers,
+        self.storage_vars,
+        is_post,
+        declarations=self.declarations,
+        resolution_cache=self.resolution_cache,
+    )
+
+
+def measure(func: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--functions", type=int, default=10)
+    parser.add_argument("--asserts", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "asserts.cairo")
+        with open(path, "w") as f:
+            f.write(generate_contract(args.functions, args.asserts))
+
+        def each_time():
+            with mock.patch.object(
+                TranslationSession, "get_transformer", get_transformer_each_time
+            ):
+                return compile_specs(path)
+
+        def reused():
+            return compile_specs(path)
+
+        assert each_time() == reused()
+        each_time_time = measure(each_time, args.repeat)
+        reused_time = measure(reused, args.repeat)
+
+    print(
+        f"compilation of {args.functions} functions x {args.asserts} assertions: "
+        f"transformers made per check {each_time_time:.2f}s, "
+        f"reused per function {reused_time:.2f}s "
+        f"({each_time_time / reused_time:.2f}x)"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
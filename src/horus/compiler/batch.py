@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from starkware.cairo.lang.compiler.cairo_compile import get_module_reader
+from starkware.cairo.lang.compiler.error_handling import LocationError
+from starkware.cairo.lang.compiler.module_reader import ModuleReader
+
+from horus.compiler.compile import prepare_compiler
+from horus.compiler.horus_compile import get_arg_parser, get_cairo_path, horus_compile
+
+
+def load_manifest(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        contracts = json.load(f)
+    if not isinstance(contracts, list) or not all(
+        isinstance(contract, dict) for contract in contracts
+    ):
+        raise ValueError("the manifest must be a JSON list of objects.")
+    return contracts
+
+
+def get_contract_args(contract: Dict[str, Any], base_dir: str) -> List[str]:
+    """
+    Converts a contract of the manifest to command line arguments.
+    Relative paths are resolved against `base_dir`.
+    """
+
+    def resolve(path) -> str:
+        return os.path.join(base_dir, str(path))
+
+    files = contract.get("files")
+    if not isinstance(files, list) or not files:
+        raise ValueError("'files' must be a non-empty list of file names.")
+    for field in ["output", "spec_output"]:
+        if not contract.get(field):
+            raise ValueError(f"'{field}' is required.")
+
+    args = [resolve(file) for file in files]
+    args += ["--output", resolve(contract["output"])]
+    args += ["--spec_output", resolve(contract["spec_output"])]
+    if contract.get("abi"):
+        args += ["--abi", resolve(contract["abi"])]
+    if contract.get("cairo_path"):
+        cairo_path = str(contract["cairo_path"]).split(":")
+        args += ["--cairo_path", ":".join(resolve(path) for path in cairo_path)]
+
+    flags = contract.get("flags", [])
+    if not isinstance(flags, list):
+        raise ValueError("'flags' must be a list of command line arguments.")
+    return args + [str(flag) for flag in flags]
+
+
+def compile_contract(
+    contract: Dict[str, Any],
+    base_dir: str,
+    module_readers: Dict[Tuple[str, ...], ModuleReader],
+    cache_dir: Optional[str] = None,
+    use_build_cache: bool = True,
+) -> Optional[str]:
+    """
+    Compiles a contract of the manifest and returns an error message
+    if the compilation failed.
+    Module readers are shared by the contracts with the same cairo path.
+    `cache_dir` and `use_build_cache` are the options of the batch, which
+    apply unless the flags of the contract override them.
+    """
+    parser = get_arg_parser()
+    arg_errors = io.StringIO()
+    try:
+        contract_args = get_contract_args(contract, base_dir)
+        with contextlib.redirect_stderr(arg_errors):
+            args = parser.parse_args(contract_args)
+    except ValueError as err:
+        return f"Invalid contract: {err}"
+    except SystemExit:
+        return arg_errors.getvalue().strip()
+
+    if args.serve or args.batch is not None:
+        return "Invalid contract: --serve and --batch cannot be used for a contract."
+    if args.cache_dir is None:
+        args.cache_dir = cache_dir
+    args.build_cache = args.build_cache and use_build_cache
+
+    cairo_path = tuple(get_cairo_path(args))
+    module_reader = module_readers.get(cairo_path)
+    if module_reader is None:
+        module_reader = module_readers[cairo_path] = get_module_reader(
+            cairo_path=list(cairo_path)
+        )
+    # Only the files read for this contract are its dependencies.
+    module_reader.source_files_with_scopes.clear()
+
+    try:
+        with contextlib.ExitStack() as stack:
+            for output in [args.output, args.spec_output, args.abi]:
+                if output is not None:
+                    stack.enter_context(output)
+            horus_compile(args, module_reader=module_reader)
+    except LocationError as err:
+        return str(err)
+    except Exception as err:
+        # Keep compiling the other contracts after unexpected failures.
+        return f"{type(err).__name__}: {err}"
+    return None
+
+
+def compile_contract_timed(
+    contract: Dict[str, Any],
+    base_dir: str,
+    module_readers: Dict[Tuple[str, ...], ModuleReader],
+    cache_dir: Optional[str] = None,
+    use_build_cache: bool = True,
+) -> Tuple[float, Optional[str]]:
+    """
+    Compiles a contract of the manifest in this process (which must have
+    been set up by `prepare_compiler`) and returns how long it took and
+    the error message, if any.
+    """
+    start_time = time.perf_counter()
+    error = compile_contract(
+        contract, base_dir, module_readers, cache_dir, use_build_cache
+    )
+    return time.perf_counter() - start_time, error
+
+
+# The module readers of a worker process of the pool, by cairo path.
+worker_module_readers: Dict[Tuple[str, ...], ModuleReader] = {}
+
+
+def prepare_worker(
+    use_parser_cache: bool, use_ast_cache: bool, cache_dir: Optional[str]
+):
+    prepare_compiler(use_parser_cache, use_ast_cache, cache_dir)
+    worker_module_readers.clear()
+
+
+def compile_contract_in_worker(
+    contract: Dict[str, Any],
+    base_dir: str,
+    cache_dir: Optional[str],
+    use_build_cache: bool,
+) -> Tuple[float, Optional[str]]:
+    return compile_contract_timed(
+        contract, base_dir, worker_module_readers, cache_dir, use_build_cache
+    )
+
+
+def get_result(
+    future: Future[Tuple[float, Optional[str]]]
+) -> Tuple[Optional[float], Optional[str]]:
+    """
+    Returns the result of the compilation of `future`, or the error of the
+    worker that failed to compile the contract (e.g. a BrokenProcessPool if
+    it exited).
+    """
+    try:
+        return future.result()
+    except Exception as err:
+        return None, f"{type(err).__name__}: {err}"
+
+
+def compile_batch(
+    manifest: str,
+    use_parser_cache: bool = True,
+    use_ast_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    summary: TextIO = sys.stderr,
+    jobs: int = 1,
+    use_build_cache: bool = True,
+) -> int:
+    """
+    Compiles every contract listed in `manifest`, sharing the grammar,
+    the module readers and the parsed Cairo modules between them, and
+    writes the errors and the time taken by every compilation to `summary`.
+    Returns 1 if any of the compilations failed.
+
+    If `jobs` is greater than 1, the contracts are compiled by a pool of
+    `jobs` processes, each of them set up once. The results are written
+    as soon as they are available, in the order of the manifest.
+    """
+    try:
+        contracts = load_manifest(manifest)
+    except (OSError, ValueError) as err:
+        print(f"Invalid manifest {manifest}: {err}", file=summary)
+        return 1
+
+    start_time = time.perf_counter()
+    base_dir = os.path.dirname(manifest)
+    with contextlib.ExitStack() as stack:
+        timed_results: Iterator[Tuple[Optional[float], Optional[str]]]
+        if jobs > 1:
+            executor = stack.enter_context(
+                ProcessPoolExecutor(
+                    max_workers=jobs,
+                    initializer=prepare_worker,
+                    initargs=(use_parser_cache, use_ast_cache, cache_dir),
+                )
+            )
+            futures = [
+                executor.submit(
+                    compile_contract_in_worker,
+                    contract,
+                    base_dir,
+                    cache_dir,
+                    use_build_cache,
+                )
+                for contract in contracts
+            ]
+            timed_results = map(get_result, futures)
+        else:
+            prepare_compiler(use_parser_cache, use_ast_cache, cache_dir)
+            module_readers: Dict[Tuple[str, ...], ModuleReader] = {}
+            timed_results = map(
+                compile_contract_timed,
+                contracts,
+                itertools.repeat(base_dir),
+                itertools.repeat(module_readers),
+                itertools.repeat(cache_dir),
+                itertools.repeat(use_build_cache),
+            )
+
+        names = [
+            ", ".join(str(file) for file in contract.get("files") or [])
+            for contract in contracts
+        ]
+        width = max([len(name) for name in names] + [len("total")])
+        n_failed = 0
+        for name, (duration, error) in zip(names, timed_results):
+            if error is not None:
+                n_failed += 1
+                print(f"{name}: {error}", file=summary)
+            status = "" if error is None else "  failed"
+            # The duration is unknown if the worker failed.
+            duration_str = "-" if duration is None else f"{duration:.2f}s"
+            print(f"{name.ljust(width)}  {duration_str:>9}{status}", file=summary)
+            summary.flush()
+
+    total_time = time.perf_counter() - start_time
+    print(f"{'total'.ljust(width)}  {total_time:8.2f}s", file=summary)
+
+    return 0 if n_failed == 0 else 1
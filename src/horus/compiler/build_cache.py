@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import hashlib
+import importlib.util
+import json
+import os
+import uuid
+from typing import IO, Dict, Iterable, List, Optional, Tuple
+
+import starkware.cairo.lang.version
+from starkware.cairo.lang.compiler.module_reader import ModuleReader
+
+import horus
+from horus.compiler.cache import LRUFileCache
+
+BUILD_CACHE_MAX_SIZE = 512 * 2**20
+
+# The arguments the outputs depend on, besides the source files.
+OUTPUT_ARGS = [
+    "files",
+    "prime",
+    "opt_unused_functions",
+    "disable_hint_validation",
+    "account_contract",
+    "debug_info",
+    "debug_info_with_source",
+    "sexpr_format",
+    "compact_json",
+    "term_backend",
+    "proof_mode",
+]
+
+
+def get_z3_version() -> str:
+    """
+    Identifies the installation of z3, which prints the formulas, by the
+    modification time of its package, without importing it.
+    """
+    spec = importlib.util.find_spec("z3")
+    if spec is None or spec.origin is None:
+        return ""
+    return f"{spec.origin}@{os.stat(spec.origin).st_mtime_ns}"
+
+
+def get_horus_sources_key() -> List[Tuple[str, int, int]]:
+    """
+    Identifies the sources of horus-compile by the sizes and modification
+    times of its files, since they change without a new version while it
+    is developed.
+    """
+    package_dir = os.path.dirname(horus.__file__)
+    key = []
+    for directory, _, files in os.walk(package_dir):
+        for name in files:
+            if name.endswith((".py", ".ebnf")):
+                path = os.path.join(directory, name)
+                stat = os.stat(path)
+                key.append(
+                    (os.path.relpath(path, package_dir), stat.st_size, stat.st_mtime_ns)
+                )
+    return sorted(key)
+
+
+def get_file_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def get_missing_files(module_reader: ModuleReader) -> List[str]:
+    """
+    Returns the files that were looked for, and not found, before the files
+    of the modules read by `module_reader` on its path. Adding one of them
+    would change the module that is read.
+    """
+    missing = []
+    for filename, module_name in module_reader.source_files_with_scopes:
+        path = list(module_name.path)
+        path[-1] += module_reader.cairo_suffix
+        for directory in module_reader.paths:
+            candidate = os.path.join(directory, *path)
+            if candidate == filename:
+                break
+            missing.append(candidate)
+    return sorted(set(missing))
+
+
+# The outputs of a compilation kept by the build cache: the program and the
+# specifications, as written to --output and --spec_output, and the ABI, as
+# written to --abi.
+OUTPUT_NAMES = ["program", "specs", "abi"]
+
+
+@dataclasses.dataclass
+class BuildCacheEntry:
+    # The digests of the source files, by name.
+    sources: Dict[str, str]
+    # The files that shadow a source file on the cairo path if they exist.
+    missing: List[str]
+    # The keys of the files of the outputs in the cache, by name (see
+    # OUTPUT_NAMES).
+    outputs: Dict[str, str]
+
+    def is_up_to_date(self) -> bool:
+        return all(
+            get_file_digest(path) == digest for path, digest in self.sources.items()
+        ) and not any(os.path.isfile(path) for path in self.missing)
+
+
+class BuildCache:
+    """
+    Keeps the outputs of the compilations (the program, the specifications
+    and the ABI), keyed by the versions of horus-compile, cairo-lang and z3,
+    the arguments the outputs depend on and the cairo path.
+
+    Since the files a compilation reads are only known once it is done, an
+    entry records them with their digests, and it is only used if they are
+    unchanged and no file shadowing them on the cairo path was added. A
+    newer compilation with the same key replaces it.
+
+    The outputs are kept in files of their own, which are written while
+    they are produced (see `BuildRecording`) and copied from when they are
+    reused, so that they are never held in memory.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = BUILD_CACHE_MAX_SIZE):
+        self.files = LRUFileCache(os.path.join(cache_dir, "build"), max_size)
+
+    def get_key(self, args: argparse.Namespace, cairo_path: List[str]) -> str:
+        key_data = dict(
+            versions=[
+                horus.__version__,
+                starkware.cairo.lang.version.__version__,
+                get_z3_version(),
+            ],
+            horus_sources=get_horus_sources_key(),
+            args={name: getattr(args, name, None) for name in OUTPUT_ARGS},
+            cairo_path=[os.path.abspath(path) for path in cairo_path],
+            cwd=os.getcwd(),
+        )
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def get_entry(self, key: str) -> Optional[BuildCacheEntry]:
+        data = self.files.get(key)
+        if data is None:
+            return None
+        try:
+            entry = BuildCacheEntry(**json.loads(data))
+        except (ValueError, TypeError):
+            # A corrupted entry, the contract is compiled again.
+            return None
+        if sorted(entry.outputs) != sorted(OUTPUT_NAMES):
+            return None
+        return entry
+
+    def get(self, key: str) -> Optional[BuildCacheEntry]:
+        entry = self.get_entry(key)
+        return entry if entry is not None and entry.is_up_to_date() else None
+
+    def open_outputs(self, entry: BuildCacheEntry) -> Optional[Dict[str, IO[str]]]:
+        """
+        Opens the outputs of `entry`, or returns None if some of them were
+        evicted.
+        """
+        outputs: Dict[str, IO[str]] = {}
+        for name in OUTPUT_NAMES:
+            f = self.files.open(entry.outputs[name])
+            if f is None:
+                for opened in outputs.values():
+                    opened.close()
+                return None
+            outputs[name] = f
+        return outputs
+
+    def record(self, key: str) -> Optional[BuildRecording]:
+        """
+        Starts recording the outputs of the compilation of `key`, or returns
+        None if the cache directory can't be written.
+        """
+        try:
+            return BuildRecording(self, key)
+        except OSError:
+            return None
+
+
+class BuildRecording:
+    """
+    The outputs of a compilation, written to pending files of the build
+    cache as they are produced. They become an entry of the cache once the
+    compilation succeeded (see `commit`).
+
+    Failing to write them disables the recording without failing the
+    compilation.
+    """
+
+    def __init__(self, cache: BuildCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.pending: Dict[str, Tuple[IO[str], str]] = {}
+        self.failed = False
+        try:
+            for name in OUTPUT_NAMES:
+                self.pending[name] = cache.files.create_pending()
+        except OSError:
+            self.discard()
+            raise
+
+    def write(self, name: str, s: str):
+        if self.failed:
+            return
+        try:
+            self.pending[name][0].write(s)
+        except OSError:
+            self.discard()
+
+    def writer(self, name: str, out: IO[str]) -> RecordingWriter:
+        return RecordingWriter(out, self, name)
+
+    def commit(self, sources: Iterable[str], missing: List[str]):
+        """
+        Adds the outputs to the cache as the entry of the key, which replaces
+        the previous one.
+        """
+        if self.failed:
+            return
+        digests = {}
+        for path in sources:
+            digest = get_file_digest(path)
+            if digest is None:
+                self.discard()
+                return
+            digests[path] = digest
+
+        previous_entry = self.cache.get_entry(self.key)
+        # The outputs are named after the entry, so that a concurrent
+        # compilation of the same key doesn't mix its outputs with these.
+        suffix = uuid.uuid4().hex
+        outputs = {name: f"{self.key}-{suffix}.{name}" for name in OUTPUT_NAMES}
+        try:
+            for name, (f, path) in self.pending.items():
+                f.close()
+                self.cache.files.add_pending(outputs[name], path)
+        except OSError:
+            self.discard()
+            for output_key in outputs.values():
+                self.cache.files.remove(output_key)
+            return
+        self.pending = {}
+
+        entry = BuildCacheEntry(sources=digests, missing=missing, outputs=outputs)
+        self.cache.files.set(self.key, json.dumps(dataclasses.asdict(entry)).encode())
+        if previous_entry is not None:
+            for output_key in previous_entry.outputs.values():
+                self.cache.files.remove(output_key)
+
+    def discard(self):
+        self.failed = True
+        for f, path in self.pending.values():
+            try:
+                f.close()
+                os.unlink(path)
+            except OSError:
+                pass
+        self.pending = {}
+
+
+class RecordingWriter:
+    """
+    Writes to `out` and to the output `name` of `recording`.
+    """
+
+    def __init__(self, out: IO[str], recording: BuildRecording, name: str):
+        self.out = out
+        self.recording = recording
+        self.name = name
+
+    def write(self, s: str) -> int:
+        self.recording.write(self.name, s)
+        return self.out.write(s)
+
+    def flush(self):
+        self.out.flush()
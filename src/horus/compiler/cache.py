@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import IO, Any, Dict, Optional, Tuple
+
+CACHE_DIR_ENVVAR = "HORUS_CACHE_DIR"
+
+
+def get_cache_dir() -> str:
+    """
+    Returns the directory where horus-compile keeps its persistent caches.
+    It can be overridden with the HORUS_CACHE_DIR environment variable.
+    """
+    cache_dir = os.getenv(CACHE_DIR_ENVVAR)
+    if cache_dir:
+        return cache_dir
+
+    xdg_cache_home = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(xdg_cache_home, "horus-compile")
+
+
+def write_atomically(path: str, data: bytes):
+    """
+    Writes `data` to `path` so that concurrent readers never observe
+    a partially written file.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class LRUFileCache:
+    """
+    A directory of cache entries. When the total size of the entries exceeds
+    `max_size` bytes, the least recently used ones are removed, until they
+    take `EVICTION_RATIO` of it.
+
+    The total size is only computed from the directory when an instance
+    first writes to it and when the entries it wrote since make it exceed
+    `max_size`, so writing an entry doesn't scan the directory.
+    """
+
+    EVICTION_RATIO = 0.9
+
+    def __init__(self, directory: str, max_size: int):
+        self.directory = directory
+        self.max_size = max_size
+        # The total size of the entries when the directory was last scanned,
+        # plus the sizes of the entries written since (overwritten entries
+        # are counted again, and other processes' entries aren't counted).
+        # None if the directory hasn't been scanned yet.
+        self.size_estimate: Optional[int] = None
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.get_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Mark the entry as recently used.
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def open(self, key: str) -> Optional[IO[str]]:
+        """
+        Opens the entry `key`, written as text (see `create_pending`), or
+        returns None if there is no such entry.
+        """
+        path = self.get_path(key)
+        try:
+            f = open(path, "r", encoding="utf-8", newline="")
+        except OSError:
+            return None
+        try:
+            # Mark the entry as recently used.
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def set(self, key: str, data: bytes):
+        try:
+            write_atomically(self.get_path(key), data)
+            self.add_size(len(data))
+        except OSError:
+            # Failing to write the cache must not fail the compilation.
+            pass
+
+    def create_pending(self) -> Tuple[IO[str], str]:
+        """
+        Creates a file in the cache directory to write an entry as text, and
+        returns it with its path. It isn't an entry until it is added with
+        `add_pending`, and it is ignored by the eviction until then.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        return os.fdopen(fd, "w", encoding="utf-8", newline=""), path
+
+    def add_pending(self, key: str, path: str):
+        """
+        Makes the (closed) file `path` created by `create_pending` the entry
+        `key`, atomically.
+        """
+        size = os.path.getsize(path)
+        os.replace(path, self.get_path(key))
+        self.add_size(size)
+
+    def remove(self, key: str):
+        path = self.get_path(key)
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+        except OSError:
+            return
+        if self.size_estimate is not None:
+            self.size_estimate -= size
+
+    def add_size(self, size: int):
+        if self.size_estimate is not None:
+            self.size_estimate += size
+        if self.size_estimate is None or self.size_estimate > self.max_size:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(".tmp-"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        if total_size > self.max_size:
+            target_size = int(self.max_size * self.EVICTION_RATIO)
+        else:
+            target_size = self.max_size
+        for _, size, path in sorted(entries):
+            if total_size <= target_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Removed by a concurrent compilation.
+                pass
+            total_size -= size
+        self.size_estimate = total_size
+
+
+class ParsedFileCache:
+    """
+    Keeps the ASTs of parsed Cairo files, keyed by the file name, its content
+    and the parser context, in memory and/or in an LRUFileCache.
+    The ASTs are stored pickled, since later compilation stages may modify
+    the AST they are given.
+
+    `salt` must identify everything else the AST depends on, e.g. the grammar
+    and the versions of horus-compile and cairo-lang.
+    """
+
+    def __init__(
+        self,
+        salt: str = "",
+        in_memory: bool = True,
+        disk_cache: Optional[LRUFileCache] = None,
+    ):
+        self.salt = salt
+        self.entries: Optional[Dict[str, bytes]] = {} if in_memory else None
+        self.disk_cache = disk_cache
+
+    def get_key(self, filename: Optional[str], code: str, parser_context) -> str:
+        return hashlib.sha256(
+            "\0".join([self.salt, str(filename), code, repr(parser_context)]).encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        data = self.entries.get(key) if self.entries is not None else None
+        if data is None and self.disk_cache is not None:
+            data = self.disk_cache.get(key)
+            if data is not None and self.entries is not None:
+                self.entries[key] = data
+        if data is None:
+            return None
+
+        try:
+            return pickle.loads(data)
+        except Exception:
+            # A corrupted entry, the file is parsed again.
+            return None
+
+    def set(self, key: str, value: Any):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.entries is not None:
+            self.entries[key] = data
+        if self.disk_cache is not None:
+            self.disk_cache.set(key, data)
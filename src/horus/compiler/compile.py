@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import dataclasses
+import functools
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import starkware.cairo.lang.compiler.ast.visitor
+import starkware.cairo.lang.compiler.parser
+from starkware.cairo.lang.compiler.ast.arguments import IdentifierList
+from starkware.cairo.lang.compiler.ast.code_elements import CodeElementFunction
+from starkware.cairo.lang.compiler.expression_transformer import ExpressionTransformer
+from starkware.cairo.lang.compiler.identifier_manager import IdentifierManager
+from starkware.cairo.lang.compiler.preprocessor.default_pass_manager import (
+    PreprocessorStage,
+)
+from starkware.cairo.lang.compiler.preprocessor.identifier_aware_visitor import (
+    IdentifierAwareVisitor,
+)
+from starkware.cairo.lang.compiler.preprocessor.pass_manager import (
+    PassManager,
+    PassManagerContext,
+    Stage,
+)
+from starkware.cairo.lang.compiler.scoped_name import ScopedName
+from starkware.starknet.compiler.compile import assemble_starknet_contract
+from starkware.starknet.compiler.starknet_pass_manager import starknet_pass_manager
+from starkware.starknet.compiler.storage_var import STORAGE_VAR_DECORATOR
+from starkware.starknet.compiler.validation_utils import has_decorator
+from starkware.starknet.security.hints_whitelist import get_hints_whitelist
+from starkware.starknet.security.secure_hints import HintsWhitelist
+from starkware.starknet.services.api.contract_class import ContractClass
+
+import horus
+import horus.compiler.parser
+from horus.compiler.cache import get_cache_dir
+from horus.compiler.code_elements import AnnotatedCodeElement
+from horus.compiler.contract_definition import HorusDefinition
+from horus.compiler.parser import get_gram_parser, make_parsed_file_cache
+from horus.compiler.preprocessor import HorusPreprocessor, HorusProgram
+from horus.compiler.storage_vars import build_storage_var_index
+
+
+def assemble_horus_contract(
+    preprocessed_program: HorusProgram, *args, **kwargs
+) -> Tuple[ContractClass, HorusDefinition]:
+    contract_definition = assemble_starknet_contract(
+        preprocessed_program, *args, **kwargs
+    )
+
+    return (
+        contract_definition,
+        HorusDefinition(
+            horus_version=horus.__version__,
+            specifications=preprocessed_program.specifications,
+            invariants=preprocessed_program.invariants,
+            storage_vars=preprocessed_program.storage_vars,
+        ),
+    )
+
+
+class HorusStorageVarDeclVisitor(IdentifierAwareVisitor):
+    def __init__(
+        self,
+        storage_vars: Dict[ScopedName, IdentifierList],
+        identifiers: Optional[IdentifierManager] = None,
+    ):
+        self.storage_vars = storage_vars
+        super().__init__(identifiers)
+
+    def _visit_default(self, obj):
+        return obj
+
+    def visit_CodeElementFunction(self, elm: CodeElementFunction):
+        is_storage_var, storage_var_location = has_decorator(
+            elm=elm, decorator_name=STORAGE_VAR_DECORATOR
+        )
+        if is_storage_var:
+            self.storage_vars[self.current_scope + elm.name] = elm.arguments
+        return elm
+
+
+class HorusStorageVarCollectorStage(Stage):
+    def run(self, context: PassManagerContext):
+        assert isinstance(context, HorusPassManagerContext)
+        visitor = HorusStorageVarDeclVisitor(
+            storage_vars=context.storage_vars, identifiers=context.identifiers
+        )
+        for module in context.modules:
+            visitor.visit(module)
+
+        context.storage_vars = visitor.storage_vars
+        return visitor
+
+
+@functools.lru_cache(maxsize=None)
+def get_cached_hints_whitelist() -> HintsWhitelist:
+    """
+    Loading the whitelist takes a noticeable part of the compilation of
+    a small contract, so it is loaded once per process.
+    """
+    return get_hints_whitelist()
+
+
+def horus_pass_manager(
+    prime: int,
+    read_module: Callable[[str], Tuple[str, str]],
+    opt_unused_functions: bool = True,
+    disable_hint_validation: bool = False,
+    previous_fingerprints: Optional[Dict[ScopedName, str]] = None,
+    term_backend: str = "z3",
+) -> PassManager:
+    # The hint whitelist is set below.
+    manager = starknet_pass_manager(
+        prime, read_module, opt_unused_functions, disable_hint_validation=True
+    )
+    manager.stages.insert(0, ("monkeypatch", MonkeyPatchStage()))
+    preprocessor_stage = manager.stages[manager.get_stage_index("preprocessor")][1]
+    preprocessor_kwargs = dict(preprocessor_stage.preprocessor_kwargs)
+    preprocessor_kwargs["hint_whitelist"] = (
+        None if disable_hint_validation else get_cached_hints_whitelist()
+    )
+    if previous_fingerprints is not None:
+        preprocessor_kwargs["previous_fingerprints"] = previous_fingerprints
+    preprocessor_kwargs["term_backend"] = term_backend
+    manager.replace(
+        "preprocessor",
+        HorusPreprocessorStage(
+            preprocessor_stage.prime,
+            HorusPreprocessor,
+            preprocessor_stage.auxiliary_info_cls,
+            preprocessor_kwargs,
+        ),
+    )
+    manager.add_before(
+        "storage_var_signature", "storage_collector", HorusStorageVarCollectorStage()
+    )
+    return manager
+
+
+@dataclasses.dataclass
+class HorusPassManagerContext(PassManagerContext):
+    storage_vars: Dict[ScopedName, IdentifierList] = dataclasses.field(
+        default_factory=dict
+    )
+
+
+class HorusPreprocessorStage(PreprocessorStage):
+    def run(self, context: PassManagerContext):
+        assert isinstance(context, HorusPassManagerContext)
+        self.preprocessor_kwargs["storage_vars"] = context.storage_vars
+        # The signatures of the storage variables are only complete once
+        # their functions and structs are collected, before this stage.
+        self.preprocessor_kwargs["storage_var_index"] = build_storage_var_index(
+            context.storage_vars, context.identifiers
+        )
+        return super().run(context)
+
+
+def preprocess_codes(
+    codes: Sequence[Tuple[str, str]],
+    pass_manager: PassManager,
+    main_scope: ScopedName = ScopedName(),
+    start_codes: Optional[List[Tuple[str, str]]] = None,
+):
+    """
+    Preprocesses a list of Cairo files and returns a PreprocessedProgram instance.
+    codes is a list of pairs (code_string, file_name).
+    """
+    context = HorusPassManagerContext(
+        codes=list(codes),
+        main_scope=main_scope,
+        identifiers=IdentifierManager(),
+        start_codes=[] if start_codes is None else start_codes,
+    )
+
+    pass_manager.run(context)
+
+    assert context.preprocessed_program is not None
+    return context.preprocessed_program
+
+
+def apply_monkeypatches():
+    """
+    Monkey-patches StarkWare definitions.
+    All future monkey-patching should be done here.
+    """
+
+    def visit_AnnotatedCodeElement(self, annotated_code_element):
+        return AnnotatedCodeElement(
+            annotation=annotated_code_element.annotation,
+            code_elm=self.visit(annotated_code_element.code_elm),
+        )
+
+    starkware.cairo.lang.compiler.ast.visitor.Visitor.visit_AnnotatedCodeElement = (
+        visit_AnnotatedCodeElement
+    )
+    starkware.cairo.lang.compiler.parser.parse = horus.compiler.parser.parse
+    ExpressionTransformer.visit_ExprLogicalIdentifier = lambda self, expr: expr
+
+
+def prepare_compiler(
+    use_parser_cache: bool = True,
+    use_ast_cache: bool = True,
+    cache_dir: Optional[str] = None,
+):
+    """
+    Prepares the process for compiling many contracts: builds the grammar,
+    applies the monkey-patches and keeps the parsed Cairo modules (e.g. the
+    standard library) in memory between compilations. Parsed modules are
+    also stored in the cache directory, unless `use_ast_cache` is False.
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    get_gram_parser(use_cache=use_parser_cache, cache_dir=cache_dir)
+    apply_monkeypatches()
+    horus.compiler.parser.parsed_file_cache = make_parsed_file_cache(
+        in_memory=True, cache_dir=cache_dir if use_ast_cache else None
+    )
+
+
+class MonkeyPatchStage(Stage):
+    """
+    Additional compilation stage we add before
+    any other stage is performed in order to monkey-patch
+    StarkWare definitions (see `apply_monkeypatches`).
+    """
+
+    def run(self, context: PassManagerContext):
+        apply_monkeypatches()
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import sys
+from typing import Any, Dict, List, Optional, TextIO
+
+from starkware.cairo.lang.compiler.error_handling import LocationError
+
+from horus.compiler.compile import prepare_compiler
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+
+
+def get_request_args(request: Dict[str, Any]) -> List[str]:
+    """
+    Converts a compile request to command line arguments.
+
+    A request is a JSON object with the following fields:
+    files - A list of Cairo files to compile.
+    cairo_path - (optional) The same as --cairo_path.
+    flags - (optional) A list of additional command line arguments,
+        e.g. ["--no_debug_info", "--account_contract"].
+    """
+    files = request.get("files")
+    if not isinstance(files, list) or not files:
+        raise ValueError("'files' must be a non-empty list of file names.")
+
+    args = [str(file) for file in files]
+    if request.get("cairo_path"):
+        args += ["--cairo_path", str(request["cairo_path"])]
+
+    flags = request.get("flags", [])
+    if not isinstance(flags, list):
+        raise ValueError("'flags' must be a list of command line arguments.")
+    return args + [str(flag) for flag in flags]
+
+
+def handle_request(
+    request: Dict[str, Any],
+    cache_dir: Optional[str] = None,
+    use_build_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Compiles the contract described by `request` and returns the response.
+    On success, the response contains the "program", "specs" and "abi" fields
+    (or "preprocessed" if --preprocess was given). Otherwise, it contains
+    the "error" field.
+    `cache_dir` and `use_build_cache` are the options of the server, which
+    apply unless the flags of the request override them.
+    """
+    # The outputs are returned in the response, no file may be opened.
+    parser = get_arg_parser(open_outputs=False)
+    arg_errors = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(arg_errors):
+            args = parser.parse_args(get_request_args(request))
+    except ValueError as err:
+        return {"error": f"Invalid request: {err}"}
+    except SystemExit:
+        return {"error": arg_errors.getvalue().strip()}
+
+    if args.serve or args.batch is not None:
+        return {
+            "error": "Invalid request: --serve and --batch cannot be used in a request."
+        }
+    if any(output is not None for output in [args.output, args.spec_output, args.abi]):
+        return {
+            "error": "Invalid request: --output, --spec_output and --abi cannot be used "
+            "in a request."
+        }
+    if args.cache_dir is None:
+        args.cache_dir = cache_dir
+    args.build_cache = args.build_cache and use_build_cache
+
+    args.output = io.StringIO()
+    args.spec_output = io.StringIO()
+    args.abi = io.StringIO()
+    try:
+        horus_compile(args)
+    except LocationError as err:
+        return {"error": str(err)}
+
+    if args.preprocess:
+        return {"preprocessed": args.output.getvalue()}
+    return {
+        "program": json.loads(args.output.getvalue()),
+        "specs": json.loads(args.spec_output.getvalue()),
+        "abi": json.loads(args.abi.getvalue()),
+    }
+
+
+def serve(
+    requests: TextIO,
+    responses: TextIO,
+    use_parser_cache: bool = True,
+    use_ast_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    use_build_cache: bool = True,
+) -> int:
+    """
+    Reads compile requests as JSON lines from `requests` and writes
+    a JSON line response for each of them to `responses`, in order.
+    The grammar, the monkey-patches and the parsed Cairo modules are
+    kept between requests. Parsed modules are also stored in the cache
+    directory, unless `use_ast_cache` is False, and the outputs of the
+    compilations in its build cache, unless `use_build_cache` is False.
+    """
+    prepare_compiler(use_parser_cache, use_ast_cache, cache_dir)
+
+    for line in requests:
+        if not line.strip():
+            continue
+
+        request_id = None
+        # Nothing but the responses may be written to stdout.
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("a request must be a JSON object.")
+                request_id = request.get("id")
+                response = handle_request(request, cache_dir, use_build_cache)
+            except ValueError as err:
+                response = {"error": f"Invalid request: {err}"}
+            except Exception as err:
+                # Keep serving after unexpected compiler failures.
+                response = {"error": f"{type(err).__name__}: {err}"}
+
+        responses.write(json.dumps({"id": request_id, **response}) + "\n")
+        responses.flush()
+
+    return 0
@@ -1,7 +1,17 @@
 from __future__ import annotations
 
 from dataclasses import field
-from typing import Dict, List, Optional
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
 import marshmallow.fields as mfields
 import marshmallow_dataclass
@@ -9,24 +19,55 @@ import z3
 from marshmallow.exceptions import ValidationError
 from starkware.cairo.lang.compiler.ast.cairo_types import CairoType
 from starkware.cairo.lang.compiler.fields import CairoTypeAsStr
+from starkware.cairo.lang.compiler.parser import parse_type
 from starkware.cairo.lang.compiler.scoped_name import ScopedName, ScopedNameAsStr
+from starkware.cairo.lang.compiler.type_system import mark_type_resolved
 
 import horus
+from horus.compiler.terms import Term
 from horus.compiler.var_names import *
-from horus.utils import z3And
+from horus.compiler.z3_declarations import Declarations
+from horus.utils import compact_sexpr, z3And
 
 
 class SexpField(mfields.Field):
+    """
+    A formula, serialized in the format given by the "sexpr_format" entry
+    of the schema context: "pretty" (default) is z3's pretty-printed form
+    split into lines, "compact" is a single line in which repeated
+    subterms are bound by lets.
+    """
+
     def _serialize(self, value: z3.ExprRef, attr, obj, **kwargs):
-        return super()._serialize(value.sexpr().split("\n"), attr, obj, **kwargs)
+        lines = format_sexpr(value, self.context.get("sexpr_format", "pretty"))
+        return super()._serialize(lines, attr, obj, **kwargs)
 
     def _deserialize(self, value, attr, data, **kwargs) -> z3.ExprRef:
         v = super()._deserialize(value, attr, data, **kwargs)
-        ref_str = "\n".join(v)
-        refs = z3.parse_smt2_string(ref_str, decls=HORUS_DECLS)
-        if len(refs) != 1:
-            raise ValidationError(f"Can't deserialize '{ref_str}'")
-        return refs[0]  # type: ignore
+        return parse_sexpr(v)
+
+
+def format_sexpr(value, sexpr_format: str = "pretty") -> List[str]:
+    if sexpr_format == "compact":
+        return [
+            value.compact_sexpr() if isinstance(value, Term) else compact_sexpr(value)
+        ]
+    lines: List[str] = value.sexpr().split("\n")
+    return lines
+
+
+def parse_sexpr(lines: List[str], decls: Dict[str, Any] = HORUS_DECLS) -> z3.ExprRef:
+    ref_str = "\n".join(lines)
+    # The expression (a formula or an integer term) is parsed in an
+    # assertion, which is the only thing z3 returns from a script.
+    try:
+        refs = z3.parse_smt2_string(f"(assert (= {ref_str} {ref_str}))", decls=decls)
+    except z3.Z3Exception:
+        refs = []
+    if len(refs) != 1:
+        raise ValidationError(f"Can't deserialize '{ref_str}'")
+    ref: z3.ExprRef = refs[0].arg(0)
+    return ref
 
 
 @marshmallow_dataclass.dataclass
@@ -57,6 +98,30 @@ class Annotation:
         )
 
 
+class AnnotationBuilder:
+    """
+    Accumulates the conjuncts of an annotation (e.g. the @pre checks of a
+    function) and their sources, which are joined into a single n-ary And
+    by `build` once all of them are known, rather than into a nested And
+    per check as `Annotation.__and__` does.
+    """
+
+    def __init__(self):
+        self.conjuncts: list = []
+        self.source: List[str] = []
+
+    def add(self, annotation: Annotation):
+        self.conjuncts.append(annotation.sexpr)
+        self.source.extend(annotation.source)
+
+    def build(self, declarations: Declarations) -> Annotation:
+        if not self.conjuncts:
+            return Annotation()
+        return Annotation(
+            sexpr=declarations.conjunction(self.conjuncts), source=list(self.source)
+        )
+
+
 @marshmallow_dataclass.dataclass(frozen=False)
 class FunctionAnnotations:
     pre: Annotation = field(
@@ -125,3 +190,308 @@ class HorusDefinition:
         metadata=dict(marshmallow_field=mfields.Dict(ScopedNameAsStr(), mfields.Int())),
         default_factory=dict,
     )
+
+
+# Encoders and decoders of the dataclasses above, which produce (and read)
+# the same JSON data as their schemas, without the generic machinery of
+# marshmallow. The schemas of HorusDefinition are kept for compatibility.
+
+
+def encode_annotation(
+    annotation: Annotation, sexpr_format: str = "pretty"
+) -> Dict[str, Any]:
+    return dict(
+        sexpr=format_sexpr(annotation.sexpr, sexpr_format),
+        source=list(annotation.source),
+    )
+
+
+def encode_storage_update(
+    storage_update: StorageUpdate, sexpr_format: str = "pretty"
+) -> Dict[str, Any]:
+    return dict(
+        arguments=[
+            format_sexpr(argument, sexpr_format)
+            for argument in storage_update.arguments
+        ],
+        value=format_sexpr(storage_update.value, sexpr_format),
+        source=storage_update.source,
+    )
+
+
+def encode_function_annotations(
+    annotations: FunctionAnnotations, sexpr_format: str = "pretty"
+) -> Dict[str, Any]:
+    return dict(
+        pre=encode_annotation(annotations.pre, sexpr_format),
+        post=encode_annotation(annotations.post, sexpr_format),
+        logical_variables={
+            str(name): cairo_type.format()
+            for name, cairo_type in annotations.logical_variables.items()
+        },
+        decls=dict(annotations.decls),
+        storage_update={
+            str(name): [
+                encode_storage_update(update, sexpr_format) for update in updates
+            ]
+            for name, updates in annotations.storage_update.items()
+        },
+    )
+
+
+def encode_horus_definition(
+    definition: HorusDefinition, sexpr_format: str = "pretty"
+) -> Dict[str, Any]:
+    """
+    Returns `HorusDefinition.Schema(context=dict(sexpr_format=sexpr_format))
+    .dump(definition)`.
+    """
+    return dict(
+        horus_version=definition.horus_version,
+        specifications={
+            str(name): encode_function_annotations(annotations, sexpr_format)
+            for name, annotations in definition.specifications.items()
+        },
+        invariants={
+            str(name): encode_annotation(invariant, sexpr_format)
+            for name, invariant in definition.invariants.items()
+        },
+        storage_vars={
+            str(name): size for name, size in definition.storage_vars.items()
+        },
+    )
+
+
+def _decode_fields(
+    cls: type, data: Dict[str, Any], decoders: Dict[str, Callable[[Any], Any]]
+) -> Any:
+    """
+    Returns an instance of the dataclass `cls` with the fields of `data`,
+    decoded by `decoders`. Missing fields get their default values.
+    """
+    unknown = data.keys() - decoders.keys()
+    if unknown:
+        raise ValidationError(f"Unknown fields of {cls.__name__}: {sorted(unknown)}")
+    return cls(**{name: decoders[name](value) for name, value in data.items()})
+
+
+def _decode_dict(
+    decode_key: Callable[[Any], Any], decode_value: Callable[[Any], Any]
+) -> Callable[[Dict[str, Any]], Dict[Any, Any]]:
+    return lambda data: {
+        decode_key(key): decode_value(value) for key, value in data.items()
+    }
+
+
+def _parse_expression(lines: List[str], is_formula: bool) -> z3.ExprRef:
+    return parse_sexpr(lines)
+
+
+# The decoders below parse the expressions with `parse`, which gets their
+# lines and whether they are formulas (rather than integer terms).
+ExpressionParser = Callable[[List[str], bool], Any]
+
+
+def decode_annotation(
+    data: Dict[str, Any], parse: ExpressionParser = _parse_expression
+) -> Annotation:
+    annotation: Annotation = _decode_fields(
+        Annotation, data, dict(sexpr=lambda lines: parse(lines, True), source=list)
+    )
+    return annotation
+
+
+def decode_storage_update(
+    data: Dict[str, Any], parse: ExpressionParser = _parse_expression
+) -> StorageUpdate:
+    storage_update: StorageUpdate = _decode_fields(
+        StorageUpdate,
+        data,
+        dict(
+            arguments=lambda arguments: [parse(lines, False) for lines in arguments],
+            value=lambda lines: parse(lines, False),
+            source=str,
+        ),
+    )
+    return storage_update
+
+
+def decode_function_annotations(
+    data: Dict[str, Any], parse: ExpressionParser = _parse_expression
+) -> FunctionAnnotations:
+    annotations: FunctionAnnotations = _decode_fields(
+        FunctionAnnotations,
+        data,
+        dict(
+            pre=lambda pre: decode_annotation(pre, parse),
+            post=lambda post: decode_annotation(post, parse),
+            logical_variables=_decode_dict(
+                ScopedName.from_string,
+                lambda cairo_type: mark_type_resolved(parse_type(cairo_type)),
+            ),
+            decls=_decode_dict(str, int),
+            storage_update=_decode_dict(
+                ScopedName.from_string,
+                lambda updates: [
+                    decode_storage_update(update, parse) for update in updates
+                ],
+            ),
+        ),
+    )
+    return annotations
+
+
+def decode_horus_definition(
+    data: Dict[str, Any], parse: ExpressionParser = _parse_expression
+) -> HorusDefinition:
+    """
+    Returns `HorusDefinition.Schema().load(data)`.
+    """
+    definition: HorusDefinition = _decode_fields(
+        HorusDefinition,
+        data,
+        dict(
+            horus_version=lambda version: version,
+            specifications=_decode_dict(
+                ScopedName.from_string,
+                lambda annotations: decode_function_annotations(annotations, parse),
+            ),
+            invariants=_decode_dict(
+                ScopedName.from_string,
+                lambda invariant: decode_annotation(invariant, parse),
+            ),
+            storage_vars=_decode_dict(ScopedName.from_string, int),
+        ),
+    )
+    return definition
+
+
+class BulkSexprParser:
+    """
+    Parses the expressions of a specification file (in the JSON data of
+    its HorusDefinition) together, as the assertions of a single SMT-LIB
+    script, rather than with a call to z3's parser per expression. The
+    uninterpreted functions and constants are declared once, from the
+    `decls` of the specifications and the `storage_vars`.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        arities: Dict[str, int] = dict(data.get("storage_vars", {}))
+        for annotations in data.get("specifications", {}).values():
+            for name, arity in annotations.get("decls", {}).items():
+                arities.setdefault(name, arity)
+        self.decls: Dict[str, Any] = dict(HORUS_DECLS)
+        for name, arity in arities.items():
+            if name in self.decls:
+                continue
+            if arity == 0:
+                self.decls[name] = z3.Int(name)
+            else:
+                self.decls[name] = z3.Function(name, *[z3.IntSort()] * (arity + 1))
+
+    def parse(self, expressions: List[Tuple[List[str], bool]]) -> List[z3.ExprRef]:
+        """
+        Parses `expressions`, given by their lines and whether they are
+        formulas (rather than integer terms).
+        """
+        if not expressions:
+            return []
+        script = "\n".join(
+            ("(assert {})" if is_formula else "(assert (= {} 0))").format(
+                "\n".join(lines)
+            )
+            for lines, is_formula in expressions
+        )
+        try:
+            refs = z3.parse_smt2_string(script, decls=self.decls)
+        except z3.Z3Exception:
+            refs = None
+        if refs is None or len(refs) != len(expressions):
+            # Find the expression which can't be parsed, on its own.
+            for lines, is_formula in expressions:
+                if z3.is_bool(parse_sexpr(lines, self.decls)) != is_formula:
+                    ref_str = "\n".join(lines)
+                    kind = "a formula" if is_formula else "an integer term"
+                    raise ValidationError(f"Can't deserialize '{ref_str}' as {kind}")
+            raise ValidationError("Can't deserialize the expressions")
+        return [
+            ref if is_formula else ref.arg(0)
+            for ref, (_, is_formula) in zip(refs, expressions)
+        ]
+
+
+K = TypeVar("K")
+T = TypeVar("T")
+V = TypeVar("V")
+
+
+class LazyDict(Mapping[K, V]):
+    """
+    A read-only dict whose values are decoded from `data` when they are
+    first accessed.
+    """
+
+    def __init__(self, data: Dict[K, Any], decode: Callable[[Any], V]):
+        self.data = data
+        self.decode = decode
+        self.decoded: Dict[K, V] = {}
+
+    def __getitem__(self, key: K) -> V:
+        if key not in self.decoded:
+            self.decoded[key] = self.decode(self.data[key])
+        return self.decoded[key]
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def _decode_in_bulk(
+    parser: BulkSexprParser, decode: Callable[[Any, ExpressionParser], T], data: Any
+) -> T:
+    """
+    Decodes `data` with `decode`, parsing all of its expressions at once
+    with `parser`: the first pass collects them and the second one, which
+    meets them in the same order, takes their parsed values.
+    """
+    expressions: List[Tuple[List[str], bool]] = []
+    decode(data, lambda lines, is_formula: expressions.append((lines, is_formula)))
+    refs = iter(parser.parse(expressions))
+    return decode(data, lambda lines, is_formula: next(refs))
+
+
+def load_horus_definition(data: Dict[str, Any], lazy: bool = False) -> HorusDefinition:
+    """
+    Returns the HorusDefinition of the JSON `data`, as
+    `decode_horus_definition` does, parsing all of its expressions with a
+    single call to z3's parser. If `lazy` is set, the specifications and
+    invariants are read-only mappings whose entries are decoded on their
+    first access instead (each of them with a call to z3's parser).
+    """
+    parser = BulkSexprParser(data)
+    if not lazy:
+        return _decode_in_bulk(parser, decode_horus_definition, data)
+
+    def lazy_dict(
+        entries: Dict[str, Any], decode: Callable[[Any, ExpressionParser], V]
+    ):
+        return LazyDict(
+            {ScopedName.from_string(name): entry for name, entry in entries.items()},
+            lambda entry: _decode_in_bulk(parser, decode, entry),
+        )
+
+    definition: HorusDefinition = _decode_fields(
+        HorusDefinition,
+        data,
+        dict(
+            horus_version=lambda version: version,
+            specifications=lambda specifications: lazy_dict(
+                specifications, decode_function_annotations
+            ),
+            invariants=lambda invariants: lazy_dict(invariants, decode_annotation),
+            storage_vars=_decode_dict(ScopedName.from_string, int),
+        ),
+    )
+    return definition
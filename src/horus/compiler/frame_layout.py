@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import dataclasses
+from typing import Dict, List, Optional, Set, Tuple
+
+from starkware.cairo.lang.compiler.ast.cairo_types import (
+    CairoType,
+    TypePointer,
+    TypeStruct,
+    TypeTuple,
+)
+from starkware.cairo.lang.compiler.ast.expr import (
+    ExprCast,
+    ExprConst,
+    ExprDeref,
+    ExprDot,
+    Expression,
+    ExprIdentifier,
+    ExprOperator,
+    ExprReg,
+)
+from starkware.cairo.lang.compiler.identifier_definition import TypeDefinition
+from starkware.cairo.lang.compiler.identifier_utils import (
+    get_struct_definition,
+    get_type_definition,
+)
+from starkware.cairo.lang.compiler.instruction import Register
+from starkware.cairo.lang.compiler.preprocessor.preprocessor import Preprocessor
+from starkware.cairo.lang.compiler.scoped_name import ScopedName
+
+
+@dataclasses.dataclass
+class FrameLayout:
+    """
+    The end of the frame of a function, which postconditions refer to: its
+    implicit arguments followed by its return values, which end at ap.
+
+    Names are lowered to the memory cells they are at, e.g. `$Return.res.low`
+    to `[cast(ap + (-2), felt*)]`, through the members of structs and named
+    tuples. Members of pointers (and unknown members) are left to the type
+    checker.
+    """
+
+    scope: ScopedName
+    implicit_arg_names: Set[str]
+    implicit_args_type: TypeStruct
+    # The offsets from ap of the implicit arguments and of the return values.
+    implicit_args_offset: int
+    return_type: CairoType
+    return_offset: int
+    # The lowered names, by name.
+    cells: Dict[str, Expression] = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def build(cls, preprocessor: Preprocessor) -> FrameLayout:
+        """
+        Returns the layout of the function of the current scope of
+        `preprocessor`.
+        """
+        scope = preprocessor.current_scope
+        implicit_args = get_struct_definition(
+            scope + "ImplicitArgs", preprocessor.identifiers
+        )
+        return_def = get_type_definition(scope + "Return", preprocessor.identifiers)
+        assert isinstance(return_def, TypeDefinition)
+        return_size = preprocessor.get_size(return_def.cairo_type)
+
+        return cls(
+            scope=scope,
+            implicit_arg_names=set(implicit_args.members),
+            implicit_args_type=TypeStruct(implicit_args.full_name),
+            implicit_args_offset=-(implicit_args.size + return_size),
+            return_type=return_def.cairo_type,
+            return_offset=-return_size,
+        )
+
+    def get_implicit_arg(
+        self, name: str, preprocessor: Preprocessor
+    ) -> Optional[Expression]:
+        """
+        Returns the cell of `name` (e.g. "syscall_ptr") among the implicit
+        arguments returned by the function, or None if it is not one of them.
+        """
+        if name.split(".")[0] not in self.implicit_arg_names:
+            return None
+        return self.get_cell(
+            name, name, self.implicit_args_offset, self.implicit_args_type, preprocessor
+        )
+
+    def get_return_value(self, name: str, preprocessor: Preprocessor) -> Expression:
+        """
+        Returns the cell of `$Return.{name}`.
+        """
+        return self.get_cell(
+            "$Return." + name,
+            name,
+            self.return_offset,
+            self.return_type,
+            preprocessor,
+        )
+
+    def get_cell(
+        self,
+        key: str,
+        name: str,
+        offset: int,
+        cairo_type: CairoType,
+        preprocessor: Preprocessor,
+    ) -> Expression:
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = lower_member(
+                name.split("."), offset, cairo_type, preprocessor
+            )
+        return cell
+
+
+def get_member(
+    cairo_type: CairoType, name: str, preprocessor: Preprocessor
+) -> Optional[Tuple[int, CairoType]]:
+    """
+    Returns the offset and the type of the member `name` of a struct or a
+    named tuple, or None if there is no such member.
+    """
+    if isinstance(cairo_type, TypeStruct):
+        member = get_struct_definition(
+            cairo_type.scope, preprocessor.identifiers
+        ).members.get(name)
+        return None if member is None else (member.offset, member.cairo_type)
+
+    if isinstance(cairo_type, TypeTuple) and cairo_type.is_named:
+        offset = 0
+        for tuple_member in cairo_type.members:
+            if tuple_member.name == name:
+                return offset, tuple_member.typ
+            offset += preprocessor.get_size(tuple_member.typ)
+    return None
+
+
+def lower_member(
+    path: List[str], offset: int, cairo_type: CairoType, preprocessor: Preprocessor
+) -> Expression:
+    """
+    Returns the member `path` of the value of type `cairo_type` at
+    `ap + offset`.
+    """
+    depth = 0
+    while depth < len(path):
+        member = get_member(cairo_type, path[depth], preprocessor)
+        if member is None:
+            break
+        member_offset, cairo_type = member
+        offset += member_offset
+        depth += 1
+
+    result: Expression = ExprDeref(
+        ExprCast(
+            ExprOperator(ExprReg(Register.AP), "+", ExprConst(offset)),
+            dest_type=TypePointer(cairo_type),
+        )
+    )
+    for member_name in path[depth:]:
+        result = ExprDot(result, ExprIdentifier(member_name))
+    return result
+
+
+def get_frame_layout(preprocessor: Preprocessor) -> FrameLayout:
+    """
+    Returns the layout of the current function of `preprocessor`, computed
+    when it entered the body of the function (see
+    `HorusPreprocessor.visit_function_body_with_retries`), or now.
+    """
+    layout: Optional[FrameLayout] = getattr(preprocessor, "frame_layout", None)
+    if layout is None or layout.scope != preprocessor.current_scope:
+        layout = FrameLayout.build(preprocessor)
+    return layout
@@ -1,200 +1,69 @@
 from __future__ import annotations
 
 import argparse
-import dataclasses
+import copy
 import functools
 import json
 import os
+import shutil
 import sys
 import time
-from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from typing import IO, TYPE_CHECKING, Any, Callable, Dict, List, Optional, cast
 
-import starkware.cairo.lang.compiler.ast.visitor
-import starkware.cairo.lang.compiler.parser
-import starkware.cairo.lang.compiler.preprocessor.preprocess_codes
 import starkware.cairo.lang.version
 from starkware.cairo.lang.cairo_constants import DEFAULT_PRIME
-from starkware.cairo.lang.compiler.ast.arguments import IdentifierList
-from starkware.cairo.lang.compiler.ast.code_elements import CodeElementFunction
-from starkware.cairo.lang.compiler.cairo_compile import (
-    LIBS_DIR_ENVVAR,
-    MAIN_SCOPE,
-    START_FILE_NAME,
-    generate_cairo_dependencies_file,
-    get_codes,
-    get_module_reader,
-    get_start_code,
-)
-from starkware.cairo.lang.compiler.error_handling import LocationError
-from starkware.cairo.lang.compiler.expression_transformer import ExpressionTransformer
-from starkware.cairo.lang.compiler.identifier_manager import IdentifierManager
-from starkware.cairo.lang.compiler.module_reader import ModuleReader
-from starkware.cairo.lang.compiler.preprocessor.default_pass_manager import (
-    PreprocessorStage,
-)
-from starkware.cairo.lang.compiler.preprocessor.identifier_aware_visitor import (
-    IdentifierAwareVisitor,
-)
-from starkware.cairo.lang.compiler.preprocessor.pass_manager import (
-    PassManager,
-    PassManagerContext,
-    Stage,
-)
-from starkware.cairo.lang.compiler.preprocessor.preprocessor import PreprocessedProgram
-from starkware.cairo.lang.compiler.scoped_name import ScopedName
-from starkware.starknet.compiler.compile import assemble_starknet_contract, get_abi
-from starkware.starknet.compiler.starknet_pass_manager import starknet_pass_manager
-from starkware.starknet.compiler.storage_var import STORAGE_VAR_DECORATOR
-from starkware.starknet.compiler.validation_utils import has_decorator
-from starkware.starknet.services.api.contract_class import ContractClass
-
-import horus.compiler.parser
-from horus.compiler.code_elements import AnnotatedCodeElement
-from horus.compiler.contract_definition import HorusDefinition
-from horus.compiler.preprocessor import HorusPreprocessor, HorusProgram
-
-
-def assemble_horus_contract(
-    preprocessed_program: HorusProgram, *args, **kwargs
-) -> Tuple[ContractClass, HorusDefinition]:
-    contract_definition = assemble_starknet_contract(
-        preprocessed_program, *args, **kwargs
-    )
-
-    return (
-        contract_definition,
-        HorusDefinition(
-            horus_version=horus.__version__,
-            specifications=preprocessed_program.specifications,
-            invariants=preprocessed_program.invariants,
-            storage_vars=preprocessed_program.storage_vars,
-        ),
-    )
-
-
-class HorusStorageVarDeclVisitor(IdentifierAwareVisitor):
-    def __init__(
-        self,
-        storage_vars: Dict[ScopedName, IdentifierList],
-        identifiers: Optional[IdentifierManager] = None,
-    ):
-        self.storage_vars = storage_vars
-        super().__init__(identifiers)
 
-    def _visit_default(self, obj):
-        return obj
-
-    def visit_CodeElementFunction(self, elm: CodeElementFunction):
-        is_storage_var, storage_var_location = has_decorator(
-            elm=elm, decorator_name=STORAGE_VAR_DECORATOR
-        )
-        if is_storage_var:
-            self.storage_vars[self.current_scope + elm.name] = elm.arguments
-        return elm
-
-
-class HorusStorageVarCollectorStage(Stage):
-    def run(self, context: PassManagerContext):
-        assert isinstance(context, HorusPassManagerContext)
-        visitor = HorusStorageVarDeclVisitor(
-            storage_vars=context.storage_vars, identifiers=context.identifiers
-        )
-        for module in context.modules:
-            visitor.visit(module)
+import horus
 
-        context.storage_vars = visitor.storage_vars
-        return visitor
-
-
-def horus_pass_manager(
-    prime: int,
-    read_module: Callable[[str], Tuple[str, str]],
-    opt_unused_functions: bool = True,
-    disable_hint_validation: bool = False,
-) -> PassManager:
-    manager = starknet_pass_manager(
-        prime, read_module, opt_unused_functions, disable_hint_validation
-    )
-    manager.stages.insert(0, ("monkeypatch", MonkeyPatchStage()))
-    preprocessor_stage = manager.stages[manager.get_stage_index("preprocessor")][1]
-    manager.replace(
-        "preprocessor",
-        HorusPreprocessorStage(
-            preprocessor_stage.prime,
-            HorusPreprocessor,
-            preprocessor_stage.auxiliary_info_cls,
-            preprocessor_stage.preprocessor_kwargs,
-        ),
-    )
-    manager.add_before(
-        "storage_var_signature", "storage_collector", HorusStorageVarCollectorStage()
+if TYPE_CHECKING:
+    from starkware.cairo.lang.compiler.module_reader import ModuleReader
+    from starkware.cairo.lang.compiler.preprocessor.pass_manager import PassManager
+    from starkware.cairo.lang.compiler.preprocessor.preprocessor import (
+        PreprocessedProgram,
     )
-    return manager
-
-
-@dataclasses.dataclass
-class HorusPassManagerContext(PassManagerContext):
-    storage_vars: Dict[ScopedName, IdentifierList] = dataclasses.field(
-        default_factory=dict
-    )
-
+    from starkware.cairo.lang.compiler.scoped_name import ScopedName
 
-class HorusPreprocessorStage(PreprocessorStage):
-    def run(self, context: PassManagerContext):
-        assert isinstance(context, HorusPassManagerContext)
-        self.preprocessor_kwargs["storage_vars"] = context.storage_vars
-        return super().run(context)
+    from horus.compiler.build_cache import BuildCacheEntry
+    from horus.compiler.incremental import IncrementalBuild
 
+# Same as starkware.cairo.lang.compiler.constants.LIBS_DIR_ENVVAR, which is
+# not imported here to keep the startup of the CLI fast.
+LIBS_DIR_ENVVAR = "CAIRO_PATH"
 
-def preprocess_codes(
-    codes: Sequence[Tuple[str, str]],
-    pass_manager: PassManager,
-    main_scope: ScopedName = ScopedName(),
-    start_codes: Optional[List[Tuple[str, str]]] = None,
-):
-    """
-    Preprocesses a list of Cairo files and returns a PreprocessedProgram instance.
-    codes is a list of pairs (code_string, file_name).
-    """
-    context = HorusPassManagerContext(
-        codes=list(codes),
-        main_scope=main_scope,
-        identifiers=IdentifierManager(),
-        start_codes=[] if start_codes is None else start_codes,
-    )
-
-    pass_manager.run(context)
+# The formats of the formulas in the specification output (see SexpField).
+SEXPR_FORMATS = ["pretty", "compact"]
+# The representations of the terms of the formulas (see horus.compiler.terms).
+TERM_BACKENDS = ["z3", "python"]
 
-    assert context.preprocessed_program is not None
-    return context.preprocessed_program
+# The compiler is imported lazily, so that `--version` and argument errors
+# don't pay for loading cairo-lang, z3 and the grammar. These names are still
+# reachable as attributes of this module for backward compatibility.
+_LAZY_ATTRIBUTES = {
+    "assemble_horus_contract",
+    "HorusStorageVarDeclVisitor",
+    "HorusStorageVarCollectorStage",
+    "horus_pass_manager",
+    "HorusPassManagerContext",
+    "HorusPreprocessorStage",
+    "preprocess_codes",
+    "MonkeyPatchStage",
+}
 
 
-class MonkeyPatchStage(Stage):
-    """
-    Additional compilation stage we add before
-    any other stage is performed in order to monkey-patch
-    StarkWare definitions.
-    All future monkey-patching should be done here.
-    """
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        import horus.compiler.compile
 
-    def run(self, context: PassManagerContext):
-        def visit_AnnotatedCodeElement(self, annotated_code_element):
-            return AnnotatedCodeElement(
-                annotation=annotated_code_element.annotation,
-                code_elm=self.visit(annotated_code_element.code_elm),
-            )
-
-        starkware.cairo.lang.compiler.ast.visitor.Visitor.visit_AnnotatedCodeElement = (
-            visit_AnnotatedCodeElement
-        )
-        starkware.cairo.lang.compiler.parser.parse = horus.compiler.parser.parse
-        ExpressionTransformer.visit_ExprLogicalIdentifier = lambda self, expr: expr
+        return getattr(horus.compiler.compile, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def horus_compile_common(
     args: argparse.Namespace,
     pass_manager_factory: Callable[[argparse.Namespace, ModuleReader], PassManager],
     assemble_func: Callable,
+    dump_specs: Optional[Callable[[Any], Dict[str, Any]]] = None,
+    module_reader: Optional[ModuleReader] = None,
 ) -> PreprocessedProgram:
     """
     Common code for CLI Cairo compilation.
@@ -204,25 +73,48 @@ def horus_compile_common(
     pass_manager_factory - A pass manager factory.
     assemble_func - a function that converts a preprocessed program to the final output,
         the return value should be a Marshmallow dataclass.
+    dump_specs - (optional) a function that converts the specifications to JSON,
+        by default they are encoded function by function.
+    module_reader - (optional) a module reader to use instead of one for
+        the cairo path given in `args`.
     """
+    from starkware.cairo.lang.compiler.cairo_compile import (
+        MAIN_SCOPE,
+        START_FILE_NAME,
+        generate_cairo_dependencies_file,
+        get_codes,
+        get_module_reader,
+        get_start_code,
+    )
+
+    from horus.compiler import profiling
+    from horus.compiler.compile import preprocess_codes
+    from horus.compiler.json_output import (
+        horus_definition_json,
+        program_output_json,
+        write_json,
+    )
 
     start_time = time.time()
     debug_info = args.debug_info or args.debug_info_with_source
+    if module_reader is None:
+        module_reader = get_module_reader(cairo_path=get_cairo_path(args))
 
     try:
         codes = get_codes(args.files)
         out = args.output if args.output is not None else sys.stdout
         specs_out = args.spec_output if args.spec_output is not None else sys.stdout
 
-        cairo_path: List[str] = list(
-            filter(
-                None,
-                args.cairo_path.split(":") + os.getenv(LIBS_DIR_ENVVAR, "").split(":"),
-            )
-        )
-        module_reader = get_module_reader(cairo_path=cairo_path)
-
         pass_manager = pass_manager_factory(args, module_reader)
+        profiler = profiling.active_profiler
+        if profiler is not None:
+            profiler.wrap_pass_manager(pass_manager)
+            # Count the bytes written to the outputs, once if they are the same.
+            writers = [profiling.CountingWriter(out)]
+            if specs_out is not out:
+                writers.append(profiling.CountingWriter(specs_out))
+            out = cast(IO[str], writers[0])
+            specs_out = cast(IO[str], writers[-1])
 
         start_codes = []
         file_contents_for_debug_info = {}
@@ -244,30 +136,41 @@ def horus_compile_common(
                 for source_file in module_reader.source_files | set(args.files):
                     file_contents_for_debug_info[source_file] = open(source_file).read()
 
-            assembled_program, specs = assemble_func(
-                preprocessed,
-                main_scope=MAIN_SCOPE,
-                add_debug_info=debug_info,
-                file_contents_for_debug_info=file_contents_for_debug_info,
-            )
-
-            json.dump(
-                assembled_program.Schema().dump(assembled_program),
-                out,
-                indent=4,
-                sort_keys=True,
-            )
-            # Print a new line at the end.
-            print(file=out)
-
-            json.dump(
-                specs.Schema().dump(specs),
-                specs_out,
-                indent=4,
-                sort_keys=True,
-            )
-            # Print a new line at the end.
-            print(file=specs_out)
+            with profiling.measure("assembly"):
+                assembled_program, specs = assemble_func(
+                    preprocessed,
+                    main_scope=MAIN_SCOPE,
+                    add_debug_info=debug_info,
+                    file_contents_for_debug_info=file_contents_for_debug_info,
+                )
+
+            # The outputs are written while they are serialized.
+            with profiling.measure("program output"):
+                write_json(
+                    program_output_json(assembled_program),
+                    out,
+                    compact=args.compact_json,
+                )
+                # Print a new line at the end.
+                print(file=out)
+
+            with profiling.measure("specification output"):
+                write_json(
+                    (
+                        horus_definition_json(specs, args.sexpr_format)
+                        if dump_specs is None
+                        else dump_specs(specs)
+                    ),
+                    specs_out,
+                    compact=args.compact_json,
+                )
+                # Print a new line at the end.
+                print(file=specs_out)
+
+            if profiler is not None:
+                profiler.count("annotations", profiling.count_annotations(specs))
+                profiler.count("SMT nodes", profiling.count_smt_nodes(specs))
+                profiler.count("bytes written", sum(writer.count for writer in writers))
 
         return preprocessed
     finally:
@@ -279,12 +182,23 @@ def horus_compile_common(
             )
 
 
-def cairo_compile_add_common_args(parser: argparse.ArgumentParser):
+def get_cairo_path(args: argparse.Namespace) -> List[str]:
+    return list(
+        filter(
+            None,
+            args.cairo_path.split(":") + os.getenv(LIBS_DIR_ENVVAR, "").split(":"),
+        )
+    )
+
+
+def cairo_compile_add_common_args(
+    parser: argparse.ArgumentParser, output_type: Callable[[str], Any]
+):
     parser.add_argument(
         "files",
         metavar="file",
         type=str,
-        nargs="+",
+        nargs="*",
         help="One or more Cairo programs to compile.",
     )
     parser.add_argument(
@@ -311,7 +225,7 @@ def cairo_compile_add_common_args(parser: argparse.ArgumentParser):
     )
     parser.add_argument(
         "--output",
-        type=argparse.FileType("w"),
+        type=output_type,
         help="The output file name (default: stdout).",
     )
     parser.add_argument(
@@ -339,14 +253,22 @@ def cairo_compile_add_common_args(parser: argparse.ArgumentParser):
     )
 
 
-def main(args):
+def get_arg_parser(open_outputs: bool = True) -> argparse.ArgumentParser:
+    """
+    Returns the parser of the command line arguments. If `open_outputs` is
+    False, the output files (--output, --spec_output and --abi) are kept as
+    names instead of being opened (and truncated).
+    """
+    output_type: Callable[[str], Any] = str
+    if open_outputs:
+        output_type = argparse.FileType("w")
     parser = argparse.ArgumentParser(
         description="A tool to compile checked StarkNet contracts.",
         conflict_handler="resolve",
     )
     parser.add_argument(
         "--abi",
-        type=argparse.FileType("w"),
+        type=output_type,
         help=(
             "Dump the contract's ABI (application binary interface) to a file. "
             "This is a JSON list containing metadata (like type signatures and members) "
@@ -363,45 +285,347 @@ def main(args):
         action="store_true",
         help="Compile as account contract, which means the ABI will be checked for expected builtin entry points.",
     )
+    parser.add_argument(
+        "--no_parser_cache",
+        dest="parser_cache",
+        action="store_false",
+        help="Don't load the Horus grammar parser tables from the on-disk cache (and don't write them there).",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        help=(
+            "The directory where the parser tables and the parsed Cairo files are cached "
+            "(default: $HORUS_CACHE_DIR, or horus-compile in the user's cache directory)."
+        ),
+    )
+    parser.add_argument(
+        "--no_ast_cache",
+        dest="ast_cache",
+        action="store_false",
+        help="Don't reuse parsed Cairo files from the cache directory (and don't store them there).",
+    )
+    parser.add_argument(
+        "--no_build_cache",
+        dest="build_cache",
+        action="store_false",
+        help=(
+            "Don't take the outputs from the cache directory when the sources, the versions "
+            "and the flags are the same as those of a previous compilation (and don't store "
+            "them there). The build cache is not used with --preprocess, --incremental and "
+            "--profile."
+        ),
+    )
     parser.add_argument(
         "--spec_output",
-        type=argparse.FileType("w"),
+        type=output_type,
         help="The specification output file name (default: stdout).",
     )
+    parser.add_argument(
+        "--sexpr_format",
+        choices=SEXPR_FORMATS,
+        default="pretty",
+        help=(
+            'The format of the formulas in the specification output: "pretty" (default) '
+            'is the pretty-printed form split into lines, "compact" is a single line '
+            "in which repeated subterms are bound by lets."
+        ),
+    )
+    parser.add_argument(
+        "--compact_json",
+        action="store_true",
+        help="Write the program and the specifications as JSON without indentation.",
+    )
+    parser.add_argument(
+        "--term_backend",
+        choices=TERM_BACKENDS,
+        default="z3",
+        help=(
+            'How the formulas are built: with z3 terms (default), or with "python" '
+            "terms, which are cheaper to build and produce the same output."
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "Print the time taken by every stage of the compilation, the peak of the memory "
+            "allocated by it (traced with tracemalloc, which slows the compilation down) and "
+            "the numbers of annotations, SMT nodes and bytes written to stderr."
+        ),
+    )
+    parser.add_argument(
+        "--profile_trace",
+        type=str,
+        metavar="TRACE_FILE",
+        help=(
+            "Profile the compilation as --profile does and write the stages and the counters "
+            "to TRACE_FILE in the Chrome trace event format."
+        ),
+    )
+    parser.add_argument(
+        "--incremental",
+        type=str,
+        metavar="STATE_FILE",
+        help=(
+            "Keep the specifications generated for every function in STATE_FILE, and only "
+            "generate them again for the functions (or the definitions they use) that changed "
+            "since the previous compilation. A full build is done whenever the bytecode changes."
+        ),
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        metavar="MANIFEST",
+        help=(
+            "Compile every contract listed in the JSON file MANIFEST in this process "
+            "and print how long each compilation took. Every contract is an object with "
+            'the fields "files", "output", "spec_output" and optionally "abi", "cairo_path" '
+            'and "flags" (additional command line arguments). Relative paths are resolved '
+            "against the directory of MANIFEST."
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="With --batch, the number of processes compiling the contracts (default: 1).",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=(
+            "Run as a compile server: read compile requests as JSON lines from stdin "
+            "and write the results as JSON lines to stdout. The parser and the parsed "
+            "Cairo modules are kept in memory between requests."
+        ),
+    )
+
+    cairo_compile_add_common_args(parser, output_type)
+    parser.add_argument(
+        "-v",
+        "--version",
+        action="version",
+        version=f"%(prog)s {horus.__version__}; cairo-compile {starkware.cairo.lang.version.__version__}",
+    )
+    return parser
 
-    def pass_manager_factory(
-        args: argparse.Namespace, module_reader: ModuleReader
-    ) -> PassManager:
-        return horus_pass_manager(
-            prime=args.prime,
-            read_module=module_reader.read,
-            opt_unused_functions=args.opt_unused_functions,
-            disable_hint_validation=args.disable_hint_validation,
-        )
 
+def pass_manager_factory(
+    args: argparse.Namespace,
+    module_reader: ModuleReader,
+    previous_fingerprints: Optional[Dict[ScopedName, str]] = None,
+) -> PassManager:
+    from horus.compiler.compile import horus_pass_manager
+
+    return horus_pass_manager(
+        prime=args.prime,
+        read_module=module_reader.read,
+        opt_unused_functions=args.opt_unused_functions,
+        disable_hint_validation=args.disable_hint_validation,
+        previous_fingerprints=previous_fingerprints,
+        term_backend=args.term_backend,
+    )
+
+
+def write_cached_build(
+    args: argparse.Namespace, entry: BuildCacheEntry, outputs: Dict[str, IO[str]]
+):
+    """
+    Writes the outputs of a compilation taken from the build cache, opened
+    by `BuildCache.open_outputs`.
+    """
+    out = args.output if args.output is not None else sys.stdout
+    specs_out = args.spec_output if args.spec_output is not None else sys.stdout
     try:
-        cairo_compile_add_common_args(parser)
-        parser.add_argument(
-            "-v",
-            "--version",
-            action="version",
-            version=f"%(prog)s {horus.__version__}; cairo-compile {starkware.cairo.lang.version.__version__}",
+        shutil.copyfileobj(outputs["program"], out)
+        shutil.copyfileobj(outputs["specs"], specs_out)
+        if args.abi is not None:
+            shutil.copyfileobj(outputs["abi"], args.abi)
+    finally:
+        for f in outputs.values():
+            f.close()
+    if args.cairo_dependencies:
+        from starkware.cairo.lang.compiler.cairo_compile import (
+            generate_cairo_dependencies_file,
+        )
+
+        generate_cairo_dependencies_file(
+            args.cairo_dependencies, set(entry.sources), time.time()
         )
-        args = parser.parse_args(args=args)
-        assemble_func = functools.partial(
-            assemble_horus_contract,
-            filter_identifiers=False,
-            is_account_contract=args.account_contract,
+
+
+def horus_compile(
+    args: argparse.Namespace, module_reader: Optional[ModuleReader] = None
+) -> Optional[PreprocessedProgram]:
+    """
+    Compiles the contract described by `args` and writes the program,
+    the specifications and the ABI to the requested outputs.
+    Returns None if the outputs were taken from the build cache.
+    """
+    from horus.compiler.build_cache import BuildCache, get_missing_files
+    from horus.compiler.cache import get_cache_dir
+
+    cache_dir = args.cache_dir if args.cache_dir is not None else get_cache_dir()
+    build_cache = None
+    if (
+        args.build_cache
+        and not args.preprocess
+        and args.incremental is None
+        and not args.profile
+        and args.profile_trace is None
+    ):
+        build_cache = BuildCache(cache_dir)
+        build_key = build_cache.get_key(args, get_cairo_path(args))
+        entry = build_cache.get(build_key)
+        outputs = build_cache.open_outputs(entry) if entry is not None else None
+        if entry is not None and outputs is not None:
+            write_cached_build(args, entry, outputs)
+            return None
+
+    from starkware.cairo.lang.compiler.cairo_compile import get_module_reader
+    from starkware.starknet.compiler.compile import get_abi
+
+    import horus.compiler.parser
+    from horus.compiler import profiling
+    from horus.compiler.compile import assemble_horus_contract
+    from horus.compiler.parser import get_gram_parser, make_parsed_file_cache
+
+    compile_args = args
+    recording = build_cache.record(build_key) if build_cache is not None else None
+    if recording is not None:
+        # The outputs are recorded for the build cache as they are written,
+        # and the module reader gives the source files they depend on.
+        if module_reader is None:
+            module_reader = get_module_reader(cairo_path=get_cairo_path(args))
+        compile_args = copy.copy(args)
+        compile_args.output = recording.writer(
+            "program", args.output if args.output is not None else sys.stdout
         )
-        preprocessed = horus_compile_common(
+        compile_args.spec_output = recording.writer(
+            "specs", args.spec_output if args.spec_output is not None else sys.stdout
+        )
+
+    get_gram_parser(use_cache=args.parser_cache, cache_dir=cache_dir)
+
+    # A cache set up by the caller (e.g. the compile server) takes precedence.
+    previous_parsed_file_cache = horus.compiler.parser.parsed_file_cache
+    if not args.ast_cache:
+        horus.compiler.parser.parsed_file_cache = None
+    elif previous_parsed_file_cache is None:
+        horus.compiler.parser.parsed_file_cache = make_parsed_file_cache(
+            in_memory=False, cache_dir=cache_dir
+        )
+
+    assemble_func = functools.partial(
+        assemble_horus_contract,
+        filter_identifiers=False,
+        is_account_contract=args.account_contract,
+    )
+
+    def compile_incremental_build(build: IncrementalBuild) -> PreprocessedProgram:
+        return horus_compile_common(
             args=args,
-            pass_manager_factory=pass_manager_factory,
-            assemble_func=assemble_func,
+            pass_manager_factory=functools.partial(
+                pass_manager_factory,
+                previous_fingerprints=build.get_previous_fingerprints(),
+            ),
+            assemble_func=build.wrap_assemble_func(assemble_func),
+            dump_specs=build.dump_specs,
+            module_reader=module_reader,
         )
-        abi = get_abi(preprocessed=preprocessed)
-        if args.abi is not None:
-            json.dump(abi, args.abi, indent=4, sort_keys=True)
-            args.abi.write("\n")
+
+    profiler = None
+    if args.profile or args.profile_trace is not None:
+        profiler = profiling.Profiler()
+    previous_profiler = profiling.active_profiler
+    profiling.active_profiler = profiler
+
+    try:
+        if args.incremental is not None and not args.preprocess:
+            from horus.compiler.incremental import compile_incrementally
+
+            preprocessed = compile_incrementally(
+                args.incremental, compile_incremental_build, args.sexpr_format
+            )
+        else:
+            preprocessed = horus_compile_common(
+                args=compile_args,
+                pass_manager_factory=pass_manager_factory,
+                assemble_func=assemble_func,
+                module_reader=module_reader,
+            )
+    except BaseException:
+        if recording is not None:
+            recording.discard()
+        raise
+    finally:
+        horus.compiler.parser.parsed_file_cache = previous_parsed_file_cache
+        profiling.active_profiler = previous_profiler
+    if profiler is not None:
+        print(profiler.format_table(), file=sys.stderr)
+        if args.profile_trace is not None:
+            profiler.write_trace(args.profile_trace)
+    abi = json.dumps(get_abi(preprocessed=preprocessed), indent=4, sort_keys=True)
+    if args.abi is not None:
+        args.abi.write(abi + "\n")
+    if recording is not None and module_reader is not None:
+        recording.write("abi", abi + "\n")
+        recording.commit(
+            sources=module_reader.source_files | set(args.files),
+            missing=get_missing_files(module_reader),
+        )
+    return preprocessed
+
+
+def main(args):
+    parser = get_arg_parser()
+    args = parser.parse_args(args=args)
+
+    if args.jobs != 1 and args.batch is None:
+        parser.error("--jobs requires --batch")
+
+    if args.serve:
+        if args.files:
+            parser.error("input files cannot be given together with --serve")
+        if args.batch is not None:
+            parser.error("--batch cannot be given together with --serve")
+
+        from horus.compiler.compile_server import serve
+
+        return serve(
+            sys.stdin,
+            sys.stdout,
+            use_parser_cache=args.parser_cache,
+            use_ast_cache=args.ast_cache,
+            cache_dir=args.cache_dir,
+            use_build_cache=args.build_cache,
+        )
+
+    if args.batch is not None:
+        if args.files:
+            parser.error("input files cannot be given together with --batch")
+        if args.jobs < 1:
+            parser.error("--jobs must be positive")
+
+        from horus.compiler.batch import compile_batch
+
+        return compile_batch(
+            args.batch,
+            use_parser_cache=args.parser_cache,
+            use_ast_cache=args.ast_cache,
+            cache_dir=args.cache_dir,
+            jobs=args.jobs,
+            use_build_cache=args.build_cache,
+        )
+
+    if not args.files:
+        parser.error("the following arguments are required: file")
+
+    from starkware.cairo.lang.compiler.error_handling import LocationError
+
+    try:
+        horus_compile(args)
     except LocationError as err:
         print(err, file=sys.stderr)
         return 1
@@ -409,4 +633,4 @@ def main(args):
 
 
 def run():
-    main(sys.argv[1:])
+    sys.exit(main(sys.argv[1:]))
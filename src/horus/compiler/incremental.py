@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import dataclasses
+import functools
+import hashlib
+import json
+from dataclasses import field
+from typing import Any, Callable, Dict, Optional, Sequence, Set, Tuple
+
+import marshmallow.fields as mfields
+import marshmallow_dataclass
+from starkware.cairo.lang.compiler.ast.cairo_types import (
+    CairoType,
+    TypeIdentifier,
+    TypePointer,
+    TypeStruct,
+    TypeTuple,
+)
+from starkware.cairo.lang.compiler.ast.code_elements import CodeElementFunction
+from starkware.cairo.lang.compiler.ast.expr import ExprIdentifier
+from starkware.cairo.lang.compiler.error_handling import Location
+from starkware.cairo.lang.compiler.identifier_definition import (
+    ConstDefinition,
+    FunctionDefinition,
+    StructDefinition,
+    TypeDefinition,
+)
+from starkware.cairo.lang.compiler.identifier_manager import IdentifierError
+from starkware.cairo.lang.compiler.scoped_name import ScopedName, ScopedNameAsStr
+from starkware.starknet.services.api.contract_class import ContractClass
+
+import horus
+from horus.compiler.cache import write_atomically
+from horus.compiler.code_elements import CodeElementAnnotation, CodeElementStorageUpdate
+from horus.compiler.contract_definition import encode_horus_definition
+
+
+@marshmallow_dataclass.dataclass(frozen=True)
+class FunctionState:
+    """
+    The specifications generated for a function by a previous compilation,
+    as they appear in the specification output.
+    """
+
+    fingerprint: str = field(metadata=dict(marshmallow_field=mfields.String()))
+    specification: Optional[Dict[str, Any]] = field(
+        metadata=dict(marshmallow_field=mfields.Raw(allow_none=True)), default=None
+    )
+    invariants: Dict[str, Any] = field(
+        metadata=dict(marshmallow_field=mfields.Dict(mfields.Str(), mfields.Raw())),
+        default_factory=dict,
+    )
+
+
+@marshmallow_dataclass.dataclass(frozen=True)
+class IncrementalState:
+    horus_version: str = field(metadata=dict(marshmallow_field=mfields.String()))
+    bytecode_digest: str = field(metadata=dict(marshmallow_field=mfields.String()))
+    sexpr_format: str = field(metadata=dict(marshmallow_field=mfields.String()))
+    functions: Dict[ScopedName, FunctionState] = field(
+        metadata=dict(
+            marshmallow_field=mfields.Dict(
+                ScopedNameAsStr(),
+                mfields.Nested(marshmallow_dataclass.class_schema(FunctionState)),
+            )
+        ),
+        default_factory=dict,
+    )
+
+
+IncrementalStateSchema = marshmallow_dataclass.class_schema(IncrementalState)
+
+
+class BytecodeChanged(Exception):
+    """
+    Raised when the specifications of some functions were reused, but
+    the bytecode differs from the one of the previous compilation.
+    """
+
+
+def load_state(path: str) -> Optional[IncrementalState]:
+    """
+    Returns the state written by a previous compilation, or None if
+    there is no usable state at `path`.
+    """
+    try:
+        with open(path) as f:
+            state: IncrementalState = IncrementalStateSchema().load(json.load(f))
+    except Exception:
+        # The state is missing, corrupted or was written by an incompatible
+        # version of horus-compile. In all these cases a full build is done.
+        return None
+    if state.horus_version != horus.__version__:
+        return None
+    return state
+
+
+def save_state(path: str, state: IncrementalState):
+    data = json.dumps(IncrementalStateSchema().dump(state), sort_keys=True)
+    write_atomically(path, data.encode())
+
+
+def get_bytecode_digest(contract: ContractClass) -> str:
+    program = contract.program
+    entry_points = sorted(
+        contract.entry_points_by_type.items(), key=lambda item: str(item[0].value)
+    )
+    return hashlib.sha256(
+        repr(
+            (
+                program.prime,
+                program.data,
+                sorted(program.hints.items()),
+                program.builtins,
+                entry_points,
+            )
+        ).encode()
+    ).hexdigest()
+
+
+def describe_ast(obj, names: Set[str]) -> str:
+    """
+    Returns a representation of `obj` without locations, and adds the names
+    of the identifiers and types it refers to to `names`.
+    """
+    if isinstance(obj, Location):
+        return ""
+    if isinstance(obj, (ExprIdentifier, TypeIdentifier)):
+        names.add(str(obj.name))
+    elif isinstance(obj, TypeStruct):
+        names.add(str(obj.scope))
+    elif isinstance(obj, CodeElementStorageUpdate):
+        names.add(obj.name)
+
+    if dataclasses.is_dataclass(obj):
+        fields = ",".join(
+            describe_ast(getattr(obj, f.name), names) for f in dataclasses.fields(obj)
+        )
+        return f"{type(obj).__name__}({fields})"
+    if isinstance(obj, (list, tuple)):
+        return "[" + ",".join(describe_ast(x, names) for x in obj) + "]"
+    return repr(obj)
+
+
+class DependencyDescriber:
+    """
+    Describes identifier definitions, together with the definitions they
+    refer to (e.g. the types of the members of a struct).
+    """
+
+    def __init__(self, identifiers, storage_vars: Dict[ScopedName, Any]):
+        self.identifiers = identifiers
+        self.storage_vars = storage_vars
+        self.descriptions: Dict[ScopedName, str] = {}
+
+    def describe_identifier(self, name: ScopedName):
+        if name in self.descriptions:
+            return
+        # Marks the identifier as visited before recursing.
+        self.descriptions[name] = ""
+
+        definition = self.identifiers.get_by_full_name(name)
+        if isinstance(definition, StructDefinition):
+            description = "struct " + ",".join(
+                f"{member_name}:{member.offset}:{member.cairo_type.format()}"
+                for member_name, member in definition.members.items()
+            )
+            for member in definition.members.values():
+                self.describe_type(member.cairo_type)
+        elif isinstance(definition, ConstDefinition):
+            description = f"const {definition.value}"
+        elif isinstance(definition, TypeDefinition):
+            description = f"type {definition.cairo_type.format()}"
+            self.describe_type(definition.cairo_type)
+        elif isinstance(definition, FunctionDefinition):
+            description = "func"
+            for suffix in ["Args", "ImplicitArgs", "Return"]:
+                self.describe_identifier(name + suffix)
+        else:
+            description = type(definition).__name__
+
+        storage_var_args = self.storage_vars.get(name)
+        if storage_var_args is not None:
+            description += " storage_var " + ",".join(
+                arg.format() for arg in storage_var_args.identifiers
+            )
+        self.descriptions[name] = description
+
+    def describe_type(self, cairo_type: CairoType):
+        if isinstance(cairo_type, TypeStruct):
+            self.describe_identifier(cairo_type.scope)
+        elif isinstance(cairo_type, TypePointer):
+            self.describe_type(cairo_type.pointee)
+        elif isinstance(cairo_type, TypeTuple):
+            for member in cairo_type.members:
+                self.describe_type(member.typ)
+
+
+def get_function_fingerprint(
+    preprocessor,
+    function: CodeElementFunction,
+    checks: Sequence[CodeElementAnnotation],
+) -> str:
+    """
+    Identifies everything the specifications of the function being visited
+    by `preprocessor` depend on, apart from the bytecode: the function and
+    the annotations before it (without their locations), the definitions
+    of the identifiers they refer to (transitively), the logical variables
+    in scope and the index of the next dummy label.
+    """
+    names: Set[str] = set()
+    code = describe_ast([function, *checks], names)
+
+    describer = DependencyDescriber(preprocessor.identifiers, preprocessor.storage_vars)
+    describer.describe_identifier(preprocessor.current_scope)
+    for name in sorted(names):
+        try:
+            result = preprocessor.identifiers.search(
+                preprocessor.accessible_scopes, ScopedName.from_string(name)
+            )
+        except IdentifierError:
+            # E.g. local references, which are covered by the code itself.
+            continue
+        describer.describe_identifier(result.canonical_name)
+
+    dependencies = sorted(
+        (str(name), description) for name, description in describer.descriptions.items()
+    )
+    logical_identifiers = sorted(
+        (name, cairo_type.format())
+        for name, cairo_type in preprocessor.logical_identifiers.items()
+    )
+    return hashlib.sha256(
+        repr(
+            (
+                code,
+                dependencies,
+                logical_identifiers,
+                preprocessor.current_fresh_index,
+            )
+        ).encode()
+    ).hexdigest()
+
+
+class IncrementalBuild:
+    """
+    Reuses the specifications of the functions that did not change since
+    the compilation that produced `state`, and collects the new state.
+    The formulas are dumped in `sexpr_format`; a state written in another
+    format is not used.
+    """
+
+    def __init__(self, state: Optional[IncrementalState], sexpr_format: str = "pretty"):
+        if state is not None and state.sexpr_format != sexpr_format:
+            state = None
+        self.state = state
+        self.sexpr_format = sexpr_format
+        self.new_state: Optional[IncrementalState] = None
+        self.bytecode_digest = ""
+        # The HorusProgram of the compilation.
+        self.preprocessed: Any = None
+
+    def get_previous_fingerprints(self) -> Dict[ScopedName, str]:
+        if self.state is None:
+            return {}
+        return {
+            name: function.fingerprint
+            for name, function in self.state.functions.items()
+        }
+
+    def wrap_assemble_func(self, assemble_func: Callable) -> Callable:
+        @functools.wraps(assemble_func)
+        def assemble(preprocessed, *args, **kwargs) -> Tuple[ContractClass, Any]:
+            contract, specs = assemble_func(preprocessed, *args, **kwargs)
+            self.preprocessed = preprocessed
+            self.bytecode_digest = get_bytecode_digest(contract)
+            if preprocessed.reused_functions and (
+                self.state is None or self.state.bytecode_digest != self.bytecode_digest
+            ):
+                raise BytecodeChanged()
+            return contract, specs
+
+        return assemble
+
+    def dump_specs(self, specs) -> Dict[str, Any]:
+        """
+        Dumps `specs`, replacing the specifications of the reused functions
+        with the ones from the previous compilation.
+        """
+        data = encode_horus_definition(specs, self.sexpr_format)
+        specifications: Dict[str, Any] = data["specifications"]
+        invariants: Dict[str, Any] = data["invariants"]
+
+        # Invariants (including the ones of @assert annotations) are keyed by
+        # the name of a label in the function.
+        invariants_by_function: Dict[str, Dict[str, Any]] = {}
+        for name, invariant in invariants.items():
+            function_name = name.rpartition(".")[0]
+            invariants_by_function.setdefault(function_name, {})[name] = invariant
+
+        functions: Dict[ScopedName, FunctionState] = {}
+        for name, fingerprint in self.preprocessed.function_fingerprints.items():
+            function_invariants = invariants_by_function.get(str(name), {})
+            if name not in self.preprocessed.reused_functions:
+                functions[name] = FunctionState(
+                    fingerprint=fingerprint,
+                    specification=specifications.get(str(name)),
+                    invariants=function_invariants,
+                )
+                continue
+
+            assert self.state is not None
+            previous = self.state.functions[name]
+            for invariant_name in function_invariants:
+                del invariants[invariant_name]
+            invariants.update(previous.invariants)
+            specifications.pop(str(name), None)
+            if previous.specification is not None:
+                specifications[str(name)] = previous.specification
+            functions[name] = previous
+
+        self.new_state = IncrementalState(
+            horus_version=horus.__version__,
+            bytecode_digest=self.bytecode_digest,
+            sexpr_format=self.sexpr_format,
+            functions=functions,
+        )
+        return data
+
+
+def compile_incrementally(
+    state_file: str,
+    compile_func: Callable[[IncrementalBuild], Any],
+    sexpr_format: str = "pretty",
+):
+    """
+    Runs `compile_func` with an IncrementalBuild for the state in
+    `state_file`, and runs it again with a full build if the bytecode
+    changed. The new state is written back to `state_file`.
+    """
+    build = IncrementalBuild(load_state(state_file), sexpr_format)
+    try:
+        preprocessed = compile_func(build)
+    except BytecodeChanged:
+        build = IncrementalBuild(None, sexpr_format)
+        preprocessed = compile_func(build)
+
+    if build.new_state is not None:
+        save_state(state_file, build.new_state)
+    return preprocessed
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+from json.encoder import encode_basestring_ascii  # type: ignore
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import marshmallow
+from starkware.cairo.lang.compiler.program import Program
+from starkware.starknet.services.api.contract_class import ContractClass
+
+from horus.compiler.contract_definition import (
+    HorusDefinition,
+    encode_function_annotations,
+    encode_horus_definition,
+)
+
+INDENT = " " * 4
+COMPACT_SEPARATORS = (",", ":")
+
+
+class JsonObject:
+    """
+    A JSON object whose members are computed while it is written, given as
+    (key, value) pairs in the order of their keys, so that a large output
+    doesn't have to be held in memory at once.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, Any]]):
+        self.items = items
+
+
+def write_json(value: Any, out: IO[str], compact: bool = False):
+    """
+    Writes `value` to `out` as `json.dump(value, out, indent=4, sort_keys=True)`
+    does, or without whitespace if `compact`. The members of JsonObject values
+    are written as they are computed.
+    """
+    if compact:
+        _write_compact(value, out)
+    else:
+        _write_indented(value, out, "\n")
+
+
+def _encode_scalar(value: Any) -> str:
+    if type(value) is str:
+        result: str = encode_basestring_ascii(value)
+        return result
+    return json.dumps(value)
+
+
+def _is_scalar(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float))
+
+
+def _write_compact(value: Any, out: IO[str]):
+    if not isinstance(value, JsonObject):
+        out.write(json.dumps(value, separators=COMPACT_SEPARATORS, sort_keys=True))
+        return
+
+    out.write("{")
+    for i, (key, member) in enumerate(value.items):
+        if i:
+            out.write(",")
+        out.write(encode_basestring_ascii(key) + ":")
+        _write_compact(member, out)
+    out.write("}")
+
+
+def _write_indented(value: Any, out: IO[str], newline: str):
+    """
+    Writes `value` at the indentation of `newline` (a line break followed
+    by the indentation of the current line).
+    """
+    inner_newline = newline + INDENT
+    if isinstance(value, JsonObject):
+        items: Iterable[Tuple[str, Any]] = value.items
+    elif isinstance(value, dict):
+        items = sorted(value.items())
+    elif isinstance(value, (list, tuple)):
+        if not value:
+            out.write("[]")
+        elif all(_is_scalar(element) for element in value):
+            # The common case of long lists (e.g. the bytecode), without
+            # a call per element.
+            separator = "," + inner_newline
+            out.write("[" + inner_newline + separator.join(map(_encode_scalar, value)))
+            out.write(newline + "]")
+        else:
+            out.write("[")
+            for i, element in enumerate(value):
+                out.write(("," if i else "") + inner_newline)
+                _write_indented(element, out, inner_newline)
+            out.write(newline + "]")
+        return
+    else:
+        out.write(_encode_scalar(value))
+        return
+
+    empty = True
+    for key, member in items:
+        out.write(("{" if empty else ",") + inner_newline)
+        out.write(encode_basestring_ascii(str(key)) + ": ")
+        _write_indented(member, out, inner_newline)
+        empty = False
+    out.write("{}" if empty else newline + "}")
+
+
+def _dump_fields(
+    schema: marshmallow.Schema, obj: Any, lazy_fields: Optional[Dict[str, Any]] = None
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Yields the fields of `obj`, serialized one by one by `schema`, in the
+    order of their keys. The values of `lazy_fields` are yielded instead
+    of the serialized fields with the same names.
+    """
+    lazy_fields = lazy_fields or {}
+    fields = sorted(
+        (field.data_key if field.data_key is not None else name, name, field)
+        for name, field in schema.dump_fields.items()
+    )
+    for key, name, field in fields:
+        if name in lazy_fields:
+            yield key, lazy_fields[name]
+            continue
+        value = field.serialize(name, obj)
+        if value is not marshmallow.missing:
+            yield key, value
+
+
+def program_output_json(assembled_program: Any) -> Any:
+    """
+    Returns `assembled_program.Schema().dump(assembled_program)`, whose
+    program is serialized section by section if it is a ContractClass.
+    """
+    if not isinstance(assembled_program, ContractClass):
+        return assembled_program.Schema().dump(assembled_program)
+    contract_class = assembled_program
+
+    def program_sections(program: Program) -> Iterator[Tuple[str, Any]]:
+        for key, value in _dump_fields(Program.Schema(), program):
+            # As the post_dump hook of Program.
+            if key == "compiler_version" and value is None:
+                continue
+            yield key, value
+
+    return JsonObject(
+        _dump_fields(
+            ContractClass.Schema(),
+            contract_class,
+            lazy_fields=dict(
+                program=JsonObject(program_sections(contract_class.program))
+            ),
+        )
+    )
+
+
+def horus_definition_json(
+    specs: HorusDefinition, sexpr_format: str = "pretty"
+) -> JsonObject:
+    """
+    Returns `encode_horus_definition(specs, sexpr_format)`, whose
+    specifications are serialized function by function.
+    """
+
+    def specifications() -> Iterator[Tuple[str, Any]]:
+        for name in sorted(specs.specifications, key=str):
+            yield str(name), encode_function_annotations(
+                specs.specifications[name], sexpr_format
+            )
+
+    data = encode_horus_definition(
+        dataclasses.replace(specs, specifications={}), sexpr_format
+    )
+    data["specifications"] = JsonObject(specifications())
+    return JsonObject(sorted(data.items(), key=lambda item: item[0]))
@@ -1,15 +1,34 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import os
 from importlib import resources
-from typing import Optional, Tuple, Union
+from typing import List, Optional, Tuple, Union
 
 import lark
+import starkware.cairo.lang.version
 from lark.exceptions import LarkError, UnexpectedToken, VisitError
 from lark.load_grammar import PackageResource
+from starkware.cairo.lang.compiler.ast.code_elements import CommentedCodeElement
 from starkware.cairo.lang.compiler.error_handling import InputFile, LocationError
 from starkware.cairo.lang.compiler.parser import wrap_lark_error
 from starkware.cairo.lang.compiler.parser_transformer import ParserContext
 
+import horus
+from horus.compiler import profiling
+from horus.compiler.cache import (
+    LRUFileCache,
+    ParsedFileCache,
+    get_cache_dir,
+    write_atomically,
+)
+from horus.compiler.code_elements import (
+    AnnotatedCodeElement,
+    CodeElementAnnotation,
+    CodeElementCheck,
+    CodeElementStorageUpdate,
+)
 from horus.compiler.parser_transformer import HorusTransformer
 
 
@@ -34,8 +53,7 @@ def starkware_grammar_loader(
 
 
 grammar = resources.read_text("horus.compiler", "horus.ebnf")
-gram_parser = lark.Lark(
-    grammar,
+PARSER_OPTIONS = dict(
     start=[
         "cairo_file",
         "code_block",
@@ -49,9 +67,106 @@ gram_parser = lark.Lark(
     lexer="basic",
     parser="lalr",
     propagate_positions=True,
-    import_paths=[starkware_grammar_loader],
 )
 
+_gram_parser: Optional[lark.Lark] = None
+
+# When set, parsed Cairo files are looked up here before being parsed.
+parsed_file_cache: Optional[ParsedFileCache] = None
+
+AST_CACHE_MAX_SIZE = 256 * 2**20
+
+
+def build_gram_parser() -> lark.Lark:
+    return lark.Lark(grammar, import_paths=[starkware_grammar_loader], **PARSER_OPTIONS)
+
+
+def get_grammar_key() -> str:
+    """
+    Identifies everything the parser tables and the produced ASTs depend on:
+    the Horus grammar, the Cairo grammar it imports (which is determined by
+    the cairo-lang version), the parser options and the version of lark.
+    """
+    return hashlib.sha256(
+        "\0".join(
+            [
+                grammar,
+                repr(sorted(PARSER_OPTIONS.items())),
+                starkware.cairo.lang.version.__version__,
+                lark.__version__,
+            ]
+        ).encode()
+    ).hexdigest()
+
+
+def get_parser_cache_path(cache_dir: Optional[str] = None) -> str:
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    return os.path.join(cache_dir, "parser", f"{get_grammar_key()}.pickle")
+
+
+def load_gram_parser(
+    use_cache: bool = True, cache_dir: Optional[str] = None
+) -> lark.Lark:
+    """
+    Returns the Horus grammar parser, loading the LALR tables from the
+    on-disk cache when possible. A missing or unreadable cache entry
+    falls back to building the parser from the grammar.
+    """
+    if not use_cache:
+        return build_gram_parser()
+
+    cache_path = get_parser_cache_path(cache_dir)
+    try:
+        with open(cache_path, "rb") as f:
+            return lark.Lark.load(f)
+    except Exception:
+        # The entry is missing, corrupted or was written by an incompatible
+        # version of lark. In all these cases it is rebuilt below.
+        pass
+
+    parser = build_gram_parser()
+    try:
+        buffer = io.BytesIO()
+        parser.save(buffer)
+        write_atomically(cache_path, buffer.getvalue())
+    except OSError:
+        # Failing to write the cache must not fail the compilation.
+        pass
+    return parser
+
+
+def get_gram_parser(
+    use_cache: bool = True, cache_dir: Optional[str] = None
+) -> lark.Lark:
+    """
+    Returns the parser, building it on the first call.
+    The arguments only matter for the first call.
+    """
+    global _gram_parser
+    if _gram_parser is None:
+        _gram_parser = load_gram_parser(use_cache, cache_dir)
+    return _gram_parser
+
+
+def make_parsed_file_cache(
+    in_memory: bool, cache_dir: Optional[str] = None
+) -> ParsedFileCache:
+    """
+    Creates a cache of parsed Cairo files. If `cache_dir` is given, the parsed
+    files are also stored on disk, so they can be reused across compilations.
+    """
+    disk_cache = None
+    if cache_dir is not None:
+        disk_cache = LRUFileCache(
+            os.path.join(cache_dir, "ast"), max_size=AST_CACHE_MAX_SIZE
+        )
+    return ParsedFileCache(
+        salt=f"{get_grammar_key()}\0{horus.__version__}",
+        in_memory=in_memory,
+        disk_cache=disk_cache,
+    )
+
 
 def parse(
     filename: Optional[str],
@@ -61,21 +176,48 @@ def parse(
     parser_context: Optional[ParserContext] = None,
 ):
     """
-    Copy-pasted function from StarkWare's compiler with only
-    difference is that we use `HorusTransformer`
-    instead of `ParserTranformer` and do some manipulations
-    with logical identifier tokens.
+    Parses `code`, reusing the result from `parsed_file_cache` for
+    whole Cairo files when possible.
     """
-    is_parsing_check = code_type == "annotation"
-    input_file = InputFile(filename=filename, content=code)
-    parser_transformer = HorusTransformer(
-        input_file, parser_context=parser_context, is_parsing_check=is_parsing_check
-    )
+    if code_type != "cairo_file" or parsed_file_cache is None:
+        return parse_code(filename, code, code_type, expected_type, parser_context)
+
+    key = parsed_file_cache.get_key(filename, code, parser_context)
+    parsed = parsed_file_cache.get(key)
+    if parsed is None:
+        parsed = parse_code(filename, code, code_type, expected_type, parser_context)
+        parsed_file_cache.set(key, parsed)
+    return parsed
+
+
+def get_parser_state_before(code: str, code_type: str, n_tokens: int):
+    """
+    Returns an interactive parser that has been fed the first `n_tokens`
+    tokens of `code`.
+    """
+    parser = get_gram_parser().parse_interactive(code, start=code_type)
+    for _, token in zip(range(n_tokens), parser.lexer_state.lex(parser.parser_state)):
+        parser.feed_token(token)
+    return parser
+
+
+def parse_tree(
+    code: str, code_type: str, input_file: InputFile, is_parsing_check: bool
+) -> lark.Tree:
+    """
+    Parses `code` with the interactive parser, rejecting logical identifiers
+    outside of annotations.
 
-    parser = gram_parser.parse_interactive(code, start=code_type)
+    `feed_token` may perform reductions before it rejects a token, so on
+    an `UnexpectedToken` error the parser state preceding the error is
+    recovered by feeding the accepted tokens to a new parser, rather than
+    by copying the state stacks before every token.
+    """
+    parser = get_gram_parser().parse_interactive(code, start=code_type)
     parser_state = parser.parser_state
-    old_state_stack = list(parser_state.state_stack)
-    old_value_stack = list(parser_state.value_stack)
+    n_tokens = 0
+    # The number of tokens fed to the parser in the state reported on error.
+    n_error_tokens = 0
     try:
         token = None
         for token in parser.lexer_state.lex(parser_state):
@@ -87,32 +229,109 @@ def parse(
                 if token.type == "LOGICAL_IDENTIFIER":
                     accepts = parser.accepts()
                     accepts.remove("LOGICAL_IDENTIFIER")
+                    n_error_tokens = max(n_tokens - 1, 0)
                     raise UnexpectedToken(token=token, expected=accepts)  # type: ignore
 
-            old_state_stack = list(parser_state.state_stack)
-            old_value_stack = list(parser_state.value_stack)
+            n_error_tokens = n_tokens
             parser.feed_token(token)
-        old_state_stack = list(parser_state.state_stack)
-        old_value_stack = list(parser_state.value_stack)
-        tree = parser.feed_eof(last_token=token)
+            n_tokens += 1
+        n_error_tokens = n_tokens
+        tree: lark.Tree = parser.feed_eof(last_token=token)
     except UnexpectedToken as err:
-        # Restore the old state stack.
-        parser_state.state_stack = old_state_stack
-        parser_state.value_stack = old_value_stack
-        err.interactive_parser = parser
+        err.interactive_parser = get_parser_state_before(
+            code, code_type, n_error_tokens
+        )
         raise wrap_lark_error(err, input_file) from None
     except LarkError as err:
         raise wrap_lark_error(err, input_file) from None
 
+    return tree
+
+
+def parse_code(
+    filename: Optional[str],
+    code: str,
+    code_type: str,
+    expected_type,
+    parser_context: Optional[ParserContext] = None,
+):
+    """
+    Copy-pasted function from StarkWare's compiler with only
+    difference is that we use `HorusTransformer`
+    instead of `ParserTranformer` and do some manipulations
+    with logical identifier tokens.
+    """
+    is_parsing_check = code_type == "annotation"
+    input_file = InputFile(filename=filename, content=code)
+    parser_transformer = HorusTransformer(
+        input_file, parser_context=parser_context, is_parsing_check=is_parsing_check
+    )
+
+    tree = parse_tree(code, code_type, input_file, is_parsing_check)
+    parsed = transform_tree(parser_transformer, tree)
+    assert isinstance(
+        parsed, expected_type
+    ), f"Expected parsing result to be {expected_type.__name__}. Found: {type(parsed).__name__}"
+
+    parse_annotations(filename, parser_transformer.pending_annotations, parser_context)
+    return parsed
+
+
+def transform_tree(parser_transformer: HorusTransformer, tree: lark.Tree):
     try:
-        parsed = parser_transformer.transform(tree)
+        return parser_transformer.transform(tree)
     except VisitError as err:
         if isinstance(err.orig_exc, LocationError):
             raise err.orig_exc
         else:
             raise
-    assert isinstance(
-        parsed, expected_type
-    ), f"Expected parsing result to be {expected_type.__name__}. Found: {type(parsed).__name__}"
 
-    return parsed
+
+def parse_annotations(
+    filename: Optional[str],
+    annotations: List[Tuple[CommentedCodeElement, str]],
+    parser_context: Optional[ParserContext] = None,
+):
+    """
+    Parses the annotation comments found in a file and attaches them to
+    their code elements. The annotations are parsed one after the other
+    with a single transformer, instead of starting a nested parse from
+    the transformer of the file for every comment.
+
+    As before, the locations of an annotation are relative to
+    the annotation itself. The parse time of the annotations of each file
+    is reported to the profiler of the compilation.
+    """
+    if not annotations:
+        return
+
+    with profiling.measure(f"annotation parsing: {filename}"):
+        parse_annotations_of_file(filename, annotations, parser_context)
+    profiling.count("parsed annotations", len(annotations))
+
+
+def parse_annotations_of_file(
+    filename: Optional[str],
+    annotations: List[Tuple[CommentedCodeElement, str]],
+    parser_context: Optional[ParserContext],
+):
+    parser_transformer = HorusTransformer(
+        InputFile(filename=filename, content=None),
+        parser_context=parser_context,
+        is_parsing_check=True,
+    )
+    for code_elem, annotation in annotations:
+        input_file = InputFile(filename=filename, content=annotation)
+        parser_transformer.input_file = input_file
+        # Every annotation gets an interactive parser of its own: lark can't
+        # reset one to new text, and creating it is about 2% of the parse.
+        tree = parse_tree(annotation, "annotation", input_file, is_parsing_check=True)
+        check = transform_tree(parser_transformer, tree)
+        assert isinstance(
+            check, CodeElementAnnotation
+        ), f"Expected parsing result to be {CodeElementAnnotation.__name__}. Found: {type(check).__name__}"
+
+        if isinstance(check, (CodeElementCheck, CodeElementStorageUpdate)):
+            check.unpreprocessed_rep = " ".join(annotation.split(" ")[1:])
+
+        code_elem.code_elm = AnnotatedCodeElement(check, code_elm=code_elem.code_elm)
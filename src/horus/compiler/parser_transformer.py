@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import lark
+from starkware.cairo.lang.compiler.ast.code_elements import CommentedCodeElement
 from starkware.cairo.lang.compiler.ast.expr import *
 from starkware.cairo.lang.compiler.ast.expr import ExprIdentifier
 from starkware.cairo.lang.compiler.error_handling import InputFile
@@ -12,15 +13,12 @@ from starkware.cairo.lang.compiler.parser_transformer import (
     ParserTransformer,
 )
 
-import horus.compiler.parser
 from horus.compiler.code_elements import (
-    AnnotatedCodeElement,
     BoolConst,
     BoolExprAtom,
     BoolExprCompare,
     BoolNegation,
     BoolOperation,
-    CodeElementAnnotation,
     CodeElementCheck,
     CodeElementLogicalVariableDeclaration,
     CodeElementStorageUpdate,
@@ -41,6 +39,10 @@ class HorusTransformer(ParserTransformer):
         is_parsing_check: bool = False,
     ):
         self.is_parsing_check = is_parsing_check
+        # Annotation comments and the code elements they are attached to.
+        # They are parsed together once the whole code is transformed,
+        # see `horus.compiler.parser.parse_annotations`.
+        self.pending_annotations: List[Tuple[CommentedCodeElement, str]] = []
         super().__init__(input_file, parser_context)
 
     @lark.v_args(meta=True)
@@ -62,23 +64,8 @@ class HorusTransformer(ParserTransformer):
                     "@declare",
                     "@storage_update",
                 ]:
-                    check = horus.compiler.parser.parse(
-                        filename=self.input_file.filename,
-                        code=possible_annotation,
-                        code_type="annotation",
-                        expected_type=CodeElementAnnotation,
-                        parser_context=self.parser_context,
-                    )
-
-                    if isinstance(check, (CodeElementCheck, CodeElementStorageUpdate)):
-                        check.unpreprocessed_rep = " ".join(
-                            possible_annotation.split(" ")[1:]
-                        )
-
                     code_elem = super().commented_code_element(meta, [value[0], None])
-                    code_elem.code_elm = AnnotatedCodeElement(
-                        check, code_elm=code_elem.code_elm
-                    )
+                    self.pending_annotations.append((code_elem, possible_annotation))
                     return code_elem
                 else:
                     raise ParserError(
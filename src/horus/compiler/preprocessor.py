@@ -1,7 +1,7 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
 
 from starkware.cairo.lang.compiler.ast.arguments import IdentifierList
 from starkware.cairo.lang.compiler.ast.code_elements import (
@@ -27,6 +27,7 @@ from starkware.starknet.compiler.starknet_preprocessor import (
     StarknetPreprocessor,
 )
 
+from horus.compiler import profiling
 from horus.compiler.code_elements import (
     AnnotatedCodeElement,
     CodeElementAnnotation,
@@ -36,12 +37,17 @@ from horus.compiler.code_elements import (
 )
 from horus.compiler.contract_definition import (
     Annotation,
+    AnnotationBuilder,
     FunctionAnnotations,
     StorageUpdate,
 )
+from horus.compiler.frame_layout import FrameLayout
+from horus.compiler.incremental import get_function_fingerprint
 from horus.compiler.parser import *
+from horus.compiler.storage_vars import StorageVarIndex
+from horus.compiler.terms import TermDeclarations
+from horus.compiler.z3_declarations import Declarations, Z3Declarations
 from horus.compiler.z3_transformer import *
-from horus.utils import get_decls
 
 PRE_COND = CodeElementCheck.CheckKind.PRE_COND
 POST_COND = CodeElementCheck.CheckKind.POST_COND
@@ -54,15 +60,41 @@ class HorusProgram(StarknetPreprocessedProgram):
     specifications: Dict[ScopedName, FunctionAnnotations]
     invariants: Dict[ScopedName, Annotation]
     storage_vars: Dict[ScopedName, int]
+    # Only collected when `previous_fingerprints` is given to the preprocessor.
+    function_fingerprints: Dict[ScopedName, str] = field(default_factory=dict)
+    reused_functions: Set[ScopedName] = field(default_factory=set)
 
 
 class HorusPreprocessor(StarknetPreprocessor):
     def __init__(self, **kwargs):
         self.storage_vars: Dict[ScopedName, IdentifierList] = kwargs.pop("storage_vars")
+        # The signatures of `storage_vars` (see `build_storage_var_index`),
+        # which the annotations are checked and translated with.
+        self.storage_var_index: StorageVarIndex = kwargs.pop("storage_var_index", {})
+        # The fingerprints of the functions whose specifications were generated
+        # by the previous compilation (see `horus.compiler.incremental`).
+        # The annotations of a function with the same fingerprint are not
+        # compiled again. If None, fingerprints are not computed.
+        self.previous_fingerprints: Optional[Dict[ScopedName, str]] = kwargs.pop(
+            "previous_fingerprints", None
+        )
+        # The representation of the terms of the formulas, "z3" or "python"
+        # (see `horus.compiler.terms`).
+        term_backend = kwargs.pop("term_backend", "z3")
         super().__init__(**kwargs)
         self.specifications: Dict[ScopedName, FunctionAnnotations] = {}
         self.invariants: Dict[ScopedName, Annotation] = {}
+        # The checks of the preconditions, postconditions and invariants,
+        # joined into the annotations of `specifications` and `invariants`
+        # by `get_program`.
+        self.pre_builders: Dict[ScopedName, AnnotationBuilder] = {}
+        self.post_builders: Dict[ScopedName, AnnotationBuilder] = {}
+        self.invariant_builders: Dict[ScopedName, AnnotationBuilder] = {}
         self.logical_identifiers: Dict[str, CairoType] = {}
+        self.declarations: Declarations = (
+            TermDeclarations() if term_backend == "python" else Z3Declarations()
+        )
+        self.resolution_cache = ResolutionCache()
 
         # This is used to defer pre/postcondition unfolding
         # until the visitor steps into the body of the function
@@ -73,14 +105,33 @@ class HorusPreprocessor(StarknetPreprocessor):
         # Used for dummy labels
         self.current_fresh_index: int = 0
 
+        self.current_function_element: Optional[CodeElementFunction] = None
+        self.function_fingerprints: Dict[ScopedName, str] = {}
+        self.reused_functions: Set[ScopedName] = set()
+        self.reuse_current_function = False
+        # The layout of the frame of the function whose body is visited,
+        # which postconditions are lowered with.
+        self.frame_layout: Optional[FrameLayout] = None
+        self.translation_session: Optional[TranslationSession] = None
+
     def get_program(self) -> HorusProgram:
         starknet_program = super().get_program()
 
+        profiling.count("identifier resolution cache hits", self.resolution_cache.hits)
+        profiling.count(
+            "identifier resolution cache misses", self.resolution_cache.misses
+        )
+        for scope, builder in self.pre_builders.items():
+            self.specifications[scope].pre = builder.build(self.declarations)
+        for scope, builder in self.post_builders.items():
+            self.specifications[scope].post = builder.build(self.declarations)
+        for label, builder in self.invariant_builders.items():
+            self.invariants[label] = builder.build(self.declarations)
+
         for specification in self.specifications.values():
-            specification.decls = {
-                **get_decls(specification.pre.sexpr),
-                **get_decls(specification.post.sexpr),
-            }
+            specification.decls = self.declarations.get_decls(
+                specification.pre.sexpr, specification.post.sexpr
+            )
             for var in HORUS_DECLS.keys():
                 specification.decls.pop(var, None)
 
@@ -103,6 +154,8 @@ class HorusPreprocessor(StarknetPreprocessor):
             specifications=self.specifications,
             invariants=self.invariants,
             storage_vars=storage_vars,
+            function_fingerprints=self.function_fingerprints,
+            reused_functions=self.reused_functions,
         )
 
     def visit_CodeBlock(self, code_block: CodeBlock):
@@ -126,19 +179,39 @@ class HorusPreprocessor(StarknetPreprocessor):
             name=self.current_scope + name,
             definition=FutureIdentifierDefinition(identifier_type=LabelDefinition),
         )
+        self.resolution_cache.clear()
         self.add_label(ExprIdentifier(name))
-        z3_transformer = Z3Transformer(
-            self.identifiers,
-            self,
-            self.logical_identifiers,
-            self.storage_vars,
-            is_post=False,
+        if self.reuse_current_function:
+            return
+
+        self.add_check(
+            assrt,
+            self.invariant_builders.setdefault(
+                self.current_scope + name, AnnotationBuilder()
+            ),
         )
-        expr = z3_transformer.visit(assrt.formula)
-        self.invariants[self.current_scope + name] = Annotation(
-            sexpr=expr,
-            source=[assrt.unpreprocessed_rep],
+
+    def translate_check(self, check: CodeElementCheck):
+        z3_transformer = self.get_translation_session().get_transformer(
+            check.check_kind == POST_COND, self.logical_identifiers
         )
+        return z3_transformer.visit(check.formula)
+
+    def get_translation_session(self) -> TranslationSession:
+        """
+        Returns the session translating the checks of the current function,
+        which ends when the preprocessor leaves its body.
+        """
+        if self.translation_session is None:
+            self.translation_session = TranslationSession(
+                self, self.storage_var_index, self.declarations, self.resolution_cache
+            )
+        return self.translation_session
+
+    def add_check(self, check: CodeElementCheck, builder: AnnotationBuilder):
+        with profiling.measure("annotation translation"):
+            expr = self.translate_check(check)
+        builder.add(Annotation(sexpr=expr, source=[check.unpreprocessed_rep]))
 
     def visit_AnnotatedCodeElement(self, annotated_code_element: AnnotatedCodeElement):
         if isinstance(annotated_code_element.annotation, CodeElementCheck):
@@ -222,49 +295,38 @@ class HorusPreprocessor(StarknetPreprocessor):
             self.specifications[self.current_scope] = current_annotations
 
         self.logical_identifiers[declaration.name] = declaration.type
+        self.resolution_cache.clear()
 
     def add_state_change(self, decl: CodeElementStorageUpdate):
-        z3_transformer = Z3Transformer(
-            self.identifiers,
-            self,
-            self.logical_identifiers,
-            self.storage_vars,
-            is_post=True,
-        )
-        z3_expr_transformer = Z3ExpressionTransformer(
-            identifiers=self.identifiers, z3_transformer=z3_transformer
+        z3_transformer = self.get_translation_session().get_transformer(
+            True, self.logical_identifiers
         )
+        z3_expr_transformer = z3_transformer.z3_expression_transformer
 
         decl_full_name = self.identifiers.search(
             self.accessible_scopes, ScopedName.from_string(decl.name)
         ).canonical_name
 
-        if not decl_full_name in self.storage_vars:
+        storage_var = self.storage_var_index.get(decl_full_name)
+        if storage_var is None:
             raise PreprocessorError(
                 f"{decl_full_name} is not a storage variable", location=decl.location
             )
 
-        storage_var_args = get_struct_definition(
-            decl_full_name + "read" + "Args", self.identifiers
-        )
-        assert isinstance(storage_var_args, StructDefinition)
-
-        if len(storage_var_args.members) != len(decl.arguments.args):
+        if storage_var.arity != len(decl.arguments.args):
             raise PreprocessorError(
                 f"Incorrect number of arguments for a storage map.",
                 location=decl.location,
             )
 
-        for storage_def in storage_var_args.members.values():
+        for argument_type in storage_var.argument_types:
             assert isinstance(
-                storage_def.cairo_type, TypeFelt
+                argument_type, TypeFelt
             ), "Non-felt arguments of storage maps are not supported yet."
 
         args = []
-        for [storage_arg_name, storage_def], arg in zip(
-            storage_var_args.members.items(), decl.arguments.args
-        ):
-            if arg.identifier and arg.identifier.name != storage_arg_name:
+        for storage_arg, arg in zip(storage_var.arguments, decl.arguments.args):
+            if arg.identifier and arg.identifier.name != storage_arg.identifier.name:
                 raise PreprocessorError(
                     f"Wrong argument name: {arg.identifier.name}",
                     location=decl.location,
@@ -274,8 +336,9 @@ class HorusPreprocessor(StarknetPreprocessor):
                 arg.expr,
                 self,
                 self.logical_identifiers,
-                self.storage_vars,
+                self.storage_var_index,
                 is_post=True,
+                cache=z3_transformer.simplify_cache,
             )
 
             if not isinstance(arg_type, TypeFelt):
@@ -296,8 +359,9 @@ class HorusPreprocessor(StarknetPreprocessor):
                     decl.value,
                     self,
                     self.logical_identifiers,
-                    self.storage_vars,
+                    self.storage_var_index,
                     is_post=True,
+                    cache=z3_transformer.simplify_cache,
                 )
             ),
             decl.unpreprocessed_rep,
@@ -310,22 +374,28 @@ class HorusPreprocessor(StarknetPreprocessor):
         def append_check(
             check_kind: CodeElementCheck.CheckKind,
             key: Optional[ScopedName],
-            check: Annotation,
+            check: CodeElementCheck,
         ):
             current_annotations = self.specifications.get(
                 self.current_scope, FunctionAnnotations()
             )
             if check_kind == PRE_COND:
-                current_annotations.pre = current_annotations.pre & check
+                builders = self.pre_builders
+                key = self.current_scope
             elif check_kind == POST_COND:
-                current_annotations.post = current_annotations.post & check
+                builders = self.post_builders
+                key = self.current_scope
             elif check_kind == INVARIANT:
                 assert key is not None
-                current_invariant = self.invariants.get(key, Annotation())
-                self.invariants[key] = current_invariant & check
+                builders = self.invariant_builders
+            self.add_check(check, builders.setdefault(key, AnnotationBuilder()))
 
             self.specifications[self.current_scope] = current_annotations
 
+        if self.reuse_current_function:
+            self.current_checks = []
+            return
+
         for parsed_check in self.current_checks:
             try:
                 if (
@@ -350,40 +420,39 @@ class HorusPreprocessor(StarknetPreprocessor):
                 if isinstance(parsed_check, CodeElementLogicalVariableDeclaration):
                     self.add_logical_variable(parsed_check)
                 elif isinstance(parsed_check, CodeElementStorageUpdate):
-                    self.add_state_change(parsed_check)
+                    with profiling.measure("annotation translation"):
+                        self.add_state_change(parsed_check)
                 elif isinstance(parsed_check, CodeElementCheck):
-                    is_post = parsed_check.check_kind == POST_COND
-                    z3_transformer = Z3Transformer(
-                        self.identifiers,
-                        self,
-                        self.logical_identifiers,
-                        self.storage_vars,
-                        is_post,
-                    )
-                    expr = z3_transformer.visit(parsed_check.formula)
-                    annotation = Annotation(
-                        sexpr=expr, source=[parsed_check.unpreprocessed_rep]
-                    )
-
                     if parsed_check.check_kind == INVARIANT:
                         append_check(
                             parsed_check.check_kind,
                             self.current_scope + code_elem.identifier.name,
-                            annotation,
+                            parsed_check,
                         )
                     elif parsed_check.check_kind in (PRE_COND, POST_COND):
                         append_check(
                             parsed_check.check_kind,
                             None,
-                            annotation,
+                            parsed_check,
                         )
             except MissingIdentifierError as e:
                 raise PreprocessorError(str(e), location=parsed_check.location)
 
         self.current_checks = []
 
+    def add_future_definition(
+        self, name: ScopedName, future_definition: FutureIdentifierDefinition
+    ):
+        super().add_future_definition(name, future_definition)
+        self.resolution_cache.clear()
+
+    def add_name_definition(self, name: ScopedName, *args, **kwargs):
+        super().add_name_definition(name, *args, **kwargs)
+        self.resolution_cache.clear()
+
     def visit_CodeElementFunction(self, elm: CodeElementFunction):
         new_scope = self.current_scope + elm.name
+        self.resolution_cache.clear()
 
         if elm.element_type == "func":
             # Check if this function should be skipped.
@@ -393,6 +462,7 @@ class HorusPreprocessor(StarknetPreprocessor):
             ):
                 self.current_function = None
                 self.current_checks = []
+            self.current_function_element = elm
 
         return super().visit_CodeElementFunction(elm)
 
@@ -403,10 +473,28 @@ class HorusPreprocessor(StarknetPreprocessor):
         # So it's easier to process the conditions when the preprocessor
         # has stepped into the body of the function.
 
+        if (
+            self.previous_fingerprints is not None
+            and self.current_function_element is not None
+        ):
+            fingerprint = get_function_fingerprint(
+                self,
+                self.current_function_element,
+                self.current_checks if self.current_function is not None else [],
+            )
+            self.function_fingerprints[self.current_scope] = fingerprint
+            if self.previous_fingerprints.get(self.current_scope) == fingerprint:
+                self.reused_functions.add(self.current_scope)
+                self.reuse_current_function = True
+
+        self.frame_layout = FrameLayout.build(self)
+        self.translation_session = None
         if self.current_function is not None:
             self.compile_annotations(self.current_function)
             self.current_function = None
             self.current_checks = []
 
         super().visit_function_body_with_retries(code_block, location)
+        self.translation_session = None
         self.logical_identifiers = {}
+        self.reuse_current_function = False
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import IO, Any, Dict, Iterator, List, Optional
+
+from starkware.cairo.lang.compiler.preprocessor.pass_manager import (
+    PassManager,
+    PassManagerContext,
+    Stage,
+)
+
+from horus.compiler.contract_definition import HorusDefinition
+from horus.compiler.terms import Term, TermDeclCollector
+from horus.utils import DeclCollector
+
+# The profiler of the current compilation (see `horus_compile --profile`),
+# which the stages nested in others (e.g. the translation of annotations in
+# the preprocessor) are reported to.
+active_profiler: Optional[Profiler] = None
+
+
+@dataclasses.dataclass
+class ProfileEvent:
+    name: str
+    # The depth of the event in the events containing it.
+    depth: int
+    # In seconds since the start of the profiler.
+    start: float
+    duration: float
+    # The peak of the memory allocated during the event, in bytes. Only
+    # traced for the outermost events.
+    peak_memory: Optional[int] = None
+
+
+class Profiler:
+    """
+    Records the wall time of the stages of a compilation (the stages of its
+    pass manager, the assembly and the writing of the outputs, see
+    `horus_compile_common`), the peak of the memory allocated by the
+    outermost ones (with tracemalloc, which slows them down) and counters.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events: List[ProfileEvent] = []
+        self.counters: Dict[str, int] = {}
+        self.depth = 0
+
+    @contextlib.contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        trace_memory = self.depth == 0 and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        event = ProfileEvent(
+            name=name,
+            depth=self.depth,
+            start=time.perf_counter() - self.origin,
+            duration=0,
+        )
+        self.events.append(event)
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            event.duration = time.perf_counter() - self.origin - event.start
+            if trace_memory:
+                _, event.peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+    def count(self, name: str, value: int):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def wrap_pass_manager(self, pass_manager: PassManager):
+        """
+        Measures every stage of `pass_manager` (under its name).
+        """
+        pass_manager.stages = [
+            (name, ProfiledStage(name, stage, self))
+            for name, stage in pass_manager.stages
+        ]
+
+    def format_table(self) -> str:
+        rows: Dict[str, List[Any]] = {}
+        for event in self.events:
+            row = rows.setdefault(
+                "  " * event.depth + event.name, [0, 0.0, event.peak_memory]
+            )
+            row[0] += 1
+            row[1] += event.duration
+            if event.peak_memory is not None:
+                row[2] = max(row[2] or 0, event.peak_memory)
+        total = sum(event.duration for event in self.events if event.depth == 0)
+
+        name_width = max([len("stage")] + [len(name) for name in rows])
+        lines = [
+            f"{'stage':<{name_width}}  {'calls':>6}  {'time (s)':>9}  {'%':>6}  "
+            f"{'peak memory (MB)':>16}"
+        ]
+        for name, (calls, duration, peak_memory) in rows.items():
+            memory = "" if peak_memory is None else f"{peak_memory / 2**20:.1f}"
+            percentage = 100 * duration / total if total else 0
+            lines.append(
+                f"{name:<{name_width}}  {calls:>6}  {duration:>9.3f}  "
+                f"{percentage:>5.1f}%  {memory:>16}"
+            )
+        lines.append(f"{'total':<{name_width}}  {'':>6}  {total:>9.3f}")
+        for name, value in self.counters.items():
+            line = f"{name}: {value}"
+            # The rate of the hits of a cache, if its misses are counted.
+            if name.endswith(" hits"):
+                misses = self.counters.get(name[: -len("hits")] + "misses")
+                if misses is not None and value + misses > 0:
+                    line += f" ({100 * value / (value + misses):.1f}%)"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def trace_events(self) -> Dict[str, Any]:
+        """
+        Returns the events and the counters in the Chrome trace event format
+        (e.g. for chrome://tracing or Perfetto).
+        """
+        pid = os.getpid()
+        tid = threading.get_ident()
+        events: List[Dict[str, Any]] = []
+        for event in self.events:
+            trace_event: Dict[str, Any] = dict(
+                name=event.name,
+                cat="horus-compile",
+                ph="X",
+                ts=event.start * 1e6,
+                dur=event.duration * 1e6,
+                pid=pid,
+                tid=tid,
+            )
+            if event.peak_memory is not None:
+                trace_event["args"] = dict(peak_memory=event.peak_memory)
+            events.append(trace_event)
+        end = max((event.start + event.duration for event in self.events), default=0)
+        for name, value in self.counters.items():
+            events.append(
+                dict(name=name, ph="C", ts=end * 1e6, pid=pid, args={name: value})
+            )
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def write_trace(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.trace_events(), f)
+
+
+class ProfiledStage(Stage):
+    def __init__(self, name: str, stage: Stage, profiler: Profiler):
+        self.name = name
+        self.stage = stage
+        self.profiler = profiler
+
+    def run(self, context: PassManagerContext):
+        with self.profiler.measure(self.name):
+            return self.stage.run(context)
+
+
+def measure(name: str):
+    """
+    Measures a stage nested in a stage of the current compilation, if it is
+    profiled.
+    """
+    if active_profiler is None:
+        return contextlib.nullcontext()
+    return active_profiler.measure(name)
+
+
+def count(name: str, value: int):
+    """
+    Adds `value` to a counter of the current compilation, if it is profiled.
+    """
+    if active_profiler is not None:
+        active_profiler.count(name, value)
+
+
+class CountingWriter:
+    """
+    Counts the characters written to `out`, which are bytes for the ASCII
+    JSON outputs.
+    """
+
+    def __init__(self, out: IO[str]):
+        self.out = out
+        self.count = 0
+
+    def write(self, s: str) -> int:
+        self.count += len(s)
+        return self.out.write(s)
+
+    def flush(self):
+        self.out.flush()
+
+
+def count_annotations(definition: HorusDefinition) -> int:
+    """
+    Returns the number of annotations (checks, invariants and storage
+    updates) of `definition`.
+    """
+    count = 0
+    for annotations in definition.specifications.values():
+        count += len(annotations.pre.source) + len(annotations.post.source)
+        count += sum(len(updates) for updates in annotations.storage_update.values())
+    for invariant in definition.invariants.values():
+        count += len(invariant.source)
+    return count
+
+
+def count_smt_nodes(definition: HorusDefinition) -> int:
+    """
+    Returns the number of distinct subterms of the formulas of `definition`.
+    """
+    formulas = []
+    for annotations in definition.specifications.values():
+        formulas += [annotations.pre.sexpr, annotations.post.sexpr]
+        for updates in annotations.storage_update.values():
+            for update in updates:
+                formulas += update.arguments + [update.value]
+    formulas += [invariant.sexpr for invariant in definition.invariants.values()]
+
+    terms = [f for f in formulas if isinstance(f, Term)]
+    z3_formulas = [f for f in formulas if not isinstance(f, Term)]
+    return TermDeclCollector().count_nodes(*terms) + DeclCollector().count_nodes(
+        *z3_formulas
+    )
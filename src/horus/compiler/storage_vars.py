@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import dataclasses
+from typing import Dict, List, Optional
+
+from starkware.cairo.lang.compiler.ast.arguments import IdentifierList
+from starkware.cairo.lang.compiler.ast.cairo_types import CairoType, TypeTuple
+from starkware.cairo.lang.compiler.ast.expr import ExprAssignment, Expression
+from starkware.cairo.lang.compiler.ast.types import TypedIdentifier
+from starkware.cairo.lang.compiler.identifier_definition import (
+    StructDefinition,
+    TypeDefinition,
+)
+from starkware.cairo.lang.compiler.identifier_manager import (
+    IdentifierManager,
+    MissingIdentifierError,
+)
+from starkware.cairo.lang.compiler.identifier_utils import (
+    get_struct_definition,
+    get_type_definition,
+)
+from starkware.cairo.lang.compiler.scoped_name import ScopedName
+
+
+@dataclasses.dataclass(frozen=True)
+class StorageVarInfo:
+    """
+    The signature of a storage variable, as annotations use it.
+    """
+
+    # The canonical name.
+    name: ScopedName
+    # The arguments of the declaration, and their positions by name.
+    arguments: List[TypedIdentifier]
+    argument_positions: Dict[str, int]
+    # The (resolved) types of the members of the arguments struct of `read`.
+    argument_types: List[CairoType]
+    # The types of the values returned by `read`.
+    return_types: List[CairoType]
+
+    @property
+    def arity(self) -> int:
+        return len(self.argument_types)
+
+    def order_arguments(self, args: List[ExprAssignment]) -> List[Expression]:
+        """
+        Returns the values of the (type checked) arguments of a reference to
+        the storage variable in the order of its declaration.
+        """
+        values: List[Optional[Expression]] = [None] * len(args)
+        for position, arg in enumerate(args):
+            if arg.identifier is not None:
+                position = self.argument_positions[arg.identifier.name]
+            values[position] = arg.expr
+        return [value for value in values if value is not None]
+
+
+# The storage variables of a compilation, by canonical name.
+StorageVarIndex = Dict[ScopedName, StorageVarInfo]
+
+
+def build_storage_var_index(
+    storage_vars: Dict[ScopedName, IdentifierList], identifiers: IdentifierManager
+) -> StorageVarIndex:
+    """
+    Returns the signatures of the storage variables collected by
+    HorusStorageVarCollectorStage, once their `read` and `write` functions
+    are defined in `identifiers` (i.e. after the identifier and struct
+    collectors ran). Storage variables whose functions are missing are left
+    out.
+    """
+    index: StorageVarIndex = {}
+    for name, arguments in storage_vars.items():
+        if (
+            identifiers.get_by_full_name(name + "read") is None
+            or identifiers.get_by_full_name(name + "write") is None
+        ):
+            continue
+        try:
+            return_type_def = get_type_definition(name + "read" + "Return", identifiers)
+            args_struct_def = get_struct_definition(name + "read" + "Args", identifiers)
+        except MissingIdentifierError:
+            continue
+        assert isinstance(return_type_def, TypeDefinition)
+        assert isinstance(return_type_def.cairo_type, TypeTuple)
+        assert isinstance(args_struct_def, StructDefinition)
+
+        index[name] = StorageVarInfo(
+            name=name,
+            arguments=list(arguments.identifiers),
+            argument_positions={
+                argument.identifier.name: position
+                for position, argument in enumerate(arguments.identifiers)
+            },
+            argument_types=[
+                member.cairo_type for member in args_struct_def.members.values()
+            ],
+            return_types=[member.typ for member in return_type_def.cairo_type.members],
+        )
+    return index
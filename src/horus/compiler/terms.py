@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import string
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import z3
+
+from horus.compiler.z3_declarations import Declarations, Z3Declarations
+from horus.utils import CompactPrinter, DeclCollector
+
+# The characters of SMT-LIB symbols which z3 prints without quotes.
+SIMPLE_SYMBOL_CHARS = frozenset(
+    string.ascii_letters + string.digits + "~!@$%^&*_-+=<>.?/"
+)
+
+
+def quote_symbol(name: str) -> str:
+    """
+    Returns `name` as z3 prints it in SMT-LIB.
+    """
+    if name and name[0] not in string.digits and SIMPLE_SYMBOL_CHARS.issuperset(name):
+        return name
+    return "|" + name.replace("|", "\\|") + "|"
+
+
+class Term:
+    """
+    A term: a constant ("const"), an integer or boolean value ("int" and
+    "bool"), an application of an uninterpreted function ("app") or of an
+    SMT-LIB operator (e.g. "+", "<=", "and"), given by `op`. `payload`
+    is the name of constants and functions, and the value of values.
+
+    Terms are created by TermDeclarations, which interns them.
+    """
+
+    __slots__ = ("declarations", "op", "payload", "args")
+
+    def __init__(
+        self,
+        declarations: TermDeclarations,
+        op: str,
+        payload: Any,
+        args: Tuple[Term, ...],
+    ):
+        self.declarations = declarations
+        self.op = op
+        self.payload = payload
+        self.args = args
+
+    def _binary(self, op: str, other) -> Term:
+        return self.declarations.make(op, None, (self, self.declarations.coerce(other)))
+
+    def _rbinary(self, op: str, other) -> Term:
+        return self.declarations.make(op, None, (self.declarations.coerce(other), self))
+
+    def __add__(self, other) -> Term:
+        return self._binary("+", other)
+
+    def __radd__(self, other) -> Term:
+        return self._rbinary("+", other)
+
+    def __sub__(self, other) -> Term:
+        return self._binary("-", other)
+
+    def __rsub__(self, other) -> Term:
+        return self._rbinary("-", other)
+
+    def __mul__(self, other) -> Term:
+        return self._binary("*", other)
+
+    def __rmul__(self, other) -> Term:
+        return self._rbinary("*", other)
+
+    def __truediv__(self, other) -> Term:
+        return self._binary("div", other)
+
+    def __rtruediv__(self, other) -> Term:
+        return self._rbinary("div", other)
+
+    def __neg__(self) -> Term:
+        return self.declarations.make("-", None, (self,))
+
+    def _compare(self, op: str, reflected_op: str, other) -> Term:
+        # A z3 value is an instance of a subclass of the class of the other
+        # terms, so Python calls its reflected comparison first, e.g.
+        # `x <= 5` builds (>= 5 x). This is kept for identical output.
+        if isinstance(other, Term) and other.op == "int" and self.op != "int":
+            return self.declarations.make(reflected_op, None, (other, self))
+        return self._binary(op, other)
+
+    def __eq__(self, other) -> Term:  # type: ignore
+        return self._compare("=", "=", other)
+
+    def __ne__(self, other) -> Term:  # type: ignore
+        return self._compare("distinct", "distinct", other)
+
+    def __lt__(self, other) -> Term:
+        return self._compare("<", ">", other)
+
+    def __le__(self, other) -> Term:
+        return self._compare("<=", ">=", other)
+
+    def __gt__(self, other) -> Term:
+        return self._compare(">", "<", other)
+
+    def __ge__(self, other) -> Term:
+        return self._compare(">=", "<=", other)
+
+    def __bool__(self):
+        # As z3, since `==` builds a term rather than comparing.
+        raise TypeError("Terms cannot be converted to bool")
+
+    # Terms are interned, so identity is structural equality.
+    __hash__ = object.__hash__
+
+    def sexpr(self) -> str:
+        text: str = self.declarations.to_z3(self).sexpr()
+        return text
+
+    def compact_sexpr(self) -> str:
+        return TermCompactPrinter().print(self)
+
+    def __repr__(self) -> str:
+        return self.compact_sexpr()
+
+
+class TermFunction:
+    """
+    An uninterpreted function from `arity` integers to an integer.
+    """
+
+    def __init__(self, declarations: TermDeclarations, name: str, arity: int):
+        self.declarations = declarations
+        self.name = name
+        self.arity = arity
+
+    def __call__(self, *args) -> Term:
+        assert len(args) == self.arity, f"Incorrect number of arguments to {self.name}"
+        return self.declarations.make(
+            "app", self.name, tuple(self.declarations.coerce(arg) for arg in args)
+        )
+
+
+class TermCompactPrinter(CompactPrinter):
+    def get_id(self, f: Term) -> int:  # type: ignore
+        return id(f)
+
+    def get_children(self, f: Term) -> list:  # type: ignore
+        return list(f.args)
+
+    def get_leaf_text(self, f: Term) -> str:  # type: ignore
+        if f.op == "const":
+            return quote_symbol(f.payload)
+        if f.op == "int":
+            return str(f.payload) if f.payload >= 0 else f"(- {-f.payload})"
+        if f.op == "bool":
+            return "true" if f.payload else "false"
+        # An application without arguments.
+        return self.get_head(f)
+
+    def get_head(self, f: Term) -> str:  # type: ignore
+        return quote_symbol(f.payload) if f.op == "app" else f.op
+
+
+class TermDeclCollector(DeclCollector):
+    def get_id(self, f: Term) -> int:  # type: ignore
+        return id(f)
+
+    def get_children(self, f: Term) -> list:  # type: ignore
+        return list(f.args)
+
+    def get_decl(self, f: Term) -> Optional[Tuple[str, int]]:  # type: ignore
+        if f.op == "const":
+            return f.payload, 0
+        if f.op == "app":
+            return f.payload, len(f.args)
+        return None
+
+
+class TermDeclarations(Declarations):
+    """
+    Creates and interns the terms of a compilation, used instead of z3
+    terms with --term_backend python.
+
+    Building a z3 term crosses into libz3 for every operation, while these
+    terms are plain Python objects, interned so that equal terms are the
+    same object (as in z3). They are printed by TermCompactPrinter in the
+    compact format, and converted to z3 terms (once per distinct term)
+    for z3's pretty printer in the default format.
+    """
+
+    def __init__(self):
+        self.terms: Dict[tuple, Term] = {}
+        self.functions: Dict[Tuple[str, int], TermFunction] = {}
+        self.decl_collector = TermDeclCollector()
+        # The z3 terms the terms were converted to, by id.
+        self.z3_declarations: Optional[Z3Declarations] = None
+        self.z3_terms: Dict[int, z3.ExprRef] = {}
+
+    def make(self, op: str, payload: Any, args: Tuple[Term, ...]) -> Term:
+        # Values are keyed by their type too, since True == 1.
+        key = (op, type(payload), payload, *map(id, args))
+        term = self.terms.get(key)
+        if term is None:
+            term = self.terms[key] = Term(self, op, payload, args)
+        return term
+
+    def coerce(self, value: Union[Term, int]) -> Term:
+        if isinstance(value, Term):
+            return value
+        assert isinstance(value, int) and not isinstance(value, bool)
+        return self.int_val(value)
+
+    def int_const(self, name: str) -> Term:
+        return self.make("const", name, ())
+
+    def function(self, name: str, arity: int) -> TermFunction:
+        function = self.functions.get((name, arity))
+        if function is None:
+            function = self.functions[name, arity] = TermFunction(self, name, arity)
+        return function
+
+    def int_val(self, value: int) -> Term:
+        return self.make("int", value, ())
+
+    def bool_val(self, value: bool) -> Term:
+        return self.make("bool", value, ())
+
+    def and_(self, a: Term, b: Term) -> Term:
+        false = self.bool_val(False)
+        if a is false or b is false:
+            return false
+        true = self.bool_val(True)
+        if a is true:
+            return b
+        if b is true:
+            return a
+        return self.make("and", None, (a, b))
+
+    def conjunction(self, formulas: Sequence[Term]) -> Term:
+        true = self.bool_val(True)
+        false = self.bool_val(False)
+        conjuncts = [f for f in formulas if f is not true]
+        if any(f is false for f in conjuncts):
+            return false
+        if not conjuncts:
+            return true
+        if len(conjuncts) == 1:
+            return conjuncts[0]
+        return self.make("and", None, tuple(conjuncts))
+
+    def or_(self, a: Term, b: Term) -> Term:
+        return self.make("or", None, (a, b))
+
+    def not_(self, a: Term) -> Term:
+        return self.make("not", None, (a,))
+
+    def implies(self, a: Term, b: Term) -> Term:
+        return self.make("=>", None, (a, b))
+
+    def get_decls(self, *formulas) -> Dict[str, int]:
+        # The formulas which are still the z3 defaults (true) of Annotation
+        # have no declarations.
+        return self.decl_collector.get_decls(
+            *[formula for formula in formulas if isinstance(formula, Term)]
+        )
+
+    def to_z3(self, term: Term) -> z3.ExprRef:
+        """
+        Returns the z3 term built by the same operations as `term`. Every
+        distinct term is converted once per compilation.
+        """
+        if self.z3_declarations is None:
+            self.z3_declarations = Z3Declarations()
+        declarations = self.z3_declarations
+
+        stack: List[Tuple[Term, bool]] = [(term, False)]
+        while stack:
+            t, args_done = stack.pop()
+            if id(t) in self.z3_terms:
+                continue
+            if not args_done:
+                stack.append((t, True))
+                stack.extend((arg, False) for arg in t.args)
+                continue
+
+            args = [self.z3_terms[id(arg)] for arg in t.args]
+            result: z3.ExprRef
+            if t.op == "const":
+                result = declarations.int_const(t.payload)
+            elif t.op == "app":
+                result = declarations.function(t.payload, len(args))(*args)
+            elif t.op == "int":
+                result = z3.IntVal(t.payload)
+            elif t.op == "bool":
+                result = z3.BoolVal(t.payload)
+            elif t.op == "-" and len(args) == 1:
+                result = -args[0]
+            else:
+                result = Z3_OPERATIONS[t.op](*args)
+            self.z3_terms[id(t)] = result
+        return self.z3_terms[id(term)]
+
+
+Z3_OPERATIONS: Dict[str, Callable[..., z3.ExprRef]] = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "div": lambda a, b: a / b,
+    "=": lambda a, b: a == b,
+    "distinct": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "and": lambda *args: z3.And(*args),
+    "or": lambda *args: z3.Or(*args),
+    "not": z3.Not,
+    "=>": z3.Implies,
+}
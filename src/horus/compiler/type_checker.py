@@ -3,12 +3,10 @@ from __future__ import annotations
 import dataclasses
 from typing import Dict, List, Optional, Tuple
 
-from starkware.cairo.lang.compiler.ast.arguments import IdentifierList
 from starkware.cairo.lang.compiler.ast.cairo_types import (
     CairoType,
     TypeFelt,
     TypeIdentifier,
-    TypePointer,
     TypeStruct,
     TypeTuple,
 )
@@ -20,31 +18,27 @@ from starkware.cairo.lang.compiler.ast.expr import (
     ExprDot,
     Expression,
     ExprIdentifier,
-    ExprOperator,
-    ExprReg,
     ExprSubscript,
 )
 from starkware.cairo.lang.compiler.ast.expr_func_call import (
     ExprFuncCall,
     RvalueFuncCall,
 )
+from starkware.cairo.lang.compiler.error_handling import Location
 from starkware.cairo.lang.compiler.expression_simplifier import ExpressionSimplifier
 from starkware.cairo.lang.compiler.identifier_definition import (
     ConstDefinition,
     FunctionDefinition,
+    IdentifierDefinition,
     NamespaceDefinition,
     ReferenceDefinition,
-    TypeDefinition,
 )
 from starkware.cairo.lang.compiler.identifier_manager import (
     IdentifierManager,
+    IdentifierSearchResult,
     MissingIdentifierError,
 )
-from starkware.cairo.lang.compiler.identifier_utils import (
-    get_struct_definition,
-    get_type_definition,
-)
-from starkware.cairo.lang.compiler.instruction import Register
+from starkware.cairo.lang.compiler.identifier_utils import get_struct_definition
 from starkware.cairo.lang.compiler.offset_reference import OffsetReferenceDefinition
 from starkware.cairo.lang.compiler.preprocessor.preprocessor import Preprocessor
 from starkware.cairo.lang.compiler.resolve_search_result import resolve_search_result
@@ -61,6 +55,8 @@ from starkware.crypto.signature.signature import FIELD_PRIME
 
 from horus.compiler.allowed_syscalls import allowed_syscalls
 from horus.compiler.code_elements import ExprLogicalIdentifier
+from horus.compiler.frame_layout import get_frame_layout
+from horus.compiler.storage_vars import StorageVarIndex, StorageVarInfo
 
 
 def get_expr_addr(expr: Expression):
@@ -72,22 +68,116 @@ def get_expr_addr(expr: Expression):
     return expr.addr
 
 
+class ResolutionCache:
+    """
+    Memoizes the resolution of identifiers (their search in the accessible
+    scopes and the resolution of the search result) in the annotations of
+    the current function of the preprocessor, where the same names (e.g.
+    the arguments of the function and constants) are resolved by every
+    annotation.
+
+    Results are keyed by the accessible scopes and the name. The
+    preprocessor clears the cache when it enters a function and whenever
+    it defines identifiers (e.g. references and the labels of @assert) or
+    logical variables. It is also cleared when the identifiers are
+    resolved in another identifier manager, since the preprocessor
+    replaces its own while it visits the body of a function (see
+    `PreprocessorMemento`). Failed resolutions are not cached.
+    """
+
+    def __init__(self):
+        self.identifiers: Optional[IdentifierManager] = None
+        self.results: Dict[
+            tuple, Tuple[IdentifierSearchResult, IdentifierDefinition]
+        ] = {}
+        # Kept when the cache is cleared, for --profile.
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(
+        self,
+        identifiers: IdentifierManager,
+        accessible_scopes: List[ScopedName],
+        name: ScopedName,
+    ) -> Tuple[IdentifierSearchResult, IdentifierDefinition]:
+        if identifiers is not self.identifiers:
+            self.clear()
+            self.identifiers = identifiers
+        key = (tuple(accessible_scopes), name)
+        result = self.results.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = self.results[key] = resolve_identifier(
+            identifiers, accessible_scopes, name
+        )
+        return result
+
+    def clear(self):
+        self.results.clear()
+
+
+def resolve_identifier(
+    identifiers: IdentifierManager,
+    accessible_scopes: List[ScopedName],
+    name: ScopedName,
+    cache: Optional[ResolutionCache] = None,
+) -> Tuple[IdentifierSearchResult, IdentifierDefinition]:
+    if cache is not None:
+        return cache.resolve(identifiers, accessible_scopes, name)
+    search_result = identifiers.search(accessible_scopes, name)
+    return search_result, resolve_search_result(search_result, identifiers)
+
+
+def get_storage_var(
+    storage_vars: StorageVarIndex, name: ScopedName, location: Optional[Location]
+) -> StorageVarInfo:
+    """
+    Returns the storage variable `name` (a canonical name), which can be
+    read in assertions if its value is a single member.
+    """
+    storage_var = storage_vars.get(name)
+    if storage_var is None:
+        raise CairoTypeError(
+            "Function calls are not allowed in assertions", location=location
+        )
+    if len(storage_var.return_types) != 1:
+        raise CairoTypeError(
+            "Storage maps with return tuple of length higher than 1 are not supported yet",
+            location=location,
+        )
+    return storage_var
+
+
 class HorusTypeChecker(TypeSystemVisitor):
     def __init__(
         self,
         accessible_scopes: Optional[List[ScopedName]] = None,
         identifiers: Optional[IdentifierManager] = None,
         logical_identifiers: Dict[str, CairoType] = {},
-        storage_vars: Dict[ScopedName, IdentifierList] = {},
+        storage_vars: StorageVarIndex = {},
+        cache: Optional[Dict[str, Tuple[Expression, CairoType]]] = None,
+        resolution_cache: Optional[ResolutionCache] = None,
     ):
         super().__init__(identifiers)
         self.accessible_scopes = accessible_scopes
         self.identifiers = identifiers
         self.logical_identifiers = logical_identifiers
         self.storage_vars = storage_vars
+        # The results of visit() by formatted expression, if given.
+        self.cache = cache
+        self.resolution_cache = resolution_cache
 
     def visit(self, expr: Expression) -> tuple[Expression, CairoType]:
-        return super().visit(expr)  # type: ignore
+        if self.cache is None:
+            return super().visit(expr)  # type: ignore
+
+        key = expr.format()
+        result = self.cache.get(key)
+        if result is None:
+            result = self.cache[key] = super().visit(expr)
+        return result
 
     def visit_ExprLogicalIdentifier(
         self, expr: ExprLogicalIdentifier
@@ -157,40 +247,19 @@ class HorusTypeChecker(TypeSystemVisitor):
     def visit_ExprCast(self, expr: ExprCast) -> Tuple[Expression, CairoType]:
         if isinstance(expr.dest_type, TypeStruct):
             assert self.identifiers is not None
-            search_result = self.identifiers.search(
-                self.accessible_scopes, expr.dest_type.scope
+            assert self.accessible_scopes is not None
+            search_result, definition = resolve_identifier(
+                self.identifiers,
+                self.accessible_scopes,
+                expr.dest_type.scope,
+                self.resolution_cache,
             )
-            definition = resolve_search_result(search_result, self.identifiers)
 
             if isinstance(definition, NamespaceDefinition):
-                try:
-                    self.identifiers.search(
-                        self.accessible_scopes, expr.dest_type.scope + "read"
-                    )
-                    self.identifiers.search(
-                        self.accessible_scopes, expr.dest_type.scope + "write"
-                    )
-
-                    ret_type_def = get_type_definition(
-                        search_result.canonical_name + "read" + "Return",
-                        self.identifiers,
-                    )
-                    assert isinstance(ret_type_def, TypeDefinition)
-                    assert isinstance(ret_type_def.cairo_type, TypeTuple)
-
-                    if len(ret_type_def.cairo_type.members) != 1:
-                        raise CairoTypeError(
-                            "Storage maps with return tuple of length higher than 1 are not supported yet",
-                            location=expr.location,
-                        )
-
-                    return expr, ret_type_def.cairo_type.members[0].typ
-                except MissingIdentifierError:
-                    # Failed to find the storage variable stuff.
-                    raise CairoTypeError(
-                        "Function calls are not allowed in assertions",
-                        location=expr.location,
-                    )
+                storage_var = get_storage_var(
+                    self.storage_vars, search_result.canonical_name, expr.location
+                )
+                return expr, storage_var.return_types[0]
             elif isinstance(definition, FunctionDefinition):
                 if search_result.canonical_name in allowed_syscalls:
                     return expr, TypeFelt(expr.location)
@@ -199,94 +268,62 @@ class HorusTypeChecker(TypeSystemVisitor):
 
     def visit_ExprFuncCall(self, expr: ExprFuncCall) -> Tuple[ExprFuncCall, CairoType]:
         assert self.identifiers is not None
-        search_result = self.identifiers.search(
-            self.accessible_scopes, ScopedName.from_string(expr.rvalue.func_ident.name)
+        assert self.accessible_scopes is not None
+        search_result, definition = resolve_identifier(
+            self.identifiers,
+            self.accessible_scopes,
+            ScopedName.from_string(expr.rvalue.func_ident.name),
+            self.resolution_cache,
         )
-        definition = resolve_search_result(search_result, self.identifiers)
 
         if search_result.canonical_name in allowed_syscalls:
             return expr, TypeFelt(expr.location)
 
         if isinstance(definition, NamespaceDefinition):
-            try:
-                self.identifiers.search(
-                    self.accessible_scopes,
-                    ScopedName.from_string(expr.rvalue.func_ident.name) + "read",
-                )
-                self.identifiers.search(
-                    self.accessible_scopes,
-                    ScopedName.from_string(expr.rvalue.func_ident.name) + "write",
-                )
-
-                ret_type_def = get_type_definition(
-                    search_result.canonical_name + "read" + "Return",
-                    self.identifiers,
+            storage_var = get_storage_var(
+                self.storage_vars, search_result.canonical_name, expr.location
+            )
+            if len(expr.rvalue.arguments.args) != len(storage_var.arguments):
+                raise CairoTypeError(
+                    f"Storage var {search_result.canonical_name} has {len(storage_var.arguments)} arguments. Provided {len(expr.rvalue.arguments.args)}",
+                    location=expr.location,
                 )
-                assert isinstance(ret_type_def, TypeDefinition)
-                assert isinstance(ret_type_def.cairo_type, TypeTuple)
 
-                if len(ret_type_def.cairo_type.members) != 1:
-                    raise CairoTypeError(
-                        "Storage maps with return tuple of length higher than 1 are not supported yet",
-                        location=expr.location,
-                    )
+            # Unnamed arguments come first, so they are at their positions.
+            found = [False] * len(storage_var.arguments)
+            is_named = False
+            for position, arg in enumerate(expr.rvalue.arguments.args):
+                assert isinstance(arg, ExprAssignment)
 
-                if len(expr.rvalue.arguments.args) != len(
-                    self.storage_vars[search_result.canonical_name].identifiers
-                ):
-                    raise CairoTypeError(
-                        f"Storage var {search_result.canonical_name} has {len(self.storage_vars[search_result.canonical_name].identifiers)} arguments. Provided {len(expr.rvalue.arguments.args)}",
-                        location=expr.location,
+                if arg.identifier is None:
+                    if is_named:
+                        raise CairoTypeError(
+                            "Unnamed argument cannot follow named ones",
+                            location=arg.location,
+                        )
+                else:
+                    is_named = True
+                    found_position = storage_var.argument_positions.get(
+                        arg.identifier.name
                     )
-
-                args_signature = self.storage_vars[
-                    search_result.canonical_name
-                ].identifiers.copy()
-                is_named = False
-                for arg in expr.rvalue.arguments.args:
-                    assert isinstance(arg, ExprAssignment)
-
-                    if arg.identifier is None:
-                        if is_named:
-                            raise CairoTypeError(
-                                "Unnamed argument cannot follow named ones",
-                                location=arg.location,
-                            )
-
-                        found_arg = args_signature.pop(0)
-                    else:
-                        is_named = True
-                        found_arg = next(
-                            (
-                                x
-                                for x in args_signature
-                                if arg.identifier.name == x.identifier.name
-                            ),
-                            None,
+                    if found_position is None or found[found_position]:
+                        raise CairoTypeError(
+                            f"Unknown argument {arg.identifier.name}",
+                            location=arg.identifier.location,
                         )
-                        if found_arg is None:
-                            raise CairoTypeError(
-                                f"Unknown argument {arg.identifier.name}",
-                                location=arg.identifier.location,
-                            )
+                    position = found_position
+                found[position] = True
+                found_arg = storage_var.arguments[position]
 
-                        args_signature.remove(found_arg)
+                _, arg_type = self.visit(arg.expr)
 
-                    _, arg_type = self.visit(arg.expr)
-
-                    if arg_type != found_arg.expr_type:
-                        raise CairoTypeError(
-                            f"The argument is expected to have type {found_arg.expr_type}",
-                            location=arg.expr.location,
-                        )
+                if arg_type != found_arg.expr_type:
+                    raise CairoTypeError(
+                        f"The argument is expected to have type {found_arg.expr_type}",
+                        location=arg.expr.location,
+                    )
 
-                return expr, ret_type_def.cairo_type.members[0].typ
-            except MissingIdentifierError as e:
-                # Failed to find the storage variable stuff.
-                raise CairoTypeError(
-                    "Function calls are not allowed in assertions",
-                    location=expr.location,
-                ) from e
+            return expr, storage_var.return_types[0]
 
         raise CairoTypeError(
             "Function calls are not allowed in assertions",
@@ -294,26 +331,8 @@ class HorusTypeChecker(TypeSystemVisitor):
         )
 
 
-def get_return_variable(name: str, preprocessor: Preprocessor):
-    definition = get_type_definition(
-        preprocessor.current_scope + "Return", preprocessor.identifiers
-    )
-    assert isinstance(definition, TypeDefinition)
-
-    return_tuple = ExprCast(
-        expr=ExprOperator(
-            ExprReg(Register.AP),
-            "-",
-            ExprConst(preprocessor.get_size(definition.cairo_type)),
-        ),
-        dest_type=TypePointer(definition.cairo_type),
-    )
-
-    result = return_tuple
-    for member_name in name.split("."):
-        result = ExprDot(result, ExprIdentifier(member_name))
-
-    return result
+def get_return_variable(name: str, preprocessor: Preprocessor) -> Expression:
+    return get_frame_layout(preprocessor).get_return_value(name, preprocessor)
 
 
 class HorusSubstituteIdentifiers(SubstituteIdentifiers):
@@ -373,53 +392,135 @@ def substitute_identifiers(
     ).visit(expr)
 
 
+class SimplifyCache:
+    """
+    Memoizes `simplify_and_get_type` while one annotation is compiled,
+    where the same expressions (e.g. the sides of a struct equality and
+    the prefixes of their member accesses) are simplified many times.
+
+    All results are keyed by the scope, `is_post` and the logical
+    identifiers. Since references are evaluated with the current flow
+    tracking data of the preprocessor, a cache must be cleared before the
+    next annotation.
+
+    Identifiers are resolved with `resolution_cache`, if given, which is
+    kept for the current function. The type checker and the simplifier are
+    kept when the cache is cleared for another annotation.
+    """
+
+    def __init__(self, resolution_cache: Optional[ResolutionCache] = None):
+        self.resolution_cache = resolution_cache
+        self.type_checker: Optional[HorusTypeChecker] = None
+        self.simplifier = ExpressionSimplifier(prime=FIELD_PRIME)
+        # Simplified expressions and their types, by formatted expression.
+        self.expressions: Dict[tuple, Tuple[Expression, CairoType]] = {}
+        # The expressions substituted for identifiers, by identifier name.
+        self.identifiers: Dict[tuple, Expression] = {}
+        # The results of HorusTypeChecker.visit(), by formatted expression.
+        self.type_checks: Dict[tuple, Dict[str, Tuple[Expression, CairoType]]] = {}
+
+    def clear(self):
+        self.expressions.clear()
+        self.identifiers.clear()
+        self.type_checks.clear()
+
+    def get_type_checker(
+        self,
+        preprocessor: Preprocessor,
+        logical_identifiers: Dict[str, CairoType],
+        storage_vars: StorageVarIndex,
+        env_key: tuple,
+    ) -> HorusTypeChecker:
+        type_checker = self.type_checker
+        if (
+            type_checker is None
+            or type_checker.identifiers is not preprocessor.identifiers
+        ):
+            type_checker = self.type_checker = HorusTypeChecker(
+                identifiers=preprocessor.identifiers,
+                resolution_cache=self.resolution_cache,
+            )
+        type_checker.accessible_scopes = preprocessor.accessible_scopes
+        type_checker.logical_identifiers = logical_identifiers
+        type_checker.storage_vars = storage_vars
+        type_checker.cache = self.type_checks.setdefault(env_key, {})
+        return type_checker
+
+
 def simplify_and_get_type(
     expr: Expression,
     preprocessor: Preprocessor,
     logical_identifiers: Dict[str, CairoType],
-    storage_vars: Dict[ScopedName, IdentifierList],
+    storage_vars: StorageVarIndex,
     is_post: bool,
+    cache: Optional[SimplifyCache] = None,
 ) -> tuple[Expression, CairoType]:
-    def get_identifier(expr: ExprIdentifier):
-        if is_post:
-            definition = get_struct_definition(
-                preprocessor.current_scope + "ImplicitArgs", preprocessor.identifiers
-            )
+    if cache is None:
+        return _simplify_and_get_type(
+            expr, preprocessor, logical_identifiers, storage_vars, is_post
+        )
 
-            if definition.members.get(expr.name.split(".")[0]) is not None:
-                implicit_args_type = TypeStruct(
-                    definition.full_name,
-                )
-                return_def = get_type_definition(
-                    preprocessor.current_scope + "Return", preprocessor.identifiers
-                )
+    scope_key = (
+        is_post,
+        preprocessor.current_scope,
+        tuple(preprocessor.accessible_scopes),
+    )
+    env_key = (
+        scope_key,
+        tuple((name, type.format()) for name, type in logical_identifiers.items()),
+    )
+    key = (expr.format(), env_key)
+    result = cache.expressions.get(key)
+    if result is None:
+        result = _simplify_and_get_type(
+            expr,
+            preprocessor,
+            logical_identifiers,
+            storage_vars,
+            is_post,
+            cache,
+            scope_key,
+            env_key,
+        )
+        cache.expressions[key] = result
+    return result
 
-                implicit_args_struct = ExprCast(
-                    expr=ExprOperator(
-                        ExprReg(Register.AP),
-                        "-",
-                        ExprConst(
-                            definition.size
-                            + preprocessor.get_size(return_def.cairo_type)
-                        ),
-                    ),
-                    dest_type=TypePointer(implicit_args_type),
-                )
 
-                result = implicit_args_struct
-                for member_name in expr.name.split("."):
-                    result = ExprDot(result, ExprIdentifier(member_name))
+def _simplify_and_get_type(
+    expr: Expression,
+    preprocessor: Preprocessor,
+    logical_identifiers: Dict[str, CairoType],
+    storage_vars: StorageVarIndex,
+    is_post: bool,
+    cache: Optional[SimplifyCache] = None,
+    scope_key: tuple = (),
+    env_key: tuple = (),
+) -> tuple[Expression, CairoType]:
+    def get_identifier_cached(expr: ExprIdentifier):
+        assert cache is not None
+        key = (expr.name, scope_key)
+        result = cache.identifiers.get(key)
+        if result is None:
+            result = cache.identifiers[key] = get_identifier(expr)
+        return result
 
-                return result
+    def get_identifier(expr: ExprIdentifier):
+        if is_post:
+            implicit_arg = get_frame_layout(preprocessor).get_implicit_arg(
+                expr.name, preprocessor
+            )
+            if implicit_arg is not None:
+                return implicit_arg
 
         if expr.name.startswith("$Return."):
             return get_return_variable(expr.name[len("$Return.") :], preprocessor)
 
-        search_result = preprocessor.identifiers.search(
+        search_result, definition = resolve_identifier(
+            preprocessor.identifiers,
             preprocessor.accessible_scopes,
             ScopedName.from_string(expr.name),
+            None if cache is None else cache.resolution_cache,
         )
-        definition = resolve_search_result(search_result, preprocessor.identifiers)
 
         if isinstance(definition, ConstDefinition):
             return ExprConst(definition.value)
@@ -431,34 +532,8 @@ def simplify_and_get_type(
             )
 
         if isinstance(definition, NamespaceDefinition):
-            try:
-                preprocessor.identifiers.get_by_full_name(
-                    search_result.canonical_name + "read"
-                )
-                preprocessor.identifiers.get_by_full_name(
-                    search_result.canonical_name + "write"
-                )
-
-                ret_type_def = get_type_definition(
-                    search_result.canonical_name + "read" + "Return",
-                    preprocessor.identifiers,
-                )
-                assert isinstance(ret_type_def, TypeDefinition)
-                assert isinstance(ret_type_def.cairo_type, TypeTuple)
-
-                if len(ret_type_def.cairo_type.members) != 1:
-                    raise CairoTypeError(
-                        "Storage maps with return tuple of length higher than 1 are not supported yet",
-                        location=expr.location,
-                    )
-
-                return expr
-            except MissingIdentifierError as e:
-                # Failed to find the storage variable stuff.
-                raise CairoTypeError(
-                    "Function calls are not allowed in assertions",
-                    location=expr.location,
-                ) from e
+            get_storage_var(storage_vars, search_result.canonical_name, expr.location)
+            return expr
 
         raise CairoTypeError(
             f'Cannot obtain identifier "{expr.name}". Expected a reference but got "{definition.TYPE}"',
@@ -473,18 +548,26 @@ def simplify_and_get_type(
 
     expr = substitute_identifiers(
         expr,
-        get_identifier,
+        get_identifier if cache is None else get_identifier_cached,
         preprocessor.resolve_type,
         identifiers=preprocessor.identifiers,
     )
-    expr, expr_type = HorusTypeChecker(
-        preprocessor.accessible_scopes,
-        preprocessor.identifiers,
-        logical_identifiers,
-        storage_vars,
-    ).visit(expr)
+    if cache is None:
+        type_checker = HorusTypeChecker(
+            preprocessor.accessible_scopes,
+            preprocessor.identifiers,
+            logical_identifiers,
+            storage_vars,
+        )
+        simplifier = ExpressionSimplifier(prime=FIELD_PRIME)
+    else:
+        type_checker = cache.get_type_checker(
+            preprocessor, logical_identifiers, storage_vars, env_key
+        )
+        simplifier = cache.simplifier
+    expr, expr_type = type_checker.visit(expr)
     expr_type = preprocessor.resolve_type(expr_type)
-    expr = ExpressionSimplifier(prime=FIELD_PRIME).visit(expr)
+    expr = simplifier.visit(expr)
 
     return (expr, expr_type)
 
@@ -493,9 +576,10 @@ def simplify(
     expr: Expression,
     preprocessor: Preprocessor,
     logical_identifiers: Dict[str, CairoType],
-    storage_vars: Dict[ScopedName, IdentifierList],
+    storage_vars: StorageVarIndex,
     is_post: bool,
+    cache: Optional[SimplifyCache] = None,
 ) -> Expression:
     return simplify_and_get_type(
-        expr, preprocessor, logical_identifiers, storage_vars, is_post
+        expr, preprocessor, logical_identifiers, storage_vars, is_post, cache
     )[0]
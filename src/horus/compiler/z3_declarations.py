@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+import z3
+
+from horus.compiler.var_names import HORUS_DECLS
+from horus.utils import DeclCollector, z3And
+
+
+class Declarations(ABC):
+    """
+    Builds the terms of the formulas of a compilation. The transformers
+    only create constants, functions, values and connectives through
+    this interface (arithmetic and comparisons use Python operators),
+    so the term representation can be chosen per compilation.
+    """
+
+    @abstractmethod
+    def int_const(self, name: str) -> Any:
+        ...
+
+    @abstractmethod
+    def function(self, name: str, arity: int) -> Callable[..., Any]:
+        """
+        Returns the uninterpreted function `name` from `arity` integers
+        to an integer.
+        """
+
+    @abstractmethod
+    def int_val(self, value: int) -> Any:
+        ...
+
+    @abstractmethod
+    def bool_val(self, value: bool) -> Any:
+        ...
+
+    @abstractmethod
+    def and_(self, a, b) -> Any:
+        """
+        Returns the conjunction of `a` and `b`, or one of them if the other
+        is a boolean constant.
+        """
+
+    @abstractmethod
+    def conjunction(self, formulas: Sequence) -> Any:
+        """
+        Returns the conjunction of `formulas` as a single n-ary And, leaving
+        out the formulas which are true. Like `and_`, it is false if one of
+        them is false.
+        """
+
+    @abstractmethod
+    def or_(self, a, b) -> Any:
+        ...
+
+    @abstractmethod
+    def not_(self, a) -> Any:
+        ...
+
+    @abstractmethod
+    def implies(self, a, b) -> Any:
+        ...
+
+    @abstractmethod
+    def get_decls(self, *formulas) -> Dict[str, int]:
+        """
+        Returns the uninterpreted constants and functions of `formulas`
+        and their arities, by name.
+        """
+
+
+class Z3Declarations(Declarations):
+    """
+    Interns the constants (registers, logical variables, syscalls) and the
+    uninterpreted functions (memory, storage variables) of the formulas of
+    a compilation, so that each of them is created in z3 once and shared
+    by all the transformers.
+
+    The name and arity of every declaration are kept by the AST id of its
+    z3 function declaration, which is how the declarations of a formula
+    are looked up (see `horus.utils.DeclCollector`).
+    """
+
+    def __init__(self):
+        self.consts: Dict[str, z3.ArithRef] = {}
+        self.functions: Dict[Tuple[str, int], z3.FuncDeclRef] = {}
+        self.decls_by_id: Dict[int, Tuple[str, int]] = {}
+        self.decl_collector: Optional[DeclCollector] = None
+        for name, decl in HORUS_DECLS.items():
+            if isinstance(decl, z3.FuncDeclRef):
+                self.functions[name, decl.arity()] = decl
+                self.add_decl(decl)
+            else:
+                self.consts[name] = decl
+                self.add_decl(decl.decl())
+
+    def add_decl(self, decl: z3.FuncDeclRef):
+        self.decls_by_id[decl.get_id()] = (str(decl), decl.arity())
+
+    def int_const(self, name: str) -> z3.ArithRef:
+        const = self.consts.get(name)
+        if const is None:
+            const = self.consts[name] = z3.Int(name)
+            self.add_decl(const.decl())
+        return const
+
+    def function(self, name: str, arity: int) -> z3.FuncDeclRef:
+        function = self.functions.get((name, arity))
+        if function is None:
+            function = self.functions[name, arity] = z3.Function(
+                name, *[z3.IntSort()] * (arity + 1)
+            )
+            self.add_decl(function)
+        return function
+
+    def int_val(self, value: int) -> z3.IntNumRef:
+        return z3.IntVal(value)
+
+    def bool_val(self, value: bool) -> z3.BoolRef:
+        return z3.BoolVal(value)
+
+    def and_(self, a: z3.BoolRef, b: z3.BoolRef) -> z3.BoolRef:
+        return z3And(a, b)
+
+    def conjunction(self, formulas: Sequence[z3.BoolRef]) -> z3.BoolRef:
+        conjuncts = [f for f in formulas if not z3.is_true(f)]
+        if any(z3.is_false(f) for f in conjuncts):
+            return z3.BoolVal(False)
+        if not conjuncts:
+            return z3.BoolVal(True)
+        if len(conjuncts) == 1:
+            return conjuncts[0]
+        return z3.And(*conjuncts)
+
+    def or_(self, a: z3.BoolRef, b: z3.BoolRef) -> z3.BoolRef:
+        return z3.Or(a, b)
+
+    def not_(self, a: z3.BoolRef) -> z3.BoolRef:
+        return z3.Not(a)
+
+    def implies(self, a: z3.BoolRef, b: z3.BoolRef) -> z3.BoolRef:
+        return z3.Implies(a, b)
+
+    def get_decl(self, decl: z3.FuncDeclRef) -> Optional[Tuple[str, int]]:
+        return self.decls_by_id.get(decl.get_id())
+
+    def get_decls(self, *formulas: z3.ExprRef) -> Dict[str, int]:
+        # The collector remembers the subterms it visited, so it is shared
+        # by all the formulas of the compilation.
+        if self.decl_collector is None:
+            self.decl_collector = DeclCollector(self.decls_by_id)
+        return self.decl_collector.get_decls(*formulas)
@@ -1,9 +1,8 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
 import z3
-from starkware.cairo.lang.compiler.ast.arguments import IdentifierList
 from starkware.cairo.lang.compiler.ast.bool_expr import BoolEqExpr
 from starkware.cairo.lang.compiler.ast.cairo_types import (
     CairoType,
@@ -49,7 +48,6 @@ from starkware.cairo.lang.compiler.preprocessor.preprocessor import Preprocessor
 from starkware.cairo.lang.compiler.preprocessor.preprocessor_error import (
     PreprocessorError,
 )
-from starkware.cairo.lang.compiler.resolve_search_result import resolve_search_result
 from starkware.cairo.lang.compiler.scoped_name import ScopedName
 from starkware.cairo.lang.compiler.type_casts import CairoTypeError
 from starkware.cairo.lang.compiler.type_system_visitor import *
@@ -64,9 +62,16 @@ from horus.compiler.code_elements import (
     BoolOperation,
     ExprLogicalIdentifier,
 )
-from horus.compiler.type_checker import simplify, simplify_and_get_type
+from horus.compiler.storage_vars import StorageVarIndex
+from horus.compiler.type_checker import (
+    ResolutionCache,
+    SimplifyCache,
+    resolve_identifier,
+    simplify,
+    simplify_and_get_type,
+)
 from horus.compiler.var_names import *
-from horus.utils import z3And, z3True
+from horus.compiler.z3_declarations import Declarations, Z3Declarations
 
 
 class Z3ExpressionTransformer(IdentifierAwareVisitor):
@@ -74,16 +79,24 @@ class Z3ExpressionTransformer(IdentifierAwareVisitor):
         self,
         identifiers: Optional[IdentifierManager] = None,
         z3_transformer: Optional[Z3Transformer] = None,
+        declarations: Optional[Declarations] = None,
     ):
-        self.prime = z3.Int(PRIME_CONST_NAME)
-        self.memory = z3.Function(MEMORY_MAP_NAME, z3.IntSort(), z3.IntSort())
+        if declarations is None:
+            declarations = (
+                z3_transformer.declarations
+                if z3_transformer is not None
+                else Z3Declarations()
+            )
+        self.declarations = declarations
+        self.prime = declarations.int_const(PRIME_CONST_NAME)
+        self.memory = declarations.function(MEMORY_MAP_NAME, 1)
         self.z3_transformer = z3_transformer
         if z3_transformer is not None:
             self.storage_vars = z3_transformer.storage_vars
         super().__init__(identifiers)
 
     def visit_ExprConst(self, expr: ExprConst):
-        return z3.IntVal(expr.val)
+        return self.declarations.int_val(expr.val)
 
     def visit_ExprHint(self, expr: ExprHint):
         raise PreprocessorError(
@@ -91,7 +104,7 @@ class Z3ExpressionTransformer(IdentifierAwareVisitor):
         )
 
     def visit_ExprLogicalIdentifier(self, expr: ExprLogicalIdentifier):
-        return z3.Int(expr.name)
+        return self.declarations.int_const(expr.name)
 
     def visit_ExprIdentifier(self, expr: ExprIdentifier):
         return ExprIdentifier(name=expr.name, location=expr.location)
@@ -103,9 +116,9 @@ class Z3ExpressionTransformer(IdentifierAwareVisitor):
 
     def visit_ExprReg(self, expr: ExprReg):
         if expr.reg == Register.AP:
-            return z3.Int(AP_VAR_NAME)
+            return self.declarations.int_const(AP_VAR_NAME)
         else:
-            return z3.Int(FP_VAR_NAME)
+            return self.declarations.int_const(FP_VAR_NAME)
 
     def visit_ExprOperator(self, expr: ExprOperator):
         a = self.visit(expr.a)
@@ -154,27 +167,25 @@ class Z3ExpressionTransformer(IdentifierAwareVisitor):
         if isinstance(expr.dest_type, TypeStruct):
             assert self.identifiers is not None
             assert self.z3_transformer is not None
-            search_result = self.identifiers.search(
-                self.z3_transformer.preprocessor.accessible_scopes, expr.dest_type.scope
+            search_result, definition = resolve_identifier(
+                self.identifiers,
+                self.z3_transformer.preprocessor.accessible_scopes,
+                expr.dest_type.scope,
+                self.z3_transformer.resolution_cache,
             )
-            definition = resolve_search_result(search_result, self.identifiers)
 
             if isinstance(definition, NamespaceDefinition):
-                if not search_result.canonical_name in self.z3_transformer.storage_vars:
+                info = self.z3_transformer.storage_vars.get(
+                    search_result.canonical_name
+                )
+                if info is None:
                     raise PreprocessorError(
                         f"{expr.dest_type.scope} is not a storage var.",
                         location=expr.location,
                     )
 
-                arg_struct_def = get_struct_definition(
-                    search_result.canonical_name + "read" + "Args", self.identifiers
-                )
-                assert isinstance(arg_struct_def, StructDefinition)
-
-                storage_var = z3.Function(
-                    str(search_result.canonical_name),
-                    *[z3.IntSort() for _ in arg_struct_def.members.values()],
-                    z3.IntSort(),
+                storage_var = self.declarations.function(
+                    str(search_result.canonical_name), info.arity
                 )
 
                 assert isinstance(expr.expr, ExprTuple)
@@ -184,7 +195,9 @@ class Z3ExpressionTransformer(IdentifierAwareVisitor):
                 return storage_var(*args)
             elif isinstance(definition, FunctionDefinition):
                 if search_result.canonical_name in allowed_syscalls:
-                    return z3.Int(expr.dest_type.scope.path[-1].replace("get_", "%"))
+                    return self.declarations.int_const(
+                        expr.dest_type.scope.path[-1].replace("get_", "%")
+                    )
 
         inner_expr = self.visit(expr.expr)
         return inner_expr
@@ -195,33 +208,33 @@ class Z3ExpressionTransformer(IdentifierAwareVisitor):
         reference. Otherwise an exception is thrown.
         """
         assert self.z3_transformer is not None
-        search_result = self.identifiers.search(
+        search_result, definition = resolve_identifier(
+            self.identifiers,
             self.z3_transformer.preprocessor.accessible_scopes,
             ScopedName.from_string(expr.rvalue.func_ident.name),
+            self.z3_transformer.resolution_cache,
         )
-        definition = resolve_search_result(search_result, self.identifiers)
         if search_result.canonical_name in allowed_syscalls:
-            return z3.Int(search_result.canonical_name.path[-1].replace("get_", "%"))
+            return self.declarations.int_const(
+                search_result.canonical_name.path[-1].replace("get_", "%")
+            )
 
         if isinstance(definition, NamespaceDefinition):
-            if not search_result.canonical_name in self.z3_transformer.storage_vars:
+            info = self.z3_transformer.storage_vars.get(search_result.canonical_name)
+            if info is None:
                 raise PreprocessorError(
                     f"{expr.rvalue.func_ident.name} is not a storage var.",
                     location=expr.location,
                 )
 
-            arg_struct_def = get_struct_definition(
-                search_result.canonical_name + "read" + "Args", self.identifiers
-            )
-            assert isinstance(arg_struct_def, StructDefinition)
-
-            storage_var = z3.Function(
-                str(search_result.canonical_name),
-                *[z3.IntSort() for _ in arg_struct_def.members.values()],
-                z3.IntSort(),
+            storage_var = self.declarations.function(
+                str(search_result.canonical_name), info.arity
             )
 
-            args = [self.visit(arg.expr) for arg in expr.rvalue.arguments.args]
+            args = [
+                self.visit(arg)
+                for arg in info.order_arguments(expr.rvalue.arguments.args)
+            ]
 
             return storage_var(*args)
 
@@ -249,8 +262,51 @@ class Z3ExpressionTransformer(IdentifierAwareVisitor):
         )
 
 
-def get_smt_expression(expr: Expression, identifiers: IdentifierManager):
-    return Z3ExpressionTransformer(identifiers).visit(expr)
+class TranslationSession:
+    """
+    The transformers translating the checks of the function whose body the
+    preprocessor visits, one for its preconditions and assertions and one
+    for its postconditions and storage updates, which are reused by all of
+    its checks. The type checker and the simplifier of the expressions are
+    kept by the simplify cache of each transformer.
+
+    A transformer is made again when the preprocessor replaces its
+    identifier manager (see `PreprocessorMemento`).
+    """
+
+    def __init__(
+        self,
+        preprocessor: Preprocessor,
+        storage_vars: StorageVarIndex,
+        declarations: Declarations,
+        resolution_cache: Optional[ResolutionCache] = None,
+    ):
+        self.preprocessor = preprocessor
+        self.storage_vars = storage_vars
+        self.declarations = declarations
+        self.resolution_cache = resolution_cache
+        self.transformers: Dict[bool, Z3Transformer] = {}
+
+    def get_transformer(
+        self, is_post: bool, logical_identifiers: Dict[str, CairoType]
+    ) -> Z3Transformer:
+        transformer = self.transformers.get(is_post)
+        if (
+            transformer is None
+            or transformer.identifiers is not self.preprocessor.identifiers
+        ):
+            transformer = self.transformers[is_post] = Z3Transformer(
+                self.preprocessor.identifiers,
+                self.preprocessor,
+                logical_identifiers,
+                self.storage_vars,
+                is_post,
+                declarations=self.declarations,
+                resolution_cache=self.resolution_cache,
+            )
+        else:
+            transformer.start_annotation(logical_identifiers)
+        return transformer
 
 
 class Z3Transformer(IdentifierAwareVisitor):
@@ -259,15 +315,30 @@ class Z3Transformer(IdentifierAwareVisitor):
         identifiers: IdentifierManager,
         preprocessor: Preprocessor,
         logical_identifiers: Dict[str, CairoType],
-        storage_vars: Dict[ScopedName, IdentifierList],
+        storage_vars: StorageVarIndex,
         is_post: bool = False,
+        declarations: Optional[Declarations] = None,
+        resolution_cache: Optional[ResolutionCache] = None,
     ):
         super().__init__(identifiers)
+        self.declarations = (
+            declarations if declarations is not None else Z3Declarations()
+        )
         self.preprocessor = preprocessor
         self.logical_identifiers = logical_identifiers
         self.is_post = is_post
         self.storage_vars = storage_vars
         self.z3_expression_transformer = Z3ExpressionTransformer(identifiers, self)
+        self.resolution_cache = resolution_cache
+        self.simplify_cache = SimplifyCache(resolution_cache)
+
+    def start_annotation(self, logical_identifiers: Dict[str, CairoType]):
+        """
+        Prepares the transformer to translate another annotation, at the
+        current position of the preprocessor.
+        """
+        self.logical_identifiers = logical_identifiers
+        self.simplify_cache.clear()
 
     def visit(self, formula: BoolFormula):
         funcname = f"visit_{type(formula).__name__}"
@@ -290,6 +361,7 @@ class Z3Transformer(IdentifierAwareVisitor):
                         self.logical_identifiers,
                         self.storage_vars,
                         self.is_post,
+                        self.simplify_cache,
                     )
 
             raise PreprocessorError(f"No member with the name {name}")
@@ -297,7 +369,7 @@ class Z3Transformer(IdentifierAwareVisitor):
             return ExprDot(expr, ExprIdentifier(name))
 
     def make_tuple_eq(self, a: Expression, b: Expression, type: TypeTuple):
-        result = z3True
+        result = self.declarations.bool_val(True)
         for i, member in enumerate(type.members):
             if member.name is not None:
                 member_a = self.get_member(a, member.name)
@@ -307,86 +379,84 @@ class Z3Transformer(IdentifierAwareVisitor):
                 member_b = self.get_element_at(b, i)
 
             if isinstance(member.typ, (TypeFelt, TypePointer)):
-                result = z3And(
+                result = self.declarations.and_(
                     result,
-                    get_smt_expression(
+                    self.z3_expression_transformer.visit(
                         simplify(
                             member_a,
                             self.preprocessor,
                             self.logical_identifiers,
                             self.storage_vars,
                             self.is_post,
-                        ),
-                        self.identifiers,
+                            self.simplify_cache,
+                        )
                     )
-                    == get_smt_expression(
+                    == self.z3_expression_transformer.visit(
                         simplify(
                             member_b,
                             self.preprocessor,
                             self.logical_identifiers,
                             self.storage_vars,
                             self.is_post,
-                        ),
-                        self.identifiers,
+                            self.simplify_cache,
+                        )
                     ),
                 )
             elif isinstance(member.typ, TypeStruct):
-                result = z3And(
+                result = self.declarations.and_(
                     result, self.make_struct_eq(member_a, member_b, member.typ)
                 )
             elif isinstance(member.typ, TypeTuple):
-                result = z3And(
+                result = self.declarations.and_(
                     result, self.make_tuple_eq(member_a, member_b, member.typ)
                 )
 
         return result
 
-    def make_struct_eq(
-        self, a: Expression, b: Expression, type: TypeStruct
-    ) -> z3.BoolRef:
+    def make_struct_eq(self, a: Expression, b: Expression, type: TypeStruct) -> Any:
         definition = get_struct_definition(
             struct_name=type.scope, identifier_manager=self.identifiers
         )
         assert isinstance(
             definition, StructDefinition
         ), "TypeStruct must contain StructDefinition"
-        result = z3True
+        result = self.declarations.bool_val(True)
         for member_name, member_definition in definition.members.items():
             member_a = self.get_member(a, member_name)
             member_b = self.get_member(b, member_name)
             if isinstance(member_definition.cairo_type, (TypeFelt, TypePointer)):
-                result = z3And(
+                result = self.declarations.and_(
                     result,
-                    get_smt_expression(
+                    self.z3_expression_transformer.visit(
                         simplify(
                             member_a,
                             self.preprocessor,
                             self.logical_identifiers,
                             self.storage_vars,
                             self.is_post,
-                        ),
-                        self.identifiers,
+                            self.simplify_cache,
+                        )
                     )
-                    == get_smt_expression(
+                    == self.z3_expression_transformer.visit(
                         simplify(
                             member_b,
                             self.preprocessor,
                             self.logical_identifiers,
                             self.storage_vars,
                             self.is_post,
-                        ),
-                        self.identifiers,
+                            self.simplify_cache,
+                        )
                     ),
                 )
             elif isinstance(member_definition.cairo_type, TypeStruct):
-                result = z3And(
+                result = self.declarations.and_(
                     result,
                     self.make_struct_eq(
                         member_a, member_b, member_definition.cairo_type
                     ),
                 )
             elif isinstance(member_definition.cairo_type, TypeTuple):
-                result = z3And(
+                result = self.declarations.and_(
                     result,
                     self.make_tuple_eq(
                         member_a, member_b, member_definition.cairo_type
@@ -404,6 +474,7 @@ class Z3Transformer(IdentifierAwareVisitor):
             self.logical_identifiers,
             self.storage_vars,
             self.is_post,
+            self.simplify_cache,
         )
         b, b_type = simplify_and_get_type(
             bool_expr.b,
@@ -411,6 +482,7 @@ class Z3Transformer(IdentifierAwareVisitor):
             self.logical_identifiers,
             self.storage_vars,
             self.is_post,
+            self.simplify_cache,
         )
 
         if a_type != b_type:
@@ -431,7 +503,7 @@ class Z3Transformer(IdentifierAwareVisitor):
         if bool_expr.eq:
             return result
         else:
-            return z3.Not(result)
+            return self.declarations.not_(result)
 
     def visit_BoolExprCompare(self, formula: BoolExprCompare):
         a, a_type = simplify_and_get_type(
@@ -440,6 +512,7 @@ class Z3Transformer(IdentifierAwareVisitor):
             self.logical_identifiers,
             self.storage_vars,
             self.is_post,
+            self.simplify_cache,
         )
         b, b_type = simplify_and_get_type(
             formula.b,
@@ -447,6 +520,7 @@ class Z3Transformer(IdentifierAwareVisitor):
             self.logical_identifiers,
             self.storage_vars,
             self.is_post,
+            self.simplify_cache,
         )
 
         if a_type != b_type:
@@ -474,20 +548,20 @@ class Z3Transformer(IdentifierAwareVisitor):
             )
 
     def visit_BoolConst(self, formula: BoolConst):
-        return z3.BoolVal(formula.const)
+        return self.declarations.bool_val(formula.const)
 
     def visit_BoolOperation(self, formula: BoolOperation):
         a = self.visit(formula.a)
         b = self.visit(formula.b)
 
         if formula.op == "&":
-            return z3And(a, b)
+            return self.declarations.and_(a, b)
         elif formula.op == "|":
-            return z3.Or(a, b)
+            return self.declarations.or_(a, b)
         elif formula.op == "->":
-            return z3.Implies(a, b)
+            return self.declarations.implies(a, b)
         else:
             raise PreprocessorError(f"unknown logical operation {formula.op}")
 
     def visit_BoolNegation(self, formula: BoolNegation):
-        return z3.Not(self.visit(formula.operand))
+        return self.declarations.not_(self.visit(formula.operand))
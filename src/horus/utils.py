@@ -8,22 +8,203 @@ z3False = z3.BoolVal(False)
 z3True = z3.BoolVal(True)
 
 
+class DeclCollector:
+    """
+    Collects the uninterpreted constants and functions of Z3 formulas.
+
+    Formulas are traversed iteratively, visiting every distinct subterm
+    (by AST id) once, so the time is linear in the size of the DAG rather
+    than of the tree. The declarations of the subterms are remembered,
+    so one collector should be shared by all the formulas of a program.
+
+    `known_decls` maps the AST ids of function declarations to their names
+    and arities (see `horus.compiler.z3_declarations.Z3Declarations`).
+    Subclasses can collect the declarations of other term representations
+    by overriding `get_id`, `get_children` and `get_decl`.
+    """
+
+    def __init__(self, known_decls: Optional[dict[int, tuple[str, int]]] = None):
+        self.known_decls = known_decls if known_decls is not None else {}
+        # The declaration (name and arity) of every visited subterm,
+        # or None if it is not an uninterpreted constant or function.
+        self.subterm_decls: dict[int, Optional[tuple[str, int]]] = {}
+
+    def get_id(self, f: z3.ExprRef) -> int:
+        if z3.z3_debug():
+            assert z3.is_expr(f)
+        ast_id: int = f.get_id()
+        return ast_id
+
+    def get_children(self, f: z3.ExprRef) -> list:
+        children: list = [] if z3.is_const(f) else f.children()
+        return children
+
+    def get_decl(self, f: z3.ExprRef) -> Optional[tuple[str, int]]:
+        known_decl = self.known_decls.get(f.decl().get_id()) if z3.is_app(f) else None
+        if known_decl is not None:
+            return known_decl
+        if z3.is_const(f):
+            if z3.z3util.is_expr_val(f):
+                return None
+            return str(f), 0
+        if f.decl().kind() == z3.Z3_OP_UNINTERPRETED:
+            return str(f.decl()), f.decl().arity()
+        return None
+
+    def get_decls(self, *formulas: z3.ExprRef) -> dict[str, int]:
+        """
+        Returns the declarations of `formulas`, by name, in the order in
+        which they first appear.
+        """
+        rs: dict[str, int] = {}
+        visited: set[int] = set()
+        stack = list(reversed(formulas))
+        while stack:
+            f = stack.pop()
+            ast_id = self.get_id(f)
+            if ast_id in visited:
+                continue
+            visited.add(ast_id)
+
+            if ast_id in self.subterm_decls:
+                decl = self.subterm_decls[ast_id]
+            else:
+                decl = self.subterm_decls[ast_id] = self.get_decl(f)
+            if decl is not None:
+                rs.setdefault(*decl)
+            stack.extend(reversed(self.get_children(f)))
+        return rs
+
+    def count_nodes(self, *formulas: z3.ExprRef) -> int:
+        """
+        Returns the number of distinct subterms of `formulas`.
+        """
+        visited: set[int] = set()
+        stack = list(formulas)
+        while stack:
+            f = stack.pop()
+            ast_id = self.get_id(f)
+            if ast_id not in visited:
+                visited.add(ast_id)
+                stack.extend(self.get_children(f))
+        return len(visited)
+
+
 def get_decls(f: z3.ExprRef, rs: Optional[dict[str, int]] = None) -> dict[str, int]:
     if rs is None:
         rs = {}
-    if z3.z3_debug():
-        assert z3.is_expr(f)
-    if z3.is_const(f):
-        if not z3.z3util.is_expr_val(f):
-            rs.setdefault(str(f), 0)
-        return rs
-    if f.decl().kind() == z3.Z3_OP_UNINTERPRETED:
-        rs.setdefault(str(f.decl()), f.decl().arity())
-    for f_ in f.children():
-        get_decls(f_, rs)
+    for name, arity in DeclCollector().get_decls(f).items():
+        rs.setdefault(name, arity)
     return rs
 
 
+class CompactPrinter:
+    """
+    Prints Z3 formulas as single-line SMT-LIB terms in which every
+    application occurring more than once is bound by a `let`, so the
+    size of the output is linear in the size of the DAG.
+
+    Subclasses can print other term representations by overriding
+    `get_id`, `get_children`, `get_leaf_text` and `get_head`.
+    """
+
+    def __init__(self):
+        # The operator of every function declaration, by AST id.
+        self.heads: dict[int, str] = {}
+
+    def get_head(self, f: z3.ExprRef) -> str:
+        decl = f.decl()
+        decl_id = decl.get_id()
+        head = self.heads.get(decl_id)
+        if head is None:
+            # The name of an operator (e.g. "ite") or a quoted symbol is
+            # taken from z3's printer, applied to fresh arguments.
+            args = [z3.FreshConst(decl.domain(i)) for i in range(decl.arity())]
+            head = self.heads[decl_id] = decl(*args).sexpr()[1:].split(None, 1)[0]
+        return head
+
+    def is_opaque(self, f: z3.ExprRef) -> bool:
+        """
+        Returns whether `f` is printed by z3 as a whole, e.g. quantifiers
+        and indexed operators.
+        """
+        return not z3.is_app(f) or len(f.decl().params()) > 0
+
+    def get_id(self, f: z3.ExprRef) -> int:
+        ast_id: int = f.get_id()
+        return ast_id
+
+    def get_children(self, f: z3.ExprRef) -> list:
+        """
+        Returns the arguments of `f`, or an empty list if `f` is printed
+        by `get_leaf_text`.
+        """
+        children: list = [] if self.is_opaque(f) else f.children()
+        return children
+
+    def get_leaf_text(self, f: z3.ExprRef) -> str:
+        return " ".join(f.sexpr().split())
+
+    def print(self, f: z3.ExprRef) -> str:
+        # The subterms of `f` in post-order and the number of times each
+        # of them is an argument.
+        order: list[z3.ExprRef] = []
+        n_refs: dict[int, int] = {}
+        stack: list[tuple[z3.ExprRef, bool]] = [(f, False)]
+        while stack:
+            g, children_done = stack.pop()
+            ast_id = self.get_id(g)
+            if children_done:
+                order.append(g)
+                continue
+            if ast_id in n_refs:
+                n_refs[ast_id] += 1
+                continue
+            n_refs[ast_id] = 1
+            stack.append((g, True))
+            stack.extend((child, False) for child in reversed(self.get_children(g)))
+
+        texts: dict[int, str] = {}
+        # For shared subterms, the nesting level of their let binding,
+        # and for the others the highest level of the bindings they use.
+        levels: dict[int, int] = {}
+        bindings: list[tuple[int, str, str]] = []
+        for g in order:
+            ast_id = self.get_id(g)
+            children = self.get_children(g)
+            if not children:
+                texts[ast_id] = self.get_leaf_text(g)
+                levels[ast_id] = 0
+                continue
+
+            child_ids = [self.get_id(child) for child in children]
+            text = (
+                "(" + " ".join([self.get_head(g)] + [texts[i] for i in child_ids]) + ")"
+            )
+            level = max(levels[i] for i in child_ids)
+            if n_refs[ast_id] > 1:
+                name = f"let!{len(bindings)}"
+                level += 1
+                bindings.append((level, name, text))
+                text = name
+            texts[ast_id] = text
+            levels[ast_id] = level
+
+        result = texts[self.get_id(f)]
+        for level in range(levels[self.get_id(f)], 0, -1):
+            definitions = " ".join(
+                f"({name} {text})"
+                for binding_level, name, text in bindings
+                if binding_level == level
+            )
+            result = f"(let ({definitions}) {result})"
+        return result
+
+
+def compact_sexpr(f: z3.ExprRef) -> str:
+    return CompactPrinter().print(f)
+
+
 def make_declare_funs(structs: dict[str, list[z3.ArithSortRef]]) -> str:
     return "\n".join(make_declare_fun(name, arity) for name, arity in structs.items())
 
@@ -0,0 +1,53 @@
+import dataclasses
+import io
+from typing import Optional
+
+import pytest
+from starkware.cairo.lang.compiler.preprocessor.preprocessor import PreprocessedProgram
+
+from horus.compiler.cache import CACHE_DIR_ENVVAR
+from horus.compiler.horus_compile import get_arg_parser, horus_compile
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory, monkeypatch):
+    """
+    Keeps the caches of every test (in particular the build cache, which
+    would answer later runs without compiling) out of the user's cache
+    directory.
+    """
+    path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv(CACHE_DIR_ENVVAR, str(path))
+    return path
+
+
+@dataclasses.dataclass
+class CompiledStrings:
+    program: str
+    specs: str
+    abi: str
+    # None if the outputs were taken from the build cache.
+    preprocessed: Optional[PreprocessedProgram]
+
+
+def compile_to_strings(*argv: str) -> CompiledStrings:
+    """
+    Compiles with the command line arguments `argv`, writing the program,
+    the specifications and the ABI to strings.
+    """
+    args = get_arg_parser().parse_args(list(argv))
+    args.output = io.StringIO()
+    args.spec_output = io.StringIO()
+    args.abi = io.StringIO()
+    preprocessed = horus_compile(args)
+    return CompiledStrings(
+        program=args.output.getvalue(),
+        specs=args.spec_output.getvalue(),
+        abi=args.abi.getvalue(),
+        preprocessed=preprocessed,
+    )
+
+
+@pytest.fixture(name="compile_to_strings")
+def compile_to_strings_fixture():
+    return compile_to_strings
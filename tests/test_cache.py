@@ -0,0 +1,205 @@
+import os
+from pathlib import Path
+
+import pytest
+from starkware.cairo.lang.compiler.ast.module import CairoFile
+from starkware.cairo.lang.compiler.error_handling import LocationError
+
+import horus.compiler.parser
+from horus.compiler.cache import LRUFileCache
+from horus.compiler.parser import make_parsed_file_cache, parse
+
+TESTS = Path(__file__).parent
+
+
+def test_lru_file_cache_evicts_least_recently_used(tmp_path):
+    # Evicting down to 90% of 35 bytes removes one entry of 10 bytes.
+    cache = LRUFileCache(str(tmp_path), max_size=35)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set(key, b"x" * 10)
+        os.utime(cache.get_path(key), ns=(i, i))
+
+    # Using "a" makes "b" the least recently used entry.
+    assert cache.get("a") == b"x" * 10
+    cache.set("d", b"x" * 10)
+
+    assert cache.get("b") is None
+    for key in ["a", "c", "d"]:
+        assert cache.get(key) == b"x" * 10
+
+
+def test_lru_file_cache_scans_only_when_full(tmp_path, monkeypatch):
+    """
+    Test that writing entries only scans the cache directory on the first
+    write and when the entries exceed the maximal size.
+    """
+    cache = LRUFileCache(str(tmp_path), max_size=100)
+    scans = []
+    os_scandir = os.scandir
+
+    def scandir(path):
+        scans.append(path)
+        return os_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", scandir)
+
+    for i in range(10):
+        cache.set(str(i), b"x" * 10)
+        os.utime(cache.get_path(str(i)), ns=(i, i))
+    assert len(scans) == 1
+
+    cache.set("10", b"x" * 10)
+    assert len(scans) == 2
+    # The least recently used entries are removed until 90 bytes are left.
+    assert len(os.listdir(tmp_path)) == 9
+    assert cache.get("0") is None and cache.get("1") is None
+    cache.set("11", b"x" * 10)
+    assert len(scans) == 2
+
+
+def test_parsed_files_are_reused_across_caches(tmp_path, monkeypatch):
+    """
+    Test that a file parsed once is loaded from the cache directory
+    by another cache, e.g. in a later compilation.
+    """
+    filename = str(TESTS / "golden" / "func_id.cairo")
+    code = Path(filename).read_text()
+
+    monkeypatch.setattr(
+        horus.compiler.parser,
+        "parsed_file_cache",
+        make_parsed_file_cache(in_memory=False, cache_dir=str(tmp_path)),
+    )
+    parsed = parse(filename, code, "cairo_file", CairoFile)
+    assert len(os.listdir(tmp_path / "ast")) == 1
+
+    other_cache = make_parsed_file_cache(in_memory=False, cache_dir=str(tmp_path))
+    key = other_cache.get_key(filename, code, None)
+    assert other_cache.get(key) == parsed
+    assert other_cache.get(other_cache.get_key(filename, code + "\n", None)) is None
+
+
+def test_build_cache(tmp_path, monkeypatch, compile_to_strings):
+    """
+    Test that the outputs of a compilation are reused while its sources,
+    which include the imported modules, and its flags are unchanged.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "lib.cairo").write_text(
+        "// @post $Return.res == x + 1\n"
+        "func inc(x: felt) -> (res: felt) {\n"
+        "    return (res=x + 1);\n"
+        "}\n"
+    )
+    (tmp_path / "main.cairo").write_text(
+        "%lang starknet\n"
+        "from lib import inc\n\n"
+        "@external\n"
+        "func f(x: felt) -> (res: felt) {\n"
+        "    return inc(x);\n"
+        "}\n"
+    )
+
+    def compile_contract(*flags):
+        compiled = compile_to_strings(
+            "main.cairo", "--cache_dir", str(tmp_path / "cache"), *flags
+        )
+        outputs = [compiled.program, compiled.specs, compiled.abi]
+        return compiled.preprocessed is None, outputs
+
+    hit, outputs = compile_contract()
+    assert not hit
+    assert "lib.inc" in outputs[1] and '"f"' in outputs[2]
+    assert compile_contract() == (True, outputs)
+    assert compile_contract("--no_build_cache") == (False, outputs)
+
+    hit, compact_outputs = compile_contract("--compact_json")
+    assert not hit and compact_outputs != outputs
+    assert compile_contract("--compact_json") == (True, compact_outputs)
+
+    (tmp_path / "lib.cairo").write_text(
+        (tmp_path / "lib.cairo").read_text().replace("x + 1", "x + 2")
+    )
+    hit, changed_outputs = compile_contract()
+    assert not hit and changed_outputs != outputs
+    assert compile_contract() == (True, changed_outputs)
+
+
+def test_build_cache_entry_files(tmp_path, monkeypatch, compile_to_strings):
+    """
+    Test that the outputs are kept in files of their own, which replace the
+    previous ones, and that an entry missing one of them is compiled again.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "main.cairo").write_text(
+        "// @post $Return.res == x + 1\n"
+        "func inc(x: felt) -> (res: felt) {\n"
+        "    return (res=x + 1);\n"
+        "}\n"
+    )
+    build_dir = tmp_path / "cache" / "build"
+
+    def compile_contract():
+        compiled = compile_to_strings(
+            "main.cairo", "--cache_dir", str(tmp_path / "cache")
+        )
+        outputs = [compiled.program, compiled.specs, compiled.abi]
+        return compiled.preprocessed is None, outputs
+
+    hit, outputs = compile_contract()
+    assert not hit
+    parts = {path.suffix: path.read_text() for path in build_dir.glob("*-*.*")}
+    assert parts == dict(zip([".program", ".specs", ".abi"], outputs))
+    assert not list(build_dir.glob(".tmp-*"))
+
+    next(build_dir.glob("*-*.specs")).unlink()
+    assert compile_contract() == (False, outputs)
+    assert len(list(build_dir.glob("*-*.*"))) == 3
+    assert compile_contract() == (True, outputs)
+
+    (tmp_path / "main.cairo").write_text("func f(\n")
+    with pytest.raises(LocationError):
+        compile_contract()
+    assert not list(build_dir.glob(".tmp-*"))
+
+
+def test_build_cache_shadowed_module(tmp_path, monkeypatch, compile_to_strings):
+    """
+    Test that a compilation is not taken from the build cache once a module
+    it imports is shadowed by a file added earlier on the cairo path.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "deps").mkdir()
+    (tmp_path / "shadow").mkdir()
+    lib = (
+        "// @post $Return.res == x + 1\n"
+        "func inc(x: felt) -> (res: felt) {\n"
+        "    return (res=x + 1);\n"
+        "}\n"
+    )
+    (tmp_path / "deps" / "lib.cairo").write_text(lib)
+    (tmp_path / "main.cairo").write_text(
+        "from lib import inc\n\n"
+        "func f(x: felt) -> (res: felt) {\n"
+        "    return inc(x);\n"
+        "}\n"
+    )
+
+    def compile_contract():
+        compiled = compile_to_strings(
+            "main.cairo",
+            "--cairo_path",
+            "shadow:deps",
+            "--cache_dir",
+            str(tmp_path / "cache"),
+        )
+        return compiled.preprocessed is None, compiled.specs
+
+    hit, specs = compile_contract()
+    assert not hit
+    assert compile_contract() == (True, specs)
+
+    (tmp_path / "shadow" / "lib.cairo").write_text(lib.replace("x + 1", "x + 2"))
+    hit, shadowed_specs = compile_contract()
+    assert not hit and shadowed_specs != specs
+    assert compile_contract() == (True, shadowed_specs)
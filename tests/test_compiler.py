@@ -1,9 +1,25 @@
 import glob
 import json
+import os
+import re
+import subprocess
+import sys
 from io import StringIO
 from os.path import exists
+from pathlib import Path
 
+import pytest
+import z3
+
+import horus.compiler.batch
+import horus.compiler.parser
+from horus.compiler.batch import compile_batch
+from horus.compiler.compile_server import serve
 from horus.compiler.horus_compile import main
+from horus.compiler.json_output import JsonObject, write_json
+from horus.compiler.terms import TermDeclarations
+from horus.compiler.var_names import HORUS_DECLS
+from horus.compiler.z3_declarations import Declarations
 
 
 def test_golden(capsys):
@@ -33,3 +49,522 @@ def test_golden(capsys):
                 text = gold.read()
             out = run_horus_compile(file)
             assert text == out
+
+
+def test_version_does_not_load_compiler():
+    """
+    `--version` and argument errors must not import the compiler stack.
+    """
+    code = (
+        "import sys\n"
+        "from horus.compiler.horus_compile import main\n"
+        "try:\n"
+        "    main(['--version'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(sys.modules))\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stdout
+    loaded = set(out.split())
+    for module in [
+        "z3",
+        "lark",
+        "horus.compiler.parser",
+        "horus.compiler.contract_definition",
+        "starkware.cairo.lang.compiler.cairo_compile",
+    ]:
+        assert module not in loaded
+
+
+def test_serve(monkeypatch):
+    """
+    Test that the compile server answers every request in order and
+    produces the same specifications as the command line.
+    """
+    monkeypatch.setattr(horus.compiler.parser, "parsed_file_cache", None)
+    requests = StringIO(
+        "\n".join(
+            [
+                json.dumps(
+                    {
+                        "id": 1,
+                        "files": ["./tests/golden/func_id.cairo"],
+                        "cairo_path": "./tests/golden",
+                    }
+                ),
+                "not json",
+                json.dumps({"id": 2, "files": ["./tests/golden/missing.cairo"]}),
+                json.dumps(
+                    {
+                        "id": 3,
+                        "files": ["./tests/golden/func_id.cairo"],
+                        "flags": ["--no_debug_info"],
+                    }
+                ),
+            ]
+        )
+    )
+    responses = StringIO()
+    assert serve(requests, responses) == 0
+    first, invalid, missing, second = map(json.loads, responses.getvalue().splitlines())
+
+    with open("./tests/golden/func_id.gold") as gold:
+        expected = json.load(gold)
+    for response in [first, second]:
+        assert "error" not in response
+        assert response["specs"]["specifications"] == expected["specifications"]
+        assert "data" in response["program"]["program"]
+    assert first["id"] == 1 and second["id"] == 3
+    assert invalid["id"] is None and "error" in invalid
+    assert missing["id"] == 2 and "error" in missing
+
+
+def test_serve_rejects_output_files(tmp_path):
+    """
+    Test that a request can't name output files, which would be truncated
+    although the outputs are returned in the response.
+    """
+    output = tmp_path / "output.json"
+    output.write_text("kept")
+    requests = StringIO(
+        "\n".join(
+            json.dumps(
+                {"id": 1, "files": ["./tests/golden/func_id.cairo"], "flags": flags}
+            )
+            for flags in [
+                ["--output", str(output)],
+                ["--spec_output", str(output)],
+                ["--abi", str(output)],
+                ["--outp", str(output)],
+            ]
+        )
+    )
+    responses = StringIO()
+    assert serve(requests, responses) == 0
+    for line in responses.getvalue().splitlines():
+        assert json.loads(line)["error"].startswith("Invalid request: --output")
+    assert output.read_text() == "kept"
+
+
+@pytest.mark.parametrize("use_build_cache", [True, False])
+def test_serve_cache_options(tmp_path, cache_dir, use_build_cache):
+    """
+    Test that the cache directory and --no_build_cache of the server apply
+    to the compilations of its requests.
+    """
+    requests = StringIO(
+        json.dumps({"id": 1, "files": ["./tests/golden/func_id.cairo"]}) + "\n"
+    )
+    responses = StringIO()
+    server_cache_dir = tmp_path / "cache"
+    assert (
+        serve(
+            requests,
+            responses,
+            cache_dir=str(server_cache_dir),
+            use_build_cache=use_build_cache,
+        )
+        == 0
+    )
+    assert "error" not in json.loads(responses.getvalue())
+    assert (server_cache_dir / "build").exists() == use_build_cache
+    assert not (cache_dir / "build").exists()
+
+
+def test_incremental(tmp_path, compile_to_strings):
+    """
+    Test that an incremental compilation only compiles the specifications
+    of the changed functions again and produces the same output as
+    a full compilation.
+    """
+    source = tmp_path / "func_id.cairo"
+    state_file = str(tmp_path / "state.json")
+    code = (Path("tests") / "golden" / "func_id.cairo").read_text()
+
+    def run_horus_compile(*flags):
+        compiled = compile_to_strings(str(source), *flags)
+        return compiled.preprocessed, json.loads(compiled.specs)
+
+    source.write_text(code)
+    first, first_specs = run_horus_compile("--incremental", state_file)
+    assert not first.reused_functions
+    second, second_specs = run_horus_compile("--incremental", state_file)
+    assert second.reused_functions == set(second.function_fingerprints)
+    assert second_specs == first_specs
+
+    # A changed postcondition.
+    source.write_text(code.replace("== 42", "== 41"))
+    changed, changed_specs = run_horus_compile("--incremental", state_file)
+    assert [str(name) for name in changed.reused_functions] == ["__main__.id"]
+    _, full_specs = run_horus_compile()
+    assert changed_specs == full_specs != first_specs
+
+    # A changed bytecode.
+    source.write_text(code.replace("= 42", "= 41"))
+    rebuilt, rebuilt_specs = run_horus_compile("--incremental", state_file)
+    assert not rebuilt.reused_functions
+    _, full_specs = run_horus_compile()
+    assert rebuilt_specs == full_specs
+
+
+def test_compact_sexpr_format(compile_to_strings):
+    """
+    Test that the compact formulas are single lines equivalent to the
+    pretty-printed ones.
+    """
+
+    def get_formulas(sexpr_format):
+        compiled = compile_to_strings(
+            "tests/golden/gauss.cairo", "--sexpr_format", sexpr_format
+        )
+        specs = json.loads(compiled.specs)
+        annotations = [
+            annotation
+            for specification in specs["specifications"].values()
+            for annotation in [specification["pre"], specification["post"]]
+        ] + list(specs["invariants"].values())
+        return [annotation["sexpr"] for annotation in annotations]
+
+    pretty = get_formulas("pretty")
+    compact = get_formulas("compact")
+    assert len(pretty) == len(compact)
+    assert any(len(lines) > 1 for lines in pretty)
+    assert any(lines[0].startswith("(let") for lines in compact)
+    for pretty_lines, compact_lines in zip(pretty, compact):
+        assert len(compact_lines) == 1
+        [a] = z3.parse_smt2_string(
+            "(assert " + "\n".join(pretty_lines) + ")", decls=HORUS_DECLS
+        )
+        [b] = z3.parse_smt2_string(f"(assert {compact_lines[0]})", decls=HORUS_DECLS)
+        solver = z3.Solver()
+        solver.add(a != b)
+        assert solver.check() == z3.unsat
+
+
+@pytest.mark.parametrize("sexpr_format", ["pretty", "compact"])
+def test_python_term_backend(sexpr_format, compile_to_strings):
+    """
+    Test that the python term backend produces the same specifications
+    as the z3 backend.
+    """
+
+    def get_specs(file, term_backend):
+        return compile_to_strings(
+            file,
+            "--cairo_path",
+            "tests/golden",
+            "--sexpr_format",
+            sexpr_format,
+            "--term_backend",
+            term_backend,
+        ).specs
+
+    for name in ["gauss", "toy_amm", "storage_read_and_write", "weird_loop"]:
+        file = f"tests/golden/{name}.cairo"
+        assert get_specs(file, "python") == get_specs(file, "z3")
+
+
+def test_terms_are_not_booleans():
+    """
+    Test that comparisons of terms, which build formulas, cannot be used as
+    booleans, as with z3.
+    """
+    declarations = TermDeclarations()
+    x = declarations.int_const("x")
+    with pytest.raises(TypeError):
+        bool(x == x)
+    with pytest.raises(TypeError):
+        x in [declarations.int_const("y")]
+    with pytest.raises(TypeError):
+        Declarations()  # type: ignore
+
+
+def test_json_output(compile_to_strings):
+    """
+    Test that values are written as by `json.dump` with sorted keys, and
+    that --compact_json writes the same JSON on one line.
+    """
+    value = {
+        "b": [1, "x\u00e9", None, True, 1.5],
+        "a": {10: {}, 2: [], 3: [{"d": [[]]}, "e"]},
+    }
+    out = StringIO()
+    write_json(JsonObject(sorted(value.items())), out)
+    assert out.getvalue() == json.dumps(value, indent=4, sort_keys=True)
+
+    def get_outputs(*flags):
+        compiled = compile_to_strings(
+            "tests/golden/toy_amm.cairo",
+            "--cairo_path",
+            "tests/golden",
+            "--debug_info_with_source",
+            *flags,
+        )
+        return [compiled.program, compiled.specs]
+
+    pretty = get_outputs()
+    compact = get_outputs("--compact_json")
+    for pretty_text, compact_text in zip(pretty, compact):
+        assert compact_text.count("\n") == 1
+        assert json.loads(compact_text) == json.loads(pretty_text)
+    assert json.loads(pretty[0])["program"]["debug_info"]["file_contents"]
+
+
+def test_profile(tmp_path, capsys, compile_to_strings):
+    """
+    Test that --profile reports the stages and the counters of the
+    compilation without changing its outputs, and that --profile_trace
+    writes them as trace events.
+    """
+
+    def get_outputs(*flags):
+        compiled = compile_to_strings(
+            "tests/golden/toy_amm.cairo", "--cairo_path", "tests/golden", *flags
+        )
+        return [compiled.program, compiled.specs]
+
+    expected = get_outputs()
+    assert capsys.readouterr().err == ""
+    trace_file = tmp_path / "trace.json"
+    assert get_outputs("--profile_trace", str(trace_file)) == expected
+
+    table = capsys.readouterr().err
+    for stage in ["module_collector", "preprocessor", "assembly", "program output"]:
+        assert stage in table
+    assert "  annotation translation" in table
+    assert f"bytes written: {sum(len(output) for output in expected)}" in table
+    assert re.search(r"identifier resolution cache hits: \d+ \(\d+\.\d%\)", table)
+
+    with open(trace_file) as f:
+        events = json.load(f)["traceEvents"]
+    stages = {event["name"] for event in events if event["ph"] == "X"}
+    assert {"preprocessor", "annotation translation", "assembly"} <= stages
+    counters = {event["name"]: event["args"] for event in events if event["ph"] == "C"}
+    assert counters["annotations"]["annotations"] > 0
+    assert counters["SMT nodes"]["SMT nodes"] > 0
+
+
+@pytest.mark.parametrize("term_backend", ["z3", "python"])
+def test_many_annotations(tmp_path, term_backend, compile_to_strings):
+    """
+    Test that hundreds of checks on one function are joined into a single
+    flat conjunction, keeping all of their sources in order.
+    """
+    n = 300
+    lines = []
+    for i in range(n):
+        lines.append(f"// @pre x != {i}")
+        lines.append(f"// @post $Return.res != {i} + x")
+        lines.append(f"// @post $Return.res != {i}")
+    lines += [
+        "func f(x: felt) -> (res: felt) {",
+        "    return (res=x);",
+        "}",
+    ]
+    file = tmp_path / "many_annotations.cairo"
+    file.write_text("\n".join(lines))
+    compiled = compile_to_strings(
+        str(file), "--sexpr_format", "compact", "--term_backend", term_backend
+    )
+    [specification] = json.loads(compiled.specs)["specifications"].values()
+
+    pre = specification["pre"]
+    post = specification["post"]
+    assert pre["source"] == [f"x != {i}" for i in range(n)]
+    assert len(post["source"]) == 2 * n
+    for annotation, n_conjuncts in [(pre, n), (post, 2 * n)]:
+        [sexpr] = annotation["sexpr"]
+        [formula] = z3.parse_smt2_string(f"(assert {sexpr})", decls=HORUS_DECLS)
+        assert formula.decl().kind() == z3.Z3_OP_AND
+        assert formula.num_args() == n_conjuncts
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_batch(tmp_path, monkeypatch, jobs):
+    """
+    Test that every contract of a batch is compiled to its own outputs,
+    in the order of the manifest, and that a failing contract doesn't stop
+    the others.
+    """
+    monkeypatch.setattr(horus.compiler.parser, "parsed_file_cache", None)
+    golden = Path("tests/golden").absolute()
+    # The compiler fails with an AssertionError on storage updates of maps
+    # with struct arguments.
+    unsupported = tmp_path / "unsupported.cairo"
+    unsupported.write_text(
+        "\n".join(
+            [
+                "%lang starknet",
+                "struct Key {",
+                "    a: felt,",
+                "    b: felt,",
+                "}",
+                "@storage_var",
+                "func balance(key: Key) -> (res: felt) {",
+                "}",
+                "// @storage_update balance(k) := 1",
+                "func f{syscall_ptr: felt*, pedersen_ptr: felt*, range_check_ptr}(",
+                "    k: Key",
+                ") {",
+                "    return ();",
+                "}",
+            ]
+        )
+    )
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {
+                    "files": [str(golden / "missing.cairo")],
+                    "output": "missing.json",
+                    "spec_output": "missing_specs.json",
+                },
+                {
+                    "files": [str(unsupported)],
+                    "output": "unsupported.json",
+                    "spec_output": "unsupported_specs.json",
+                },
+                {
+                    "files": [str(golden / "func_id.cairo")],
+                    "output": "func_id.json",
+                    "spec_output": "func_id_specs.json",
+                },
+            ]
+        )
+    )
+    summary = StringIO()
+    assert compile_batch(str(manifest), summary=summary, jobs=jobs) == 1
+
+    with open(golden / "func_id.gold") as gold:
+        expected = json.load(gold)
+    specs = json.loads((tmp_path / "func_id_specs.json").read_text())
+    assert specs["specifications"] == expected["specifications"]
+    assert "data" in json.loads((tmp_path / "func_id.json").read_text())["program"]
+    lines = summary.getvalue().splitlines()
+    assert lines[0].startswith(f"{golden / 'missing.cairo'}: FileNotFoundError")
+    assert f"{unsupported}: AssertionError: Non-felt arguments" in lines[2]
+    assert lines[-2].startswith(str(golden / "func_id.cairo"))
+    assert lines[-1].startswith("total")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("use_build_cache", [True, False])
+def test_batch_cache_options(tmp_path, cache_dir, jobs, use_build_cache):
+    """
+    Test that the cache directory and --no_build_cache of a batch apply to
+    the compilations of its contracts.
+    """
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {
+                    "files": [str(Path("tests/golden/func_id.cairo").absolute())],
+                    "output": "func_id.json",
+                    "spec_output": "func_id_specs.json",
+                }
+            ]
+        )
+    )
+    batch_cache_dir = tmp_path / "cache"
+    summary = StringIO()
+    assert (
+        compile_batch(
+            str(manifest),
+            cache_dir=str(batch_cache_dir),
+            summary=summary,
+            jobs=jobs,
+            use_build_cache=use_build_cache,
+        )
+        == 0
+    ), summary.getvalue()
+    assert (batch_cache_dir / "build").exists() == use_build_cache
+    assert not (cache_dir / "build").exists()
+
+
+def test_batch_broken_pool(tmp_path, monkeypatch):
+    """
+    Test that the contracts of a batch whose workers exit are reported as
+    failed, and that the summary is still written.
+    """
+
+    def exit_worker(*args):
+        os._exit(1)
+
+    # The workers are forked, with the patched module.
+    monkeypatch.setattr(horus.compiler.batch, "compile_contract", exit_worker)
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            [
+                {
+                    "files": [f"contract{i}.cairo"],
+                    "output": f"contract{i}.json",
+                    "spec_output": f"contract{i}_specs.json",
+                }
+                for i in range(2)
+            ]
+        )
+    )
+    summary = StringIO()
+    assert compile_batch(str(manifest), summary=summary, jobs=2) == 1
+
+    lines = summary.getvalue().splitlines()
+    for i in range(2):
+        assert lines[2 * i].startswith(f"contract{i}.cairo: BrokenProcessPool")
+        assert lines[2 * i + 1].split() == [f"contract{i}.cairo", "-", "failed"]
+    assert lines[-1].startswith("total")
+
+
+@pytest.mark.parametrize("argv", [["contract.cairo"], ["--serve"]])
+def test_jobs_requires_batch(capsys, argv):
+    """
+    Test that --jobs is rejected without --batch, instead of being ignored.
+    """
+    with pytest.raises(SystemExit):
+        main([*argv, "--jobs", "2"])
+    assert "--jobs requires --batch" in capsys.readouterr().err
+
+
+def test_storage_var_arguments(tmp_path, compile_to_strings):
+    """
+    Test that the arguments of storage variables in annotations are matched
+    by position or by name, in any order.
+    """
+
+    def compile_post(post: str):
+        file = tmp_path / "storage_var_arguments.cairo"
+        file.write_text(
+            "\n".join(
+                [
+                    "%lang starknet",
+                    "@storage_var",
+                    "func balance(account: felt, token: felt) -> (res: felt) {",
+                    "}",
+                    f"// @post {post}",
+                    "func f(x: felt, y: felt) -> (res: felt) {",
+                    "    return (res=x);",
+                    "}",
+                ]
+            )
+        )
+        compiled = compile_to_strings(str(file))
+        [specification] = json.loads(compiled.specs)["specifications"].values()
+        return specification["post"]["sexpr"]
+
+    expected = compile_post("$Return.res == balance(x, y)")
+    assert compile_post("$Return.res == balance(x, token=y)") == expected
+    assert compile_post("$Return.res == balance(token=y, account=x)") == expected
+    for post, message in [
+        ("$Return.res == balance(x)", "has 2 arguments. Provided 1"),
+        ("$Return.res == balance(x, account=y)", "Unknown argument account"),
+        ("$Return.res == balance(token=x, y)", "Unnamed argument cannot follow"),
+    ]:
+        with pytest.raises(Exception, match=message):
+            compile_post(post)
@@ -0,0 +1,155 @@
+import json
+from pathlib import Path
+
+import marshmallow_dataclass
+import pytest
+import z3
+from marshmallow.exceptions import ValidationError
+from starkware.cairo.lang.compiler.ast.cairo_types import TypeFelt, TypePointer
+from starkware.cairo.lang.compiler.scoped_name import ScopedName
+
+from horus.compiler.contract_definition import (
+    Annotation,
+    FunctionAnnotations,
+    HorusDefinition,
+    LazyDict,
+    StorageUpdate,
+    decode_horus_definition,
+    encode_horus_definition,
+    load_horus_definition,
+)
+from horus.compiler.var_names import HORUS_DECLS
+
+HorusDefinitionSchema = marshmallow_dataclass.class_schema(HorusDefinition)
+
+TESTS = Path(__file__).parent
+
+
+def make_definition() -> HorusDefinition:
+    ap, fp, memory = HORUS_DECLS["ap"], HORUS_DECLS["fp"], HORUS_DECLS["memory"]
+    x = memory(fp - 3)
+    # Large enough for z3 to print it on several lines.
+    post = z3.And([memory(ap - i) == x + i for i in range(1, 20)])
+    storage_update = StorageUpdate(
+        arguments=[x], value=memory(fp - 4) + 1, source="balance(x) := y + 1"
+    )
+    return HorusDefinition(
+        specifications={
+            ScopedName.from_string("__main__.f"): FunctionAnnotations(
+                pre=Annotation(sexpr=z3.And(x >= 0, ap > fp), source=["x >= 0"]),
+                post=Annotation(sexpr=post, source=["$Return.a == x + 1"]),
+                logical_variables={
+                    ScopedName.from_string("v"): TypeFelt(),
+                    ScopedName.from_string("p"): TypePointer(pointee=TypeFelt()),
+                },
+                decls={"__main__.balance": 1},
+                storage_update={
+                    ScopedName.from_string("__main__.balance"): [storage_update]
+                },
+            ),
+            ScopedName.from_string("__main__.g"): FunctionAnnotations(),
+        },
+        invariants={
+            ScopedName.from_string("__main__.f.loop"): Annotation(
+                sexpr=x <= 10, source=["x <= 10"]
+            )
+        },
+        storage_vars={ScopedName.from_string("__main__.balance"): 1},
+    )
+
+
+@pytest.mark.parametrize("sexpr_format", ["pretty", "compact"])
+def test_encode_horus_definition(sexpr_format):
+    """
+    Test that the encoder produces the same data as the schema.
+    """
+    definition = make_definition()
+    schema = HorusDefinitionSchema(context=dict(sexpr_format=sexpr_format))
+    assert encode_horus_definition(definition, sexpr_format) == schema.dump(definition)
+
+
+def test_decode_horus_definition():
+    """
+    Test that the decoder reads the encoded data back as the schema does.
+    """
+    data = encode_horus_definition(make_definition())
+    assert len(data["specifications"]["__main__.f"]["post"]["sexpr"]) > 1
+
+    decoded = decode_horus_definition(data)
+    assert encode_horus_definition(decoded) == data
+    loaded = HorusDefinitionSchema().load(data)
+    assert encode_horus_definition(decoded) == encode_horus_definition(loaded)
+    assert decoded.specifications.keys() == loaded.specifications.keys()
+    assert decoded.storage_vars == loaded.storage_vars
+
+    # Missing fields get their default values.
+    del data["invariants"]
+    del data["specifications"]["__main__.f"]["post"]
+    decoded = decode_horus_definition(data)
+    assert decoded.invariants == {}
+    assert z3.is_true(
+        decoded.specifications[ScopedName.from_string("__main__.f")].post.sexpr
+    )
+
+    with pytest.raises(ValidationError, match="Unknown fields"):
+        decode_horus_definition(dict(data, extra=1))
+
+
+def get_expressions(definition: HorusDefinition) -> list:
+    expressions = []
+    for annotations in definition.specifications.values():
+        expressions += [annotations.pre.sexpr, annotations.post.sexpr]
+        for updates in annotations.storage_update.values():
+            for update in updates:
+                expressions += update.arguments + [update.value]
+    for invariant in definition.invariants.values():
+        expressions.append(invariant.sexpr)
+    return expressions
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_load_horus_definition(lazy):
+    """
+    Test that the bulk loader reads the same expressions as the decoder,
+    including the ones using storage variables, which are declared from
+    the data.
+    """
+    data = encode_horus_definition(make_definition())
+    loaded = load_horus_definition(data, lazy=lazy)
+    assert encode_horus_definition(loaded) == data
+    expected = get_expressions(decode_horus_definition(data))
+    assert len(get_expressions(loaded)) == len(expected)
+    assert all(a.eq(b) for a, b in zip(get_expressions(loaded), expected))
+
+    with open(TESTS / "golden" / "toy_amm.gold") as f:
+        data = json.load(f)
+    loaded = load_horus_definition(data, lazy=lazy)
+    account_balance = ScopedName.from_string("__main__.account_balance")
+    annotations = loaded.specifications[
+        ScopedName.from_string("__main__.add_demo_token")
+    ]
+    update = annotations.storage_update[account_balance][0]
+    assert update.value.arg(0).decl().name() == str(account_balance)
+
+    data = encode_horus_definition(make_definition())
+    data["specifications"]["__main__.g"]["pre"]["sexpr"] = ["(+ ap 1)"]
+    with pytest.raises(ValidationError, match="as a formula"):
+        get_expressions(load_horus_definition(data, lazy=lazy))
+
+
+def test_load_horus_definition_lazily():
+    """
+    Test that the lazy loader parses the expressions of the entries which
+    are accessed only.
+    """
+    data = encode_horus_definition(make_definition())
+    data["specifications"]["__main__.g"]["pre"]["sexpr"] = ["(f"]
+    loaded = load_horus_definition(data, lazy=True)
+    assert isinstance(loaded.specifications, LazyDict)
+    assert len(loaded.specifications) == 2
+
+    f = ScopedName.from_string("__main__.f")
+    assert loaded.specifications[f] is loaded.specifications[f]
+    assert list(loaded.specifications.decoded) == [f]
+    with pytest.raises(ValidationError, match="Can't deserialize"):
+        loaded.specifications[ScopedName.from_string("__main__.g")]
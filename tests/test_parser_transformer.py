@@ -1,10 +1,16 @@
+import os
 from pathlib import Path
 
 import pytest
+from starkware.cairo.lang.compiler.ast.code_elements import CodeElementFunction
 from starkware.cairo.lang.compiler.ast.expr import ExprIdentifier
+from starkware.cairo.lang.compiler.ast.module import CairoFile
 from starkware.cairo.lang.compiler.parser_transformer import ParserError
 
-from horus.compiler.parser import parse
+from horus.compiler import profiling
+from horus.compiler.cache import CACHE_DIR_ENVVAR
+from horus.compiler.code_elements import AnnotatedCodeElement, CodeElementCheck
+from horus.compiler.parser import get_parser_cache_path, load_gram_parser, parse
 from horus.compiler.z3_transformer import Z3ExpressionTransformer
 
 TESTS = Path(__file__).parent
@@ -24,3 +30,71 @@ def test_z3_transformer_visit_expr_identifier():
     """Test `visit_ExprIdentifier()` on a trivial case for sake of coverage."""
     t = Z3ExpressionTransformer()
     t.visit_ExprIdentifier(ExprIdentifier(name=""))
+
+
+def test_parser_cache_round_trip(tmp_path, monkeypatch):
+    """
+    Test that the parser tables are written to the cache directory
+    and that a corrupted cache entry is rebuilt.
+    """
+    monkeypatch.setenv(CACHE_DIR_ENVVAR, str(tmp_path))
+    cache_path = get_parser_cache_path()
+    code = (TESTS / "golden" / "func_id.cairo").read_text()
+
+    built = load_gram_parser()
+    assert os.path.exists(cache_path)
+    loaded = load_gram_parser()
+    assert loaded.parse(code, start="cairo_file") == built.parse(
+        code, start="cairo_file"
+    )
+
+    with open(cache_path, "wb") as f:
+        f.write(b"garbage")
+    rebuilt = load_gram_parser()
+    assert rebuilt.parse(code, start="cairo_file") == built.parse(
+        code, start="cairo_file"
+    )
+    assert load_gram_parser().parse(code, start="cairo_file") == built.parse(
+        code, start="cairo_file"
+    )
+
+
+def test_parse_annotations_in_one_pass(monkeypatch):
+    """
+    Test that the annotations of a file are attached to their code elements,
+    that their locations are relative to the annotation and that their parse
+    time is reported to the profiler.
+    """
+    profiler = profiling.Profiler()
+    monkeypatch.setattr(profiling, "active_profiler", profiler)
+    code = "// @pre $x == 1\n// @post $x == 2\nfunc f() {\n    ret;\n}\n"
+    parsed = parse(
+        filename="a.cairo", code=code, code_type="cairo_file", expected_type=CairoFile
+    )
+    annotated = [elem.code_elm for elem in parsed.code_block.code_elements[:2]]
+    assert all(isinstance(elem, AnnotatedCodeElement) for elem in annotated)
+    checks = [elem.annotation for elem in annotated]
+    assert all(isinstance(check, CodeElementCheck) for check in checks)
+    assert [check.check_kind for check in checks] == [
+        CodeElementCheck.CheckKind.PRE_COND,
+        CodeElementCheck.CheckKind.POST_COND,
+    ]
+    assert [check.unpreprocessed_rep for check in checks] == ["$x == 1", "$x == 2"]
+    assert [check.location.input_file.content for check in checks] == [
+        "@pre $x == 1",
+        "@post $x == 2",
+    ]
+    assert [check.location.start_line for check in checks] == [1, 1]
+    function = parsed.code_block.code_elements[2].code_elm
+    assert isinstance(function, CodeElementFunction)
+    assert [event.name for event in profiler.events] == ["annotation parsing: a.cairo"]
+    assert profiler.counters == {"parsed annotations": 2}
+
+    with pytest.raises(ParserError) as err:
+        parse(
+            filename="b.cairo",
+            code="func f() {\n    ret;\n}\n// @post $x == \n",
+            code_type="cairo_file",
+            expected_type=CairoFile,
+        )
+    assert err.value.location.start_line == 1